@@ -0,0 +1,56 @@
+import argparse
+import json
+import sys
+
+MEASURED = ("seconds", "_us", "_per_second", "bytes")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare")
+    parser.add_argument("baseline", help="JSON results of the baseline run")
+    parser.add_argument("current", help="JSON results to compare")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative change reported as a regression (default %(default)s)",
+    )
+    parser.add_argument("--fail", action="store_true", help="exit 1 on regressions")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+    if baseline["meta"]["params"] != current["meta"]["params"]:
+        print("warning: the runs used different parameters", file=sys.stderr)
+    baseline, current = baseline["results"], current["results"]
+
+    regressions = 0
+    print(f"{'benchmark':<40} {'metric':<20} {'baseline':>14} {'current':>14} change")
+    for name, metrics in current.items():
+        for metric, value in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            if not metric.endswith(MEASURED) or not old:
+                continue
+            change = compare(metric, old, value)
+            regressed = change < -args.threshold
+            regressions += regressed
+            print(
+                f"{name:<40} {metric:<20} {old:>14.6g} {value:>14.6g} "
+                f"{change:+7.1%}{'  REGRESSION' if regressed else ''}"
+            )
+
+    return 1 if args.fail and regressions else 0
+
+
+def compare(metric: str, old: float, new: float) -> float:
+    # Positive is an improvement: throughput should grow, everything else
+    # (seconds, latency, bytes) should shrink.
+    if metric.endswith("_per_second"):
+        return new / old - 1
+    return old / new - 1 if new else 0.0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import struct
+
+import numpy as np
+
+COUNTRY_COUNT = 250
+
+# MMDB data section type numbers.
+_UTF8, _DOUBLE, _UINT16, _UINT32, _MAP = 2, 3, 5, 6, 7
+_UINT64, _ARRAY = 9, 11
+
+
+def generate_networks(
+    count: int, geo_count: int, seed: int = 0
+) -> tuple[np.ndarray, dict[int, tuple[str, str]]]:
+    # Disjoint CIDR blocks (/16 to /30, mostly small ones, like GeoLite City)
+    # as an (n, 3) uint32 array of start, end, geo id, sorted by start.
+    # Geo popularity is skewed, a few geos own most of the ranges.
+    rng = np.random.default_rng(seed)
+    sample = int(count * 1.6) + 16
+    prefixes = 30 - np.minimum(rng.geometric(0.35, sample) - 1, 14)
+    sizes = np.left_shift(np.uint64(1), (32 - prefixes).astype(np.uint64))
+    starts = rng.integers(0, 1 << 32, sample, dtype=np.uint64) & ~(sizes - np.uint64(1))
+    ends = starts + sizes - np.uint64(1)
+
+    order = np.argsort(starts, kind="stable")
+    starts, ends = starts[order], ends[order]
+    covered = np.maximum.accumulate(ends)
+    keep = np.ones(len(starts), dtype=bool)
+    keep[1:] = starts[1:] > covered[:-1]
+    starts, ends = starts[keep], ends[keep]
+    if len(starts) > count:
+        chosen = np.sort(rng.choice(len(starts), count, replace=False))
+        starts, ends = starts[chosen], ends[chosen]
+
+    geo_ids = (geo_count * rng.random(len(starts)) ** 3).astype(np.uint64)
+    networks = np.stack([starts, ends, geo_ids], axis=1).astype(np.uint32)
+    return networks, generate_mapping(geo_count, seed)
+
+
+def generate_mapping(geo_count: int, seed: int = 0) -> dict[int, tuple[str, str]]:
+    rng = np.random.default_rng(seed + 1)
+    countries = (COUNTRY_COUNT * rng.random(geo_count) ** 2).astype(int)
+    return {
+        geo_id: (f"Country {country:03d}", f"City {geo_id:05d}")
+        for geo_id, country in enumerate(countries.tolist())
+    }
+
+
+def to_triples(networks: np.ndarray) -> list[tuple[int, int, int]]:
+    return list(map(tuple, networks.tolist()))
+
+
+def sample_addresses(networks: np.ndarray, count: int, seed: int = 0) -> np.ndarray:
+    # Half inside known ranges, half uniform over the whole space.
+    rng = np.random.default_rng(seed + 2)
+    picked = networks[rng.integers(0, len(networks), count // 2)].astype(np.uint64)
+    inside = picked[:, 0] + rng.integers(0, 1 << 32, len(picked)) % (
+        picked[:, 1] - picked[:, 0] + 1
+    )
+    uniform = rng.integers(0, 1 << 32, count - len(picked), dtype=np.uint64)
+    addresses = np.concatenate([inside, uniform]).astype(np.uint32)
+    rng.shuffle(addresses)
+    return addresses
+
+
+def geo_record(geo_id: int, geo: tuple[str, str]) -> dict:
+    country, city = geo
+    return {
+        "city": {"names": {"en": city, "de": f"{city} (de)"}},
+        "country": {
+            "iso_code": f"{country[-3:]}",
+            "names": {"en": country, "de": f"{country} (de)"},
+        },
+        "location": {
+            "accuracy_radius": (_UINT16, 10 + geo_id % 500),
+            "latitude": (geo_id % 18000) / 100 - 90,
+            "longitude": (geo_id * 7 % 36000) / 100 - 180,
+        },
+    }
+
+
+def write_mmdb(
+    path: str, networks: np.ndarray, mapping: dict[int, tuple[str, str]]
+) -> int:
+    # A minimal IPv4 MaxMind DB writer: a binary search tree with 32-bit
+    # records and one data record per geo.
+    data = bytearray()
+    pointers = {}
+    empty = -1
+    left = [empty]
+    right = [empty]
+    children = (left, right)
+    for start, end, geo_id in networks.tolist():
+        if geo_id not in pointers:
+            pointers[geo_id] = len(data)
+            data += _encode(geo_record(geo_id, mapping[geo_id]))
+        leaf = -2 - pointers[geo_id]
+        depth = 32 - (end - start + 1).bit_length() + 1
+        node = 0
+        for bit_index in range(depth):
+            side = children[(start >> (31 - bit_index)) & 1]
+            if bit_index == depth - 1:
+                side[node] = leaf
+            else:
+                child = side[node]
+                if child < 0:
+                    child = side[node] = len(left)
+                    left.append(empty)
+                    right.append(empty)
+                node = child
+
+    node_count = len(left)
+    tree = np.empty((node_count, 2), dtype=">u4")
+    for i, side in enumerate(children):
+        values = np.array(side, dtype=np.int64)
+        values = np.where(values == empty, node_count, values)
+        values = np.where(values < -1, node_count + 16 + (-2 - values), values)
+        tree[:, i] = values
+
+    metadata = {
+        "binary_format_major_version": (_UINT16, 2),
+        "binary_format_minor_version": (_UINT16, 0),
+        "build_epoch": (_UINT64, 1),
+        "database_type": "cdb-benchmark",
+        "description": {"en": "Synthetic benchmark data"},
+        "ip_version": (_UINT16, 4),
+        "languages": ["de", "en"],
+        "node_count": (_UINT32, node_count),
+        "record_size": (_UINT16, 32),
+    }
+    with open(path, "wb") as file:
+        file.write(tree.tobytes())
+        file.write(b"\0" * 16)
+        file.write(data)
+        file.write(b"\xab\xcd\xefMaxMind.com")
+        file.write(_encode(metadata))
+    return node_count
+
+
+def _encode(value) -> bytes:
+    if isinstance(value, dict):
+        body = b"".join(_encode(k) + _encode(v) for k, v in value.items())
+        return _control(_MAP, len(value)) + body
+    if isinstance(value, list):
+        return _control(_ARRAY, len(value)) + b"".join(map(_encode, value))
+    if isinstance(value, str):
+        encoded = value.encode()
+        return _control(_UTF8, len(encoded)) + encoded
+    if isinstance(value, float):
+        return _control(_DOUBLE, 8) + struct.pack(">d", value)
+    kind, number = value
+    body = number.to_bytes(max(1, (number.bit_length() + 7) // 8), "big")
+    return _control(kind, len(body)) + body
+
+
+def _control(kind: int, size: int) -> bytes:
+    if size < 29:
+        prefix, extra = size, b""
+    elif size < 29 + 256:
+        prefix, extra = 29, bytes([size - 29])
+    else:
+        prefix, extra = 30, (size - 285).to_bytes(2, "big")
+
+    if kind <= 7:
+        return bytes([kind << 5 | prefix]) + extra
+    return bytes([prefix, kind - 7]) + extra
@@ -0,0 +1,453 @@
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from datetime import datetime, timezone
+
+import numpy as np
+
+from cdb import (
+    FORMAT_VERSION,
+    LEGACY_VERSION,
+    CdbReader,
+    VALIDATION_MODES,
+    CdbWriter,
+    GeoIndex,
+    merge_cdbs,
+    merge_cdbs_and_save,
+    mmdb_file_to_cdb,
+    read_cdb,
+    read_cdb_arrays,
+    search_geo,
+    search_geo_batch,
+    validate_cdb,
+    write_cdb,
+)
+
+from .datasets import (
+    generate_networks,
+    sample_addresses,
+    to_triples,
+    write_mmdb,
+)
+
+RESULTS_VERSION = 1
+GROUPS = ("convert", "write", "load", "lookup", "batch", "merge", "validate")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run")
+    parser.add_argument("--ranges", type=int, default=2_000_000)
+    parser.add_argument("--geos", type=int, default=50_000)
+    parser.add_argument(
+        "--mmdb-ranges",
+        type=int,
+        default=250_000,
+        help="size of the MMDB converted by the convert group",
+    )
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--batch", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help=f"comma separated groups of {GROUPS}")
+    parser.add_argument("--tmp-dir", help="directory for the generated files")
+    parser.add_argument("-o", "--output", default="-", help="JSON output path")
+    args = parser.parse_args(argv)
+
+    groups = GROUPS if args.only is None else tuple(args.only.split(","))
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown groups {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory(dir=args.tmp_dir) as tmp_dir:
+        results = run(args, groups, tmp_dir)
+
+    report = {
+        "version": RESULTS_VERSION,
+        "meta": _meta(args),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    return 0
+
+
+def run(args: argparse.Namespace, groups: tuple[str, ...], tmp_dir: str) -> dict:
+    results = {}
+
+    def record(name: str, metrics: dict):
+        results[name] = metrics
+        print(f"{name}: {metrics}", file=sys.stderr, flush=True)
+
+    start = time.perf_counter()
+    networks, mapping = generate_networks(args.ranges, args.geos, args.seed)
+    base_path = os.path.join(tmp_dir, "base.cdb")
+    with CdbWriter(base_path, tmp_dir=tmp_dir) as writer:
+        writer.add_array(networks)
+        writer.finish(mapping)
+    record(
+        "generate",
+        {"seconds": time.perf_counter() - start, "ranges": len(networks)},
+    )
+    compressed_path = os.path.join(tmp_dir, "compressed.cdb")
+    if {"load", "lookup"} & set(groups):
+        with CdbWriter(compressed_path, tmp_dir=tmp_dir, compress=True) as writer:
+            writer.add_array(networks)
+            writer.finish(mapping)
+
+    if "convert" in groups:
+        mmdb_networks, mmdb_mapping = generate_networks(
+            args.mmdb_ranges, args.geos, args.seed
+        )
+        mmdb_path = os.path.join(tmp_dir, "base.mmdb")
+        write_mmdb(mmdb_path, mmdb_networks, mmdb_mapping)
+        output_path = os.path.join(tmp_dir, "converted.cdb")
+        for workers in sorted({1, args.workers}):
+            seconds = _isolated_best(
+                args.repeat, _time_convert, mmdb_path, output_path, workers
+            )
+            record(
+                f"convert.workers_{workers}",
+                {
+                    "seconds": seconds,
+                    "ranges_per_second": len(mmdb_networks) / seconds,
+                    "mmdb_bytes": os.path.getsize(mmdb_path),
+                    "bytes": os.path.getsize(output_path),
+                },
+            )
+
+    if "write" in groups:
+        for name in (
+            "write_cdb",
+            "write_cdb_array",
+            "write_cdb_legacy",
+            "writer",
+            "writer_compressed",
+        ):
+            path = os.path.join(tmp_dir, f"{name}.cdb")
+            seconds = _isolated_best(
+                args.repeat, _time_write, name, networks, mapping, path
+            )
+            record(
+                f"write.{name}",
+                {
+                    "seconds": seconds,
+                    "ranges_per_second": len(networks) / seconds,
+                    "bytes": os.path.getsize(path),
+                },
+            )
+            os.unlink(path)
+
+    if "load" in groups:
+        for name in LOADERS:
+            runs = [
+                _isolated(_measure_load, name, base_path) for _ in range(args.repeat)
+            ]
+            record(
+                f"load.{name}",
+                {
+                    "seconds": min(seconds for seconds, _ in runs),
+                    "rss_bytes": min(rss for _, rss in runs),
+                },
+            )
+        runs = [
+            _isolated(_measure_load, "reader", compressed_path)
+            for _ in range(args.repeat)
+        ]
+        record(
+            "load.reader_compressed",
+            {
+                "seconds": min(seconds for seconds, _ in runs),
+                "rss_bytes": min(rss for _, rss in runs),
+                "bytes": os.path.getsize(compressed_path),
+            },
+        )
+
+    if "lookup" in groups:
+        values = sample_addresses(networks, args.lookups, args.seed).tolist()
+        for name in INDEXES:
+            record(
+                f"lookup.{name}",
+                _isolated(_measure_lookups, name, base_path, values),
+            )
+        strings = [_format_ip(value) for value in values]
+        record(
+            "lookup.reader_str",
+            _isolated(_measure_lookups, "reader", base_path, strings),
+        )
+        record(
+            "lookup.reader_compressed",
+            _isolated(_measure_lookups, "reader", compressed_path, values),
+        )
+
+    if "batch" in groups:
+        addresses = sample_addresses(networks, args.batch, args.seed + 1)
+        for name, index, geo_ids, as_strings in (
+            ("geo_index", "geo_index", False, False),
+            ("reader", "reader", False, False),
+            ("reader_ids", "reader", True, False),
+            ("reader_str", "reader", False, True),
+        ):
+            seconds = _isolated(
+                _measure_batch,
+                index,
+                base_path,
+                addresses,
+                geo_ids,
+                as_strings,
+                args.repeat,
+            )
+            record(
+                f"batch.{name}",
+                {"seconds": seconds, "addresses_per_second": len(addresses) / seconds},
+            )
+
+    if "merge" in groups:
+        overlay, overlay_mapping = generate_networks(
+            max(1, args.ranges // 10), args.geos, args.seed + 1
+        )
+        overlay_path = os.path.join(tmp_dir, "overlay.cdb")
+        output_path = os.path.join(tmp_dir, "merged.cdb")
+        with CdbWriter(overlay_path, tmp_dir=tmp_dir) as writer:
+            writer.add_array(overlay)
+            writer.finish(overlay_mapping)
+
+        inputs = len(networks) + len(overlay)
+        for name in ("merge_cdbs_and_save", "merge_cdbs"):
+            seconds = _isolated_best(
+                args.repeat, _time_merge, name, output_path, overlay_path, base_path
+            )
+            metrics = {"seconds": seconds, "ranges_per_second": inputs / seconds}
+            if name == "merge_cdbs_and_save":
+                metrics["bytes"] = os.path.getsize(output_path)
+            record(f"merge.{name}", metrics)
+
+    if "validate" in groups:
+        size = os.path.getsize(base_path)
+        for mode in VALIDATION_MODES:
+            seconds = _isolated_best(args.repeat, _time_validate, base_path, mode)
+            record(
+                f"validate.{mode}",
+                {"seconds": seconds, "bytes_per_second": size / seconds},
+            )
+
+    return results
+
+
+def _time_convert(mmdb_path: str, output_path: str, workers: int) -> float:
+    start = time.perf_counter()
+    mmdb_file_to_cdb(mmdb_path, output_path, workers)
+    return time.perf_counter() - start
+
+
+def _time_write(
+    name: str, networks: np.ndarray, mapping: dict[int, tuple[str, str]], path: str
+) -> float:
+    if name in ("writer", "writer_compressed"):
+        start = time.perf_counter()
+        with CdbWriter(
+            path, tmp_dir=os.path.dirname(path), compress=name == "writer_compressed"
+        ) as writer:
+            writer.add_array(networks)
+            writer.finish(mapping)
+        return time.perf_counter() - start
+
+    if name == "write_cdb_array":
+        start = time.perf_counter()
+        write_cdb(networks, mapping, path)
+        return time.perf_counter() - start
+
+    triples = to_triples(networks)
+    version = LEGACY_VERSION if name == "write_cdb_legacy" else FORMAT_VERSION
+    start = time.perf_counter()
+    write_cdb(triples, mapping, path, version)
+    return time.perf_counter() - start
+
+
+def _time_merge(name: str, output_path: str, *paths: str) -> float:
+    start = time.perf_counter()
+    if name == "merge_cdbs":
+        merge_cdbs(*paths)
+    else:
+        merge_cdbs_and_save(output_path, *paths)
+    return time.perf_counter() - start
+
+
+def _time_validate(path: str, mode: str) -> float:
+    start = time.perf_counter()
+    validate_cdb(path, mode)
+    return time.perf_counter() - start
+
+
+def _open_reader(path: str, jump_table: bool = False) -> CdbReader:
+    reader = CdbReader(path, jump_table)
+    reader.mapping
+    return reader
+
+
+LOADERS = {
+    "read_cdb": read_cdb,
+    "read_cdb_arrays": read_cdb_arrays,
+    "geo_index": GeoIndex.from_cdb,
+    "reader": _open_reader,
+    "reader_jump_table": lambda path: _open_reader(path, jump_table=True),
+}
+
+INDEXES = {
+    "geo_index": GeoIndex.from_cdb,
+    "geo_index_jump_table": lambda path: GeoIndex.from_cdb(path, jump_table=True),
+    "reader": _open_reader,
+    "reader_jump_table": lambda path: _open_reader(path, jump_table=True),
+}
+
+
+def _measure_load(name: str, path: str) -> tuple[float, int]:
+    gc.collect()
+    before = _rss()
+    start = time.perf_counter()
+    loaded = LOADERS[name](path)
+    seconds = time.perf_counter() - start
+    rss = _rss() - before
+    del loaded
+    return seconds, rss
+
+
+def _measure_lookups(name: str, path: str, values: list) -> dict:
+    index = INDEXES[name](path)
+    for value in values[:1000]:
+        search_geo(index, value)
+
+    timings = np.empty(len(values), dtype=np.int64)
+    clock = time.perf_counter_ns
+    for i, value in enumerate(values):
+        start = clock()
+        search_geo(index, value)
+        timings[i] = clock() - start
+
+    p50, p90, p99 = (np.percentile(timings, [50, 90, 99]) / 1000).tolist()
+    return {
+        "p50_us": p50,
+        "p90_us": p90,
+        "p99_us": p99,
+        "mean_us": float(timings.mean()) / 1000,
+        "lookups_per_second": len(values) / (float(timings.sum()) / 1e9),
+    }
+
+
+def _measure_batch(
+    name: str,
+    path: str,
+    addresses: np.ndarray,
+    geo_ids: bool,
+    as_strings: bool,
+    repeat: int,
+) -> float:
+    index = INDEXES[name](path)
+    ips = (
+        [_format_ip(value) for value in addresses.tolist()] if as_strings else addresses
+    )
+    search_geo_batch(index, ips[:1000], geo_ids=geo_ids)
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        search_geo_batch(index, ips, geo_ids=geo_ids)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _format_ip(value: int) -> str:
+    return f"{value >> 24}.{value >> 16 & 255}.{value >> 8 & 255}.{value & 255}"
+
+
+def _isolated(function, *args):
+    # Each measurement runs in a fresh child process, so memory and caches
+    # left by one benchmark do not skew the next one.
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run_child, args=(sender, function, args))
+    process.start()
+    sender.close()
+    try:
+        ok, value = receiver.recv()
+    except EOFError:
+        ok, value = False, f"exit code {process.exitcode}"
+    finally:
+        receiver.close()
+        process.join()
+    if not ok:
+        raise RuntimeError(f"Benchmark {function.__name__} failed: {value}")
+    return value
+
+
+def _run_child(sender, function, args):
+    try:
+        sender.send((True, function(*args)))
+    except Exception:
+        sender.send((False, traceback.format_exc()))
+    finally:
+        sender.close()
+
+
+def _isolated_best(repeat: int, function, *args) -> float:
+    return min(_isolated(function, *args) for _ in range(repeat))
+
+
+def _rss() -> int:
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == "darwin" else usage * 1024
+
+
+def _meta(args: argparse.Namespace) -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "params": {
+            "ranges": args.ranges,
+            "geos": args.geos,
+            "mmdb_ranges": args.mmdb_ranges,
+            "lookups": args.lookups,
+            "batch": args.batch,
+            "repeat": args.repeat,
+            "workers": args.workers,
+            "seed": args.seed,
+        },
+    }
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1 +1,18 @@
 from .cdb import *
+from .cache import LookupCache
+from .reader import CdbReader
+from .database import CdbDatabase
+from .aio import lookup_many_async, open_cdb_async, open_database_async
+from .server import CdbClient, serve
+from .metrics import Metrics, disable_metrics, enable_metrics, get_metrics
+from .overlay import LayeredCdb, fold_overlays, write_overlay
+from .validation import (
+    DEFAULT_SAMPLES,
+    VALIDATE_FULL,
+    VALIDATE_HEADER,
+    VALIDATE_SAMPLED,
+    VALIDATION_MODES,
+    validate_buffer,
+    validate_cdb,
+)
+from .shared import SHARED_DIR, SharedCdb, SharedCdbReader
@@ -0,0 +1,70 @@
+import asyncio
+from concurrent.futures import Executor
+from functools import partial
+
+import numpy as np
+
+from .cdb import GeoIndex, search_geo_batch
+from .database import CdbDatabase, _open_reader
+from .reader import CdbReader
+
+INLINE_LOOKUP_SIZE = 256
+_MAX_ADDRESS_LENGTH = len("ffff:ffff:ffff:ffff:ffff:ffff:255.255.255.255 ")
+# Marks the bytes that are not ASCII whitespace as str.split() sees it.
+_NOT_WHITESPACE = np.ones(256, dtype=bool)
+_NOT_WHITESPACE[list(b" \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f")] = False
+
+
+async def open_cdb_async(
+    filepath: str, jump_table: bool = False, executor: Executor | None = None
+) -> CdbReader:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, _open_reader, filepath, jump_table)
+
+
+async def open_database_async(
+    filepath: str,
+    interval: float | None = 1.0,
+    jump_table: bool = False,
+    executor: Executor | None = None,
+) -> CdbDatabase:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, partial(CdbDatabase, filepath, interval, jump_table)
+    )
+
+
+async def lookup_many_async(
+    index: CdbReader | CdbDatabase | GeoIndex | list[tuple[int, int, int]],
+    ips: list[str] | list[int] | bytes | np.ndarray,
+    mapping: dict[int, tuple[str, str]] | None = None,
+    geo_ids: bool = False,
+    executor: Executor | None = None,
+    inline_size: int = INLINE_LOOKUP_SIZE,
+) -> list[tuple[str, str]] | np.ndarray:
+    # Small batches finish faster than a round trip through the executor,
+    # so they run on the event loop. Raw triples always go to the executor,
+    # which builds the index for them.
+    if hasattr(index, "lookup_ids") and not _exceeds(ips, inline_size):
+        return search_geo_batch(index, ips, mapping, geo_ids)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, partial(search_geo_batch, index, ips, mapping, geo_ids)
+    )
+
+
+def _exceeds(ips: list[str] | list[int] | bytes | np.ndarray, size: int) -> bool:
+    # Packed addresses are counted as whitespace separated words without
+    # parsing them, and a large batch is told apart by its first bytes.
+    if not isinstance(ips, (bytes, bytearray, memoryview)):
+        return len(ips) > size
+    head = memoryview(ips)[: (size + 1) * _MAX_ADDRESS_LENGTH]
+    if _word_count(head) > size:
+        return True
+    return len(head) < len(ips) and _word_count(ips) > size
+
+
+def _word_count(data: bytes | memoryview) -> int:
+    words = _NOT_WHITESPACE[np.frombuffer(data, dtype=np.uint8)]
+    return int(np.count_nonzero(words[1:] & ~words[:-1]) + words[:1].sum())
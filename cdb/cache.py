@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+
+from . import metrics
+from .cdb import GeoIndex, _recorded_lookup, _resolved_lookup
+
+
+class LookupCache:
+    def __init__(self, source: GeoIndex, maxsize: int = 65536):
+        if maxsize <= 0:
+            raise ValueError("Cache size must be positive")
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._source = source
+        self._generation = getattr(source, "generation", 0)
+
+    @property
+    def source(self) -> GeoIndex:
+        return self._source
+
+    @source.setter
+    def source(self, source: GeoIndex):
+        with self._lock:
+            self._source = source
+            self._generation = getattr(source, "generation", 0)
+            self._entries.clear()
+
+    @property
+    def mapping(self) -> dict[int, tuple[str, str]]:
+        return self._source.mapping
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup_id(self, value: int) -> int | None:
+        return self._resolve_id(value)[0]
+
+    def _resolve_id(self, value: int) -> tuple[int | None, GeoIndex]:
+        # A source that reloads is pinned to one version, whose generation
+        # the entries are kept for and whose geo table the id is mapped by.
+        source = self._source
+        snapshot = getattr(source, "snapshot", None)
+        if snapshot is not None:
+            version, generation = snapshot()
+        else:
+            version, generation = source, getattr(source, "generation", 0)
+        with self._lock:
+            if generation != self._generation or source is not self._source:
+                self._entries.clear()
+                self._source, self._generation = source, generation
+            elif value in self._entries:
+                self._entries.move_to_end(value)
+                self.hits += 1
+                geo_id = self._entries[value]
+                recorder = metrics.active
+                if recorder is not None:
+                    recorder.inc("cache_hits_total")
+                return geo_id, version
+            self.misses += 1
+        recorder = metrics.active
+        if recorder is not None:
+            recorder.inc("cache_misses_total")
+
+        geo_id = version.lookup_id(value)
+
+        with self._lock:
+            if source is self._source and generation == self._generation:
+                self._entries[value] = geo_id
+                if len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return geo_id, version
+
+    def lookup(self, ip: str | int) -> tuple[str, str]:
+        recorder = metrics.active
+        if recorder is not None:
+            return _recorded_lookup(recorder, _resolved_lookup, self._resolve_id, ip)
+        return _resolved_lookup(self._resolve_id, ip)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / requests if requests else 0.0,
+            }
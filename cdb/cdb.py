@@ -1,67 +1,698 @@
+import heapq
+import io
+import math
 import os
 import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
 import maxminddb
-from ipaddress import IPv4Address, IPv4Network
+import numpy as np
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from functools import partial
+from itertools import accumulate, chain
+from ipaddress import IPv4Network, IPv6Network, ip_network
+from operator import index, itemgetter
+from socket import AF_INET, AF_INET6, inet_pton
+from typing import BinaryIO
+
+from . import metrics
+
+MAGIC = b"\x89CDB\r\n\x1a\n"
+LEGACY_VERSION = 1
+FORMAT_VERSION = 2
+
+FLAG_SORTED = 1
+FLAG_OVERLAY = 2
+FLAG_COMPRESSED = 4
+
+SECTION_STARTS = b"STA4"
+SECTION_ENDS = b"END4"
+SECTION_GEO_IDS = b"GID4"
+SECTION_STARTS6 = b"STA6"
+SECTION_ENDS6 = b"END6"
+SECTION_GEO_IDS6 = b"GID6"
+SECTION_GEOS = b"GEOS"
+SECTION_STRINGS = b"STRS"
+SECTION_JUMP = b"JMP4"
+SECTION_FIELDS = b"FLDS"
+SECTION_RECORDS = b"RECS"
+SECTION_CHECKSUMS = b"SUMS"
+# Compressed files keep IPv4 ranges in blocks instead of STA4/END4/GID4.
+SECTION_BLOCK_STARTS = b"BST4"
+SECTION_BLOCK_OFFSETS = b"BOF4"
+SECTION_BLOCKS = b"BLKS"
+SECTION_ALIGNMENT = 8
+
+JUMP_BITS = 16
+
+BLOCK_SIZE = 32
+BLOCK_CACHE_SIZE = 1024
+
+MMDB_PARTITION_BITS = 8
+
+MERGE_FIRST = "first"
+MERGE_LAST = "last"
+MERGE_MOST_SPECIFIC = "most_specific"
+MERGE_POLICIES = (MERGE_FIRST, MERGE_LAST, MERGE_MOST_SPECIFIC)
+
+DEFAULT_LANGUAGE = "en"
+
+UNKNOWN_GEO = ("Unknown", "Unknown")
+UNKNOWN_GEO_ID = -1
+# Geo id of deleted ranges in overlay files.
+DELETED_GEO_ID = (1 << 32) - 1
+
+IPV4_MAX = (1 << 32) - 1
+IPV6_MAX = (1 << 128) - 1
+
+_HEADER = struct.Struct("<8sHHIQQ")
+_SECTION = struct.Struct("<4sQQ")
+# CRC32 of the header and directory, then of each section in directory order.
+_CHECKSUM = struct.Struct("<4sI")
+_HEADER_CHECKSUM = b"HEAD"
 
 
 def read_mmdb(
     file_path: str,
-) -> list[tuple[str | IPv4Network, dict[str, dict[str, dict[str, str]]]]]:
+) -> list[tuple[str | IPv4Network | IPv6Network, dict[str, dict[str, dict[str, str]]]]]:
+    return list(iter_mmdb(file_path))
+
+
+def iter_mmdb(
+    file_path: str,
+) -> Iterator[
+    tuple[str | IPv4Network | IPv6Network, dict[str, dict[str, dict[str, str]]]]
+]:
     with maxminddb.open_database(file_path) as reader:
-        return list(reader)
+        yield from reader
+
+
+def ip_to_int(ip: str) -> int:
+    return _unmap_ipv4(_address_value(ip))
+
 
+def _address_value(ip: str) -> int:
+    try:
+        if ":" in ip:
+            return int.from_bytes(inet_pton(AF_INET6, ip), "big")
+        return int.from_bytes(inet_pton(AF_INET, ip), "big")
+    except OSError:
+        raise ValueError(
+            f"{ip!r} does not appear to be an IPv4 or IPv6 address"
+        ) from None
 
-def cidr_to_int(cidr: str, with_broadcast: bool = True) -> int | tuple[int, int]:
-    network = IPv4Network(cidr, strict=False)
 
-    if with_broadcast:
-        return int(IPv4Address(network.network_address)), int(
-            IPv4Address(network.broadcast_address)
+def _unmap_ipv4(value: int) -> int:
+    # IPv4-mapped addresses (::ffff:0:0/96) share the IPv4 part of the key
+    # space, as do IPv4-compatible ones (::/96) by construction.
+    return value & IPV4_MAX if value >> 32 == 0xFFFF else value
+
+
+def ips_to_uint32(ips: list[str] | list[bytes] | bytes) -> np.ndarray:
+    if isinstance(ips, (bytes, bytearray, memoryview)):
+        ips = str(ips, "ascii").split()
+    elif len(ips) and isinstance(ips[0], bytes):
+        ips = [str(ip, "ascii") for ip in ips]
+
+    try:
+        packed = b"".join(map(partial(inet_pton, AF_INET), ips))
+    except (OSError, TypeError):
+        return np.fromiter(
+            (
+                ip if isinstance(ip, int) else cidr_to_int(ip, with_broadcast=False)
+                for ip in ips
+            ),
+            dtype=np.uint32,
+            count=len(ips),
         )
-    else:
-        return int(IPv4Address(network.network_address))
+    return np.frombuffer(packed, dtype=">u4").astype(np.uint32)
+
+
+def _parse_cidr(cidr: str) -> tuple[int, int]:
+    address, slash, prefix = cidr.partition("/")
+    if not slash:
+        value = ip_to_int(address)
+        return value, value
+    value = _address_value(address)
+    bits = 128 if ":" in address else 32
+    if not (prefix.isascii() and prefix.isdigit()) or int(prefix) > bits:
+        raise ValueError(f"Invalid prefix length in {cidr!r}")
+
+    host_bits = bits - int(prefix)
+    start = value >> host_bits << host_bits
+    return _unmap_range(start, start | ((1 << host_bits) - 1))
+
+
+def _unmap_range(start: int, end: int) -> tuple[int, int]:
+    if start >> 32 == 0xFFFF and end >> 32 == 0xFFFF:
+        return start & IPV4_MAX, end & IPV4_MAX
+    return start, end
+
+
+def cidr_to_int(
+    cidr: str | IPv4Network | IPv6Network, with_broadcast: bool = True
+) -> int | tuple[int, int]:
+    if isinstance(cidr, str):
+        try:
+            start, end = _parse_cidr(cidr)
+            return (start, end) if with_broadcast else start
+        except ValueError:
+            pass
+
+    network = (
+        cidr
+        if isinstance(cidr, (IPv4Network, IPv6Network))
+        else ip_network(cidr, strict=False)
+    )
+    start, end = _unmap_range(
+        int(network.network_address), int(network.broadcast_address)
+    )
+    return (start, end) if with_broadcast else start
+
+
+def mmdb_file_to_cdb(
+    mmdb_path: str,
+    cdb_path: str,
+    workers: int = 1,
+    compact: bool = False,
+    jump_table: bool = False,
+    fields: Sequence[str] = (),
+    language: str = DEFAULT_LANGUAGE,
+    compress: bool = False,
+) -> int:
+    records = GeoRecords(fields) if fields else None
+    mapping = {}
+    with CdbWriter(
+        cdb_path, compact=compact, jump_table=jump_table, compress=compress
+    ) as writer:
+        if workers > 1:
+            for ranges, geos in _convert_mmdb_parallel(
+                mmdb_path, workers, fields=tuple(fields), language=language
+            ):
+                # NaN is not equal to itself, so geos only match as keys when
+                # they hold the same NaN object, which pickling does not keep.
+                remap = np.fromiter(
+                    (
+                        mapping.setdefault(_canonical_nan(geo), len(mapping))
+                        for geo in geos
+                    ),
+                    dtype=ranges.dtype,
+                    count=len(geos),
+                )
+                ranges[:, -1] = remap[ranges[:, -1]]
+                writer.add_array(ranges)
+        else:
+            writer.extend(
+                iter_mmdb_ranges(iter_mmdb(mmdb_path), mapping, fields, language)
+            )
+        if records is not None:
+            records.rows.update((v, k[2:]) for k, v in mapping.items())
+        writer.finish({v: k[:2] for k, v in mapping.items()}, records)
+    return writer.removed
+
+
+def _canonical_nan(geo: tuple) -> tuple:
+    return tuple(math.nan if value != value else value for value in geo)
+
+
+def _convert_mmdb_parallel(
+    mmdb_path: str,
+    workers: int,
+    prefix_bits: int = MMDB_PARTITION_BITS,
+    fields: tuple[str, ...] = (),
+    language: str = DEFAULT_LANGUAGE,
+) -> Iterator[tuple[np.ndarray, list[tuple]]]:
+    with maxminddb.open_database(mmdb_path) as reader:
+        families = [32, 128] if reader.metadata().ip_version == 6 else [32]
+    bit_counts = [bits for bits in families for _ in range(1 << prefix_bits)]
+
+    with ProcessPoolExecutor(
+        workers, initializer=_open_worker_mmdb, initargs=(mmdb_path,)
+    ) as executor:
+        results = executor.map(
+            partial(
+                _convert_mmdb_partition,
+                prefix_bits=prefix_bits,
+                fields=fields,
+                language=language,
+            ),
+            [prefix for _ in families for prefix in range(1 << prefix_bits)],
+            bit_counts,
+            chunksize=max(1, len(bit_counts) // (workers * 4)),
+        )
+        for bit_count, (data, geos) in zip(bit_counts, results):
+            if bit_count == 32:
+                ranges = np.frombuffer(data, dtype=np.uint32).reshape(-1, 3)
+            else:
+                ranges = np.frombuffer(data, dtype=np.uint64).reshape(-1, 5)
+            yield ranges.copy(), geos
+
+
+_worker_mmdb = None
+
+
+def _open_worker_mmdb(mmdb_path: str):
+    global _worker_mmdb
+    _worker_mmdb = maxminddb.open_database(mmdb_path, maxminddb.MODE_MMAP)
 
 
-def mmdb_file_to_cdb(mmdb_path: str, cdb_path: str):
-    mmdb_data = read_mmdb(mmdb_path)
-    cdb_data, mapping = mmdb_to_cdb(mmdb_data)
-    write_cdb(cdb_data, mapping, cdb_path)
+def _convert_mmdb_partition(
+    prefix: int,
+    bit_count: int,
+    prefix_bits: int,
+    fields: tuple[str, ...] = (),
+    language: str = DEFAULT_LANGUAGE,
+) -> tuple[bytes, list[tuple]]:
+    # IPv4 partitions produce (start, end, geo) uint32 rows, IPv6 ones
+    # (start_high, start_low, end_high, end_low, geo) uint64 rows.
+    ranges = array("I" if bit_count == 32 else "Q")
+    geos = {}
+    geo_ids = {}
+    for start, end, pointer in _walk_mmdb(_worker_mmdb, prefix, prefix_bits, bit_count):
+        if bit_count == 128:
+            if end <= IPV4_MAX:
+                continue
+            start = max(start, IPV4_MAX + 1)
+
+        if pointer not in geo_ids:
+            data = _worker_mmdb._resolve_data_pointer(pointer)
+            geo = extract_geo(data, language)
+            if fields:
+                geo += extract_fields(data, fields, language)
+            geo_ids[pointer] = geos.setdefault(geo, len(geos))
+
+        if bit_count == 32:
+            ranges.extend((start, end, geo_ids[pointer]))
+        else:
+            ranges.extend(
+                (*divmod(start, 1 << 64), *divmod(end, 1 << 64), geo_ids[pointer])
+            )
+    return ranges.tobytes(), list(geos)
+
+
+def _walk_mmdb(
+    reader: "maxminddb.Reader", prefix: int, prefix_bits: int, bit_count: int = 32
+) -> Iterator[tuple[int, int, int]]:
+    # The public reader API cannot iterate a subtree, so this walks the
+    # search tree of the pure Python reader directly, in address order.
+    # IPv6 walks skip the IPv4 subtree and its aliases, which the IPv4
+    # partitions cover.
+    node_count = reader.metadata().node_count
+    ipv4_start = reader._start_node(32) if bit_count == 128 else None
+    node = reader._start_node(bit_count)
+    depth = 0
+    while depth < prefix_bits and node < node_count:
+        node = reader._read_node(node, (prefix >> (prefix_bits - depth - 1)) & 1)
+        depth += 1
+
+    if node > node_count:
+        # The partition lies inside a larger network, which is emitted whole
+        # by the partition where that network starts.
+        if prefix & ((1 << (prefix_bits - depth)) - 1) == 0:
+            start = prefix << (bit_count - prefix_bits)
+            yield start, start | ((1 << (bit_count - depth)) - 1), node
+        return
+
+    stack = [(node, depth, prefix)] if node < node_count else []
+    while stack:
+        node, depth, acc = stack.pop()
+        if node == ipv4_start and (acc or node < node_count):
+            continue
+        if node > node_count:
+            start = acc << (bit_count - depth)
+            yield start, start | ((1 << (bit_count - depth)) - 1), node
+        elif node < node_count:
+            stack.append((reader._read_node(node, 1), depth + 1, acc << 1 | 1))
+            stack.append((reader._read_node(node, 0), depth + 1, acc << 1))
 
 
 def mmdb_to_cdb(
-    ips: list[str | IPv4Network, dict[str, dict[str, dict[str, str]]]],
+    ips: list[str | IPv4Network | IPv6Network, dict[str, dict[str, dict[str, str]]]],
     mapping: dict[tuple[str, str], int] = None,
+    language: str = DEFAULT_LANGUAGE,
 ) -> tuple[list[tuple[int, int, int]], dict[int, tuple[str, str]]]:
-    prepared = []
     mapping = mapping or {}
+    prepared = list(iter_mmdb_ranges(ips, mapping, language=language))
+
+    return prepared, {v: k for k, v in mapping.items()}
+
 
+def iter_mmdb_ranges(
+    ips: Iterable[
+        tuple[str | IPv4Network | IPv6Network, dict[str, dict[str, dict[str, str]]]]
+    ],
+    mapping: dict[tuple[str, str], int],
+    fields: Sequence[str] = (),
+    language: str = DEFAULT_LANGUAGE,
+) -> Iterator[tuple[int, int, int]]:
+    # With fields the mapping keys are (country, city, *field values).
     for ip, data in ips:
-        geo = (
-            list(data.get("country", {}).get("names", {}).values())[0],
-            list(data.get("city", {}).get("names", {}).values())[0],
-        )
+        geo = extract_geo(data, language)
+        if fields:
+            geo += extract_fields(data, fields, language)
 
         if geo in mapping:
-            geo_code = mapping.get(geo)
+            geo_code = mapping[geo]
         else:
             geo_code = len(mapping)
             mapping[geo] = geo_code
-        prepared.append(
-            (
-                *cidr_to_int(ip),
-                geo_code,
-            )
-        )
 
-    return prepared, {v: k for k, v in mapping.items()}
+        yield (*cidr_to_int(ip), geo_code)
+
+
+def extract_geo(
+    data: dict[str, dict[str, dict[str, str]]], language: str = DEFAULT_LANGUAGE
+) -> tuple[str, str]:
+    return (
+        _localized_name(data.get("country", {}), language),
+        _localized_name(data.get("city", {}), language),
+    )
+
+
+def extract_fields(
+    data: dict, fields: Sequence[str], language: str = DEFAULT_LANGUAGE
+) -> tuple:
+    return tuple(GEO_FIELDS[field][1](data, language) for field in fields)
+
+
+def _localized_name(value: dict[str, dict[str, str]], language: str) -> str:
+    names = value.get("names", {})
+    if language in names:
+        return names[language]
+    return next(iter(names.values()), "")
+
+
+def _subdivision(data: dict) -> dict:
+    return next(iter(data.get("subdivisions", ())), {})
+
+
+# Field name -> (typecode, extractor). Strings ("s") are stored as offsets
+# into the string pool, numbers as fixed-width array typecodes; missing
+# values become "", 0 or NaN.
+GEO_FIELDS = {
+    "continent_code": ("s", lambda d, _: d.get("continent", {}).get("code", "")),
+    "country_code": ("s", lambda d, _: d.get("country", {}).get("iso_code", "")),
+    "subdivision": ("s", lambda d, lang: _localized_name(_subdivision(d), lang)),
+    "subdivision_code": ("s", lambda d, _: _subdivision(d).get("iso_code", "")),
+    "postal_code": ("s", lambda d, _: d.get("postal", {}).get("code", "")),
+    "time_zone": ("s", lambda d, _: d.get("location", {}).get("time_zone", "")),
+    "latitude": ("d", lambda d, _: d.get("location", {}).get("latitude", math.nan)),
+    "longitude": ("d", lambda d, _: d.get("location", {}).get("longitude", math.nan)),
+    "accuracy_radius": (
+        "I",
+        lambda d, _: d.get("location", {}).get("accuracy_radius", 0),
+    ),
+    "asn": ("I", lambda d, _: d.get("autonomous_system_number", 0)),
+    "as_organization": (
+        "s",
+        lambda d, _: d.get("autonomous_system_organization", ""),
+    ),
+}
+
+_FIELD_DEFAULTS = {"s": "", "I": 0, "d": math.nan}
 
 
 def serialize(
+    triples: list[tuple[int, int, int]] | np.ndarray,
+    mapping: dict[int, tuple[str, str]],
+    version: int = FORMAT_VERSION,
+    jump_table: bool = False,
+    records: "GeoRecords | None" = None,
+    compress: bool = False,
+) -> bytes:
+    if not isinstance(triples, (Sequence, np.ndarray)):
+        triples = list(triples)
+    if version == LEGACY_VERSION:
+        if records is not None:
+            raise ValueError(f"Format version {LEGACY_VERSION} has no geo records")
+        if compress:
+            raise ValueError(f"Format version {LEGACY_VERSION} is not compressed")
+        return _serialize_legacy(triples, mapping)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported format version {version}")
+    flags = FLAG_SORTED | FLAG_COMPRESSED if compress else FLAG_SORTED
+    return _serialize_ranges(triples, mapping, jump_table, records, flags)
+
+
+def _serialize_ranges(
+    triples: Sequence[tuple[int, int, int]] | np.ndarray,
+    mapping: dict[int, tuple[str, str]],
+    jump_table: bool,
+    records: "GeoRecords | None",
+    flags: int,
+) -> bytes:
+    if flags & FLAG_COMPRESSED and jump_table:
+        raise ValueError("Compressed files have no jump table")
+    try:
+        ipv4, ipv6 = _range_arrays(triples)
+        if _overlapping(ipv4[:, 0], ipv4[:, 1]):
+            ipv4 = np.array(list(_resolve_sorted(ipv4.tolist())), dtype=np.int64)
+        if _has_overlaps(ipv6):
+            ipv6 = list(_resolve_sorted(ipv6))
+        if flags & FLAG_COMPRESSED:
+            block_starts, offsets, blocks = _encode_blocks(ipv4)
+            sections = [
+                (SECTION_BLOCK_STARTS, block_starts.astype("<u4").tobytes()),
+                (SECTION_BLOCK_OFFSETS, offsets.astype("<u4").tobytes()),
+                (SECTION_BLOCKS, blocks),
+            ]
+        else:
+            sections = [
+                (SECTION_STARTS, ipv4[:, 0].astype("<u4").tobytes()),
+                (SECTION_ENDS, ipv4[:, 1].astype("<u4").tobytes()),
+                (SECTION_GEO_IDS, ipv4[:, 2].astype("<u4").tobytes()),
+            ]
+        sections += _serialize_geos(mapping, records)
+        if ipv6:
+            sections += [
+                (SECTION_STARTS6, _uint128_bytes(a for a, _, _ in ipv6)),
+                (SECTION_ENDS6, _uint128_bytes(b for _, b, _ in ipv6)),
+                (SECTION_GEO_IDS6, _uint32_bytes(c for _, _, c in ipv6)),
+            ]
+        if jump_table:
+            jump = build_jump_table(ipv4[:, 0])
+            sections.append((SECTION_JUMP, jump.astype("<u4").tobytes()))
+    except OverflowError as e:
+        raise ValueError(
+            f"Values do not fit format version {FORMAT_VERSION}, "
+            f"use version={LEGACY_VERSION}: {e}"
+        ) from None
+
+    return _pack_sections(flags, len(ipv4), len(mapping), sections)
+
+
+def _encode_blocks(
+    ranges: np.ndarray, block_size: int = BLOCK_SIZE
+) -> tuple[np.ndarray, np.ndarray, bytes]:
+    # Sorted IPv4 ranges are split into blocks that decode on their own. A
+    # block starts with its range count - 1 and the widths of its columns,
+    # then holds the deltas between consecutive starts, end - start and the
+    # geo ids, each column packed with the fewest bytes (1, 2 or 4) that fit
+    # its largest value in the block. The first start of every block is kept
+    # uncompressed in the block index.
+    starts, ends, geo_ids = ranges[:, 0], ranges[:, 1], ranges[:, 2]
+    firsts = np.arange(0, len(ranges), block_size)
+    counts = np.diff(np.append(firsts, len(ranges)))
+    deltas = np.diff(starts, prepend=starts[:1])
+    deltas[firsts] = 0
+    columns = (deltas, ends - starts, geo_ids)
+
+    codes = [_block_width_codes(column, firsts) for column in columns]
+    widths = [_BLOCK_WIDTHS[code] for code in codes]
+    sizes = 2 + (counts - 1) * widths[0] + counts * (widths[1] + widths[2])
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+
+    data = np.zeros(offsets[-1], dtype=np.uint8)
+    data[offsets[:-1]] = counts - 1
+    data[offsets[:-1] + 1] = codes[0] | codes[1] << 2 | codes[2] << 4
+    for column, width, position in zip(
+        columns, widths, _block_column_offsets(offsets, counts, widths)
+    ):
+        block_of = np.repeat(np.arange(len(counts)), counts)
+        index = np.arange(len(column)) - firsts[block_of]
+        if column is deltas:
+            # The first range of a block has no delta.
+            keep = index > 0
+            column, block_of, index = column[keep], block_of[keep], index[keep] - 1
+        value_width = width[block_of]
+        at = position[block_of] + index * value_width
+        for byte in range(4):
+            wide = value_width > byte
+            data[at[wide] + byte] = column[wide] >> 8 * byte & 0xFF
+    return starts[firsts], offsets, data.tobytes()
+
+
+_BLOCK_WIDTHS = np.array([1, 2, 4])
+_BLOCK_TYPECODES = ("B", "H", "I")
+
+
+def _block_width_codes(column: np.ndarray, firsts: np.ndarray) -> np.ndarray:
+    if not len(column):
+        return np.zeros(0, dtype=np.int64)
+    largest = np.maximum.reduceat(column, firsts)
+    return (largest > 0xFF).astype(np.int64) + (largest > 0xFFFF)
+
+
+def _block_column_offsets(
+    offsets: np.ndarray, counts: np.ndarray, widths: list[np.ndarray]
+) -> list[np.ndarray]:
+    deltas = offsets[:-1] + 2
+    lengths = deltas + (counts - 1) * widths[0]
+    return [deltas, lengths, lengths + counts * widths[1]]
+
+
+def _decode_block(data: bytes, first_start: int) -> tuple[list[int], array, array]:
+    # Starts, lengths and geo ids of one block, for lookups.
+    count = data[0] + 1
+    position = 2
+    columns = []
+    for size, shift in ((count - 1, 0), (count, 2), (count, 4)):
+        column = array(_BLOCK_TYPECODES[data[1] >> shift & 3])
+        end = position + size * column.itemsize
+        column.frombytes(data[position:end])
+        columns.append(_swapped(column))
+        position = end
+    deltas, lengths, geo_ids = columns
+    return list(accumulate(deltas, initial=first_start)), lengths, geo_ids
+
+
+def _decode_blocks(
+    block_starts: np.ndarray, offsets: np.ndarray, data: np.ndarray, count: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Decodes all blocks at once, offsets hold their bounds within data.
+    blocks = len(block_starts)
+    offsets = offsets.astype(np.int64)
+    if len(offsets) != blocks + 1 or offsets[-1] != len(data):
+        raise ValueError("Block offsets do not match block data")
+    if not blocks:
+        if count:
+            raise ValueError("Blocks do not match range count")
+        empty = np.zeros(0, dtype=np.uint32)
+        return empty, empty, empty
+    if (np.diff(offsets) < 2).any():
+        raise ValueError("Block data is truncated")
+
+    counts = data[offsets[:-1]].astype(np.int64) + 1
+    codes = data[offsets[:-1] + 1].astype(np.int64)
+    codes = [codes & 3, codes >> 2 & 3, codes >> 4 & 3]
+    if any((code > 2).any() for code in codes):
+        raise ValueError("Block data holds an invalid width")
+    widths = [_BLOCK_WIDTHS[code] for code in codes]
+    sizes = 2 + (counts - 1) * widths[0] + counts * (widths[1] + widths[2])
+    if counts.sum() != count or (sizes != np.diff(offsets)).any():
+        raise ValueError("Block counts do not match block data")
+
+    firsts = np.cumsum(counts) - counts
+    columns = []
+    for column_codes, position, skip in zip(
+        codes, _block_column_offsets(offsets, counts, widths), (1, 0, 0)
+    ):
+        # Blocks that pack the column with the same width are read together.
+        column = np.zeros(count, dtype=np.int64)
+        for code, width in enumerate(_BLOCK_WIDTHS.tolist()):
+            selected = np.flatnonzero(column_codes == code)
+            sizes = counts[selected] - skip
+            total = sizes.sum()
+            if not total:
+                continue
+            index = np.arange(total) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            at = np.repeat(position[selected], sizes) + index * width
+            packed = np.empty((total, width), dtype=np.uint8)
+            for byte in range(width):
+                packed[:, byte] = data[at + byte]
+            targets = np.repeat(firsts[selected] + skip, sizes) + index
+            column[targets] = packed.view(f"<u{width}").ravel()
+        columns.append(column)
+
+    deltas, lengths, geo_ids = columns
+    offset = np.cumsum(deltas)
+    block_of = np.repeat(np.arange(blocks), counts)
+    starts = block_starts.astype(np.int64)[block_of] + offset - offset[firsts][block_of]
+    ends = starts + lengths
+    if ends.max() > IPV4_MAX:
+        raise ValueError("Block data holds ranges out of bounds")
+    return starts.astype(np.uint32), ends.astype(np.uint32), geo_ids.astype(np.uint32)
+
+
+def build_jump_table(starts: Sequence[int] | np.ndarray) -> np.ndarray:
+    # Entry p is the index of the first range starting at or after prefix p,
+    # so ranges that may contain an address with prefix p lie in
+    # [table[p] - 1, table[p + 1]).
+    bounds = np.arange((1 << JUMP_BITS) + 1, dtype=np.int64) << (32 - JUMP_BITS)
+    starts = np.asarray(starts, dtype=np.int64)
+    return np.searchsorted(starts, bounds, side="left").astype(np.uint32)
+
+
+def _range_arrays(
+    triples: list[tuple[int, int, int]] | np.ndarray,
+) -> tuple[np.ndarray, list[tuple[int, int, int]]]:
+    # IPv4 ranges as one sorted (n, 3) int64 array, IPv6 ranges as sorted
+    # triples. Triples are converted in a single pass, only inputs holding
+    # IPv6 values take the per-range path.
+    try:
+        ranges = _int64_ranges(triples)
+    except OverflowError:
+        ranges = None
+    if ranges is None or (len(ranges) and ranges[:, 1].max() > IPV4_MAX):
+        if isinstance(triples, np.ndarray):
+            triples = list(map(tuple, triples.tolist()))
+        ipv4, ipv6 = _split_families(sort_data(triples))
+        ranges = np.array(ipv4, dtype=np.int64).reshape(-1, 3)
+    else:
+        ipv6 = []
+        starts = ranges[:, 0]
+        if not (starts[1:] > starts[:-1]).all():
+            ranges = ranges[np.lexsort((ranges[:, 1], starts))]
+
+    if len(ranges) and (ranges.min() < 0 or ranges[:, 2].max() > IPV4_MAX):
+        raise OverflowError("value out of range for uint32")
+    return ranges, ipv6
+
+
+def _int64_ranges(triples: Sequence[tuple[int, int, int]] | np.ndarray) -> np.ndarray:
+    if isinstance(triples, np.ndarray):
+        if triples.dtype.kind not in "iu" or triples.ndim != 2 or triples.shape[1] != 3:
+            raise ValueError("Ranges must be an (n, 3) integer array")
+        if triples.dtype == np.uint64 and len(triples) and triples.max() >= 1 << 63:
+            raise OverflowError("value out of range for int64")
+        return triples.astype(np.int64, copy=False)
+
+    ranges = np.fromiter(chain.from_iterable(triples), dtype=np.int64)
+    if len(ranges) != 3 * len(triples):
+        raise ValueError("Ranges must be (start, end, geo_id) triples")
+    return ranges.reshape(-1, 3)
+
+
+def _split_families(
+    triples: Iterable[tuple[int, int, int]],
+) -> tuple[list[tuple[int, int, int]], list[tuple[int, int, int]]]:
+    ipv4, ipv6 = [], []
+    for start, end, geo_id in triples:
+        if end <= IPV4_MAX:
+            ipv4.append((start, end, geo_id))
+        elif start > IPV4_MAX:
+            ipv6.append((start, end, geo_id))
+        else:
+            ipv4.append((start, IPV4_MAX, geo_id))
+            ipv6.append((IPV4_MAX + 1, end, geo_id))
+    return ipv4, ipv6
+
+
+def _serialize_legacy(
     triples: list[tuple[int, int, int]], mapping: dict[int, tuple[str, str]]
 ) -> bytes:
-    parts = [struct.pack("<I", len(triples))]
-    for a, b, c in triples:
-        parts.append(struct.pack("<qqq", a, b, c))
+    try:
+        ranges = _int64_ranges(triples)
+    except OverflowError as e:
+        raise struct.error(str(e)) from None
+    parts = [struct.pack("<I", len(ranges)), ranges.astype("<i8").tobytes()]
     parts.append(struct.pack("<I", len(mapping)))
     for v, (s1, s2) in mapping.items():
         b1, b2 = s1.encode(), s2.encode()
@@ -71,16 +702,575 @@ def serialize(
     return b"".join(parts)
 
 
+def _uint32_bytes(values) -> bytes:
+    column = array("I", values)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column.tobytes()
+
+
+def _uint128_bytes(values) -> bytes:
+    column = array("Q")
+    for value in values:
+        column.extend(divmod(value, 1 << 64))
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column.tobytes()
+
+
+def _serialize_geos(
+    mapping: dict[int, tuple[str, str]], records: "GeoRecords | None" = None
+) -> list[tuple[bytes, bytes]]:
+    if isinstance(mapping, GeoTable) and (records is None or records.table is mapping):
+        sections = [(SECTION_GEOS, mapping.geos), (SECTION_STRINGS, mapping.strings)]
+        if records is not None:
+            sections += records.sections()
+        return sections
+
+    strings = bytearray()
+    offsets = {}
+
+    def pooled(name: str) -> int:
+        offset = offsets.get(name)
+        if offset is None:
+            encoded = name.encode()
+            offset = offsets[name] = len(strings)
+            strings.extend(struct.pack("<H", len(encoded)) + encoded)
+        return offset
+
+    # Geo ids are written in order, so that readers find them by position or
+    # binary search over the file.
+    geo_ids = sorted(mapping)
+    geos = array("I")
+    for geo_id in geo_ids:
+        geos.append(geo_id)
+        geos.extend(map(pooled, mapping[geo_id]))
+    sections = [(SECTION_GEOS, _swapped(geos).tobytes())]
+
+    if records is not None and records.fields:
+        rows = [records.row(geo_id) for geo_id in geo_ids]
+        fields = []
+        columns = []
+        for i, field in enumerate(records.fields):
+            typecode = records.typecode(field)
+            default = _FIELD_DEFAULTS[typecode]
+            values = [default if row is None else row[i] for row in rows]
+            if typecode == "s":
+                column = array("I", map(pooled, values))
+            else:
+                column = array(typecode, values)
+            data = _swapped(column).tobytes()
+            fields.append(f"{field}:{typecode}")
+            columns.append(data + b"\0" * (-len(data) % SECTION_ALIGNMENT))
+        sections += [
+            (SECTION_FIELDS, "\n".join(fields).encode()),
+            (SECTION_RECORDS, b"".join(columns)),
+        ]
+
+    sections.insert(1, (SECTION_STRINGS, bytes(strings)))
+    return sections
+
+
+def _swapped(column: array) -> array:
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+
+def _pack_sections(
+    flags: int, range_count: int, geo_count: int, sections: list[tuple[bytes, bytes]]
+) -> bytes:
+    header, offsets = _layout_sections(
+        flags, range_count, geo_count, [(tag, len(data)) for tag, data in sections]
+    )
+    checksums = _checksum_section(
+        header, [(tag, zlib.crc32(data)) for tag, data in sections]
+    )
+    body = [header]
+    position = len(header)
+    for (_, data), offset in zip([*sections, checksums], offsets):
+        body.append(b"\0" * (offset - position))
+        body.append(data)
+        position = offset + len(data)
+    return b"".join(body)
+
+
+def _layout_sections(
+    flags: int, range_count: int, geo_count: int, sections: list[tuple[bytes, int]]
+) -> tuple[bytes, list[int]]:
+    # The checksum section goes last, after the sections it covers.
+    sections = [*sections, (SECTION_CHECKSUMS, _CHECKSUM.size * (len(sections) + 1))]
+    offset = _HEADER.size + _SECTION.size * len(sections)
+    directory = []
+    offsets = []
+    for tag, length in sections:
+        offset += -offset % SECTION_ALIGNMENT
+        directory.append(_SECTION.pack(tag, offset, length))
+        offsets.append(offset)
+        offset += length
+
+    header = _HEADER.pack(
+        MAGIC, FORMAT_VERSION, flags, len(sections), range_count, geo_count
+    )
+    return b"".join([header, *directory]), offsets
+
+
+def _checksum_section(
+    header: bytes, checksums: list[tuple[bytes, int]]
+) -> tuple[bytes, bytes]:
+    entries = [(_HEADER_CHECKSUM, zlib.crc32(header)), *checksums]
+    return SECTION_CHECKSUMS, b"".join(_CHECKSUM.pack(*entry) for entry in entries)
+
+
+def _read_checksums(
+    buf: bytes, section_count: int, sections: dict[bytes, tuple[int, int]]
+) -> dict[bytes, int] | None:
+    # Files written before checksums were added have none.
+    if SECTION_CHECKSUMS not in sections:
+        return None
+    offset, length = sections[SECTION_CHECKSUMS]
+    if length % _CHECKSUM.size:
+        raise ValueError(f"Section {SECTION_CHECKSUMS.decode()} has invalid size")
+
+    checksums = dict(_CHECKSUM.iter_unpack(buf[offset : offset + length]))
+    header_size = _HEADER.size + section_count * _SECTION.size
+    if zlib.crc32(buf[:header_size]) != checksums.get(_HEADER_CHECKSUM):
+        raise ValueError("Header checksum mismatch")
+    return checksums
+
+
+def _read_header(buf: bytes) -> tuple[int, int, int, dict[bytes, tuple[int, int]]]:
+    magic, version, flags, section_count, range_count, geo_count = _HEADER.unpack_from(
+        buf, 0
+    )
+    if magic != MAGIC:
+        raise ValueError("Not a cdb file")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported format version {version}")
+
+    sections = {}
+    for i in range(section_count):
+        tag, offset, length = _SECTION.unpack_from(
+            buf, _HEADER.size + i * _SECTION.size
+        )
+        if offset + length > len(buf):
+            raise ValueError(f"Section {tag.decode()} is truncated")
+        sections[tag] = (offset, length)
+    _read_checksums(buf, section_count, sections)
+
+    if flags & FLAG_COMPRESSED:
+        if not flags & FLAG_SORTED:
+            raise ValueError("Compressed files must be sorted")
+        _check_blocks(buf, range_count, sections)
+    else:
+        for tag in (SECTION_STARTS, SECTION_ENDS, SECTION_GEO_IDS):
+            if sections.get(tag, (0, 0))[1] != range_count * 4:
+                raise ValueError(f"Section {tag.decode()} does not match range count")
+    if sections.get(SECTION_GEOS, (0, 0))[1] != geo_count * 12:
+        raise ValueError(f"Section {SECTION_GEOS.decode()} does not match geo count")
+
+    ipv6_count = _ipv6_range_count(sections)
+    for tag, size in (
+        (SECTION_STARTS6, 16),
+        (SECTION_ENDS6, 16),
+        (SECTION_GEO_IDS6, 4),
+    ):
+        if sections.get(tag, (0, 0))[1] != ipv6_count * size:
+            raise ValueError(f"Section {tag.decode()} does not match range count")
+
+    if (SECTION_FIELDS in sections) != (SECTION_RECORDS in sections):
+        raise ValueError("Geo record sections are incomplete")
+    if SECTION_FIELDS in sections:
+        offset, length = sections[SECTION_FIELDS]
+        _, size = _record_layout(bytes(buf[offset : offset + length]), geo_count)
+        if sections[SECTION_RECORDS][1] != size:
+            raise ValueError(
+                f"Section {SECTION_RECORDS.decode()} does not match its fields"
+            )
+
+    if SECTION_JUMP in sections:
+        if flags & FLAG_COMPRESSED:
+            raise ValueError("Compressed files have no jump table")
+        offset, length = sections[SECTION_JUMP]
+        if length != ((1 << JUMP_BITS) + 1) * 4:
+            raise ValueError(f"Section {SECTION_JUMP.decode()} has invalid size")
+        if struct.unpack_from("<I", buf, offset + length - 4)[0] > range_count:
+            raise ValueError(f"Section {SECTION_JUMP.decode()} does not match ranges")
+
+    return flags, range_count, geo_count, sections
+
+
+def _check_blocks(buf: bytes, range_count: int, sections: dict[bytes, tuple[int, int]]):
+    length = sections.get(SECTION_BLOCK_STARTS, (0, 0))[1]
+    blocks = length // 4
+    if length % 4 or blocks > range_count or (range_count and not blocks):
+        raise ValueError(
+            f"Section {SECTION_BLOCK_STARTS.decode()} does not match range count"
+        )
+    offset, length = sections.get(SECTION_BLOCK_OFFSETS, (0, 0))
+    if (
+        length != (blocks + 1) * 4
+        or struct.unpack_from("<I", buf, offset + blocks * 4)[0]
+        != sections.get(SECTION_BLOCKS, (0, 0))[1]
+    ):
+        raise ValueError(
+            f"Section {SECTION_BLOCK_OFFSETS.decode()} does not match block data"
+        )
+
+
+def _ipv4_columns(
+    buf: bytes, flags: int, count: int, sections: dict[bytes, tuple[int, int]]
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Starts, ends and geo ids as uint32 arrays, over the buffer unless the
+    # file is compressed.
+    if not flags & FLAG_COMPRESSED:
+        return tuple(
+            _uint32_column(buf, sections[tag][0], count)
+            for tag in (SECTION_STARTS, SECTION_ENDS, SECTION_GEO_IDS)
+        )
+    blocks = sections[SECTION_BLOCK_STARTS][1] // 4
+    offset, length = sections[SECTION_BLOCKS]
+    try:
+        return _decode_blocks(
+            _uint32_column(buf, sections[SECTION_BLOCK_STARTS][0], blocks),
+            _uint32_column(buf, sections[SECTION_BLOCK_OFFSETS][0], blocks + 1),
+            np.frombuffer(buf, dtype=np.uint8, count=length, offset=offset),
+            count,
+        )
+    except ValueError as e:
+        # Raised outside the handler, so that the traceback holds no arrays
+        # over the buffer and a mapped file can still be closed.
+        error = str(e)
+    raise ValueError(error)
+
+
+def _ipv6_range_count(sections: dict[bytes, tuple[int, int]]) -> int:
+    return sections.get(SECTION_STARTS6, (0, 0))[1] // 16
+
+
+def is_legacy_format(buf: bytes) -> bool:
+    return buf[: len(MAGIC)] != MAGIC
+
+
 def deserialize(
     buf: bytes,
 ) -> tuple[list[tuple[int, int, int]], dict[int, tuple[str, str]]]:
-    off = 0
-    (n,) = struct.unpack_from("<I", buf, off)
-    off += 4
-    triples = []
-    for _ in range(n):
-        triples.append(tuple(struct.unpack_from("<qqq", buf, off)))
-        off += 24
+    if is_legacy_format(buf):
+        return _deserialize_legacy(buf)
+
+    flags, count, _, sections = _read_header(buf)
+    if flags & FLAG_COMPRESSED:
+        columns = _ipv4_columns(buf, flags, count, sections)
+        triples = list(zip(*(column.tolist() for column in columns)))
+    else:
+        starts = _uint32_array(buf, *sections[SECTION_STARTS])
+        ends = _uint32_array(buf, *sections[SECTION_ENDS])
+        geo_ids = _uint32_array(buf, *sections[SECTION_GEO_IDS])
+        triples = list(zip(starts, ends, geo_ids))
+
+    if _ipv6_range_count(sections):
+        triples += zip(
+            _uint128_list(buf, *sections[SECTION_STARTS6]),
+            _uint128_list(buf, *sections[SECTION_ENDS6]),
+            _uint32_array(buf, *sections[SECTION_GEO_IDS6]),
+        )
+    return triples, _deserialize_geos(buf, sections)
+
+
+def deserialize_arrays(
+    buf: bytes,
+) -> tuple[np.ndarray, np.ndarray, dict[int, tuple[str, str]]]:
+    # IPv4 ranges as an (n, 3) uint32 array and IPv6 ranges as an (m, 5)
+    # uint64 array of (start_high, start_low, end_high, end_low, geo) words,
+    # the layouts CdbWriter.add_array takes.
+    if is_legacy_format(buf):
+        ranges, mapping = _legacy_ranges(buf), _legacy_mapping(buf)
+        if len(ranges) and (ranges.min() < 0 or ranges[:, 2].max() > IPV4_MAX):
+            raise ValueError(f"Ranges do not fit format version {FORMAT_VERSION}")
+        if (ranges[:, 1] > IPV4_MAX).any():
+            ipv4, ipv6 = _range_arrays(list(map(tuple, ranges.tolist())))
+            return ipv4.astype(np.uint32), _wide_ranges(ipv6), mapping
+        return ranges.astype(np.uint32), np.empty((0, 5), dtype=np.uint64), mapping
+
+    flags, count, _, sections = _read_header(buf)
+    ipv4 = np.empty((count, 3), dtype=np.uint32)
+    for i, column in enumerate(_ipv4_columns(buf, flags, count, sections)):
+        ipv4[:, i] = column
+
+    count6 = _ipv6_range_count(sections)
+    ipv6 = np.empty((count6, 5), dtype=np.uint64)
+    for columns, tag, dtype in (
+        (slice(0, 2), SECTION_STARTS6, "<u8"),
+        (slice(2, 4), SECTION_ENDS6, "<u8"),
+        (slice(4, 5), SECTION_GEO_IDS6, "<u4"),
+    ):
+        if count6:
+            words = np.frombuffer(
+                buf,
+                dtype=dtype,
+                count=count6 * (columns.stop - columns.start),
+                offset=sections[tag][0],
+            )
+            ipv6[:, columns] = words.reshape(count6, -1)
+    return ipv4, ipv6, _deserialize_geos(buf, sections)
+
+
+def _wide_ranges(triples: list[tuple[int, int, int]]) -> np.ndarray:
+    rows = [
+        (*divmod(start, 1 << 64), *divmod(end, 1 << 64), geo_id)
+        for start, end, geo_id in triples
+    ]
+    return np.array(rows, dtype=np.uint64).reshape(-1, 5)
+
+
+def _uint32_column(buf: bytes, offset: int, count: int) -> np.ndarray:
+    return np.frombuffer(buf, dtype="<u4", count=count, offset=offset)
+
+
+def _uint32_array(buf: bytes, offset: int, length: int) -> array:
+    column = array("I")
+    column.frombytes(buf[offset : offset + length])
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+
+def _uint128_list(buf: bytes, offset: int, length: int) -> list[int]:
+    words = array("Q")
+    words.frombytes(buf[offset : offset + length])
+    if sys.byteorder == "big":
+        words.byteswap()
+    return [high << 64 | low for high, low in zip(words[0::2], words[1::2])]
+
+
+def _deserialize_geos(
+    buf: bytes, sections: dict[bytes, tuple[int, int]]
+) -> dict[int, tuple[str, str]]:
+    return dict(_geo_table(buf, sections).items())
+
+
+def _geo_table(buf: bytes, sections: dict[bytes, tuple[int, int]]) -> "GeoTable":
+    records_offset, records_length = sections[SECTION_GEOS]
+    strings_offset, strings_length = sections[SECTION_STRINGS]
+    view = memoryview(buf)
+    return GeoTable(
+        view[records_offset : records_offset + records_length],
+        view[strings_offset : strings_offset + strings_length],
+    )
+
+
+class GeoTable(Mapping):
+    # Read-only geo mapping over the GEOS records and the STRS pool, which
+    # stay views of the file. A geo id is found by its position when ids are
+    # dense, by binary search when they are sorted, and through a sorted
+    # index otherwise. Names are decoded on first access and shared by every
+    # geo that refers to them.
+    def __init__(self, geos: bytes | memoryview, strings: bytes | memoryview):
+        self.geos = geos
+        self.strings = strings
+        if sys.byteorder == "little":
+            self._fields = memoryview(geos).cast("I")
+        else:
+            self._fields = _uint32_array(geos, 0, len(geos))
+        self._count = len(self._fields) // 3
+        self._ids = self._fields[0::3]
+        self._index = None
+
+        ids = np.frombuffer(geos, dtype="<u4")[0::3]
+        increasing = bool((ids[1:] > ids[:-1]).all())
+        self._dense = increasing and (not len(ids) or ids[-1] == len(ids) - 1)
+        if not increasing:
+            order = np.argsort(ids, kind="stable")
+            self._ids = array("I", ids[order].astype(np.uint32).tobytes())
+            self._index = array("I", order.astype(np.uint32).tobytes())
+        del ids
+        self._geos = {}
+        self._names = {}
+
+    def __getitem__(self, geo_id: int) -> tuple[str, str]:
+        geo = self._geos.get(geo_id)
+        if geo is None:
+            position = self._position(geo_id)
+            if position is None:
+                raise KeyError(geo_id)
+            i = position * 3
+            geo = self._geos[geo_id] = (
+                self._name(self._fields[i + 1]),
+                self._name(self._fields[i + 2]),
+            )
+        return geo
+
+    def get(self, geo_id: int, default=None):
+        geo = self._geos.get(geo_id)
+        if geo is None:
+            if self._position(geo_id) is None:
+                return default
+            geo = self[geo_id]
+        return geo
+
+    def __contains__(self, geo_id) -> bool:
+        return self._position(geo_id) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._fields[0::3].tolist())
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _position(self, geo_id) -> int | None:
+        try:
+            geo_id = index(geo_id)
+        except TypeError:
+            return None
+        if self._dense:
+            return geo_id if 0 <= geo_id < self._count else None
+        i = bisect_left(self._ids, geo_id)
+        if i == len(self._ids) or self._ids[i] != geo_id:
+            return None
+        return i if self._index is None else self._index[i]
+
+    def _name(self, offset: int) -> str:
+        name = self._names.get(offset)
+        if name is None:
+            (length,) = struct.unpack_from("<H", self.strings, offset)
+            name = sys.intern(
+                str(self.strings[offset + 2 : offset + 2 + length], "utf-8")
+            )
+            self._names[offset] = name
+        return name
+
+
+class GeoRecords:
+    # Extra per-geo fields (see GEO_FIELDS), one row tuple per geo id.
+    def __init__(self, fields: Sequence[str], rows: dict[int, tuple] | None = None):
+        for field in fields:
+            if field not in GEO_FIELDS:
+                raise ValueError(f"Unknown geo field {field!r}")
+        self.fields = tuple(fields)
+        self.rows = {} if rows is None else rows
+        self.table = None
+
+    def typecode(self, field: str) -> str:
+        return GEO_FIELDS[field][0]
+
+    def row(self, geo_id: int) -> tuple | None:
+        return self.rows.get(geo_id)
+
+    def value(self, geo_id: int, field: str, default=None):
+        row = self.row(geo_id)
+        return default if row is None else row[self.fields.index(field)]
+
+    def record(self, geo_id: int) -> dict | None:
+        row = self.row(geo_id)
+        return None if row is None else dict(zip(self.fields, row))
+
+
+class RecordTable(GeoRecords):
+    # Columnar FLDS/RECS sections of a file. A column is converted on first
+    # use and a string is decoded only when a value that refers to it is
+    # read, through the string cache of the geo table.
+    def __init__(self, table: GeoTable, fields: bytes, records: bytes):
+        self.table = table
+        self.records = records
+        self._layout, _ = _record_layout(fields, len(table))
+        self.fields = tuple(self._layout)
+        self._columns = {}
+
+    def typecode(self, field: str) -> str:
+        return self._layout[field][0]
+
+    def row(self, geo_id: int) -> tuple | None:
+        if geo_id not in self.table:
+            return None
+        return tuple(self.value(geo_id, field) for field in self.fields)
+
+    def value(self, geo_id: int, field: str, default=None):
+        position = self.table._position(geo_id)
+        if position is None:
+            return default
+        value = self._column(field)[position]
+        if self._layout[field][0] == "s":
+            return self.table._name(value)
+        # A single NaN object keeps rows with missing coordinates equal.
+        return math.nan if value != value else value
+
+    def values(self, field: str, geo_ids: np.ndarray, default=None) -> list:
+        unique, inverse = np.unique(geo_ids, return_inverse=True)
+        decoded = [self.value(geo_id, field, default) for geo_id in unique.tolist()]
+        return [decoded[i] for i in inverse.tolist()]
+
+    def sections(self) -> list[tuple[bytes, bytes]]:
+        fields = "\n".join(f"{f}:{t}" for f, (t, _) in self._layout.items())
+        return [(SECTION_FIELDS, fields.encode()), (SECTION_RECORDS, self.records)]
+
+    def _column(self, field: str) -> array:
+        column = self._columns.get(field)
+        if column is None:
+            typecode, offset = self._layout[field]
+            column = array("I" if typecode == "s" else typecode)
+            size = len(self.table) * column.itemsize
+            column.frombytes(self.records[offset : offset + size])
+            column = self._columns[field] = _swapped(column)
+        return column
+
+
+def _record_layout(
+    fields: bytes, geo_count: int
+) -> tuple[dict[str, tuple[str, int]], int]:
+    layout = {}
+    offset = 0
+    for line in str(fields, "utf-8").split("\n") if fields else ():
+        field, _, typecode = line.partition(":")
+        if typecode not in _FIELD_DEFAULTS:
+            raise ValueError(f"Unsupported type {typecode!r} of geo field {field!r}")
+        layout[field] = (typecode, offset)
+        size = geo_count * (8 if typecode == "d" else 4)
+        offset += size + (-size % SECTION_ALIGNMENT)
+    return layout, offset
+
+
+def _geo_record(
+    mapping: dict[int, tuple[str, str]], records: GeoRecords | None, geo_id: int | None
+) -> dict:
+    country, city = mapping.get(geo_id, UNKNOWN_GEO)
+    record = {"country": country, "city": city}
+    if records is not None:
+        record.update(records.record(geo_id) or {})
+    return record
+
+
+def _record_table(buf: bytes, sections: dict[bytes, tuple[int, int]], table: GeoTable):
+    if SECTION_FIELDS not in sections:
+        return None
+    fields_offset, fields_length = sections[SECTION_FIELDS]
+    records_offset, records_length = sections[SECTION_RECORDS]
+    return RecordTable(
+        table,
+        bytes(buf[fields_offset : fields_offset + fields_length]),
+        bytes(buf[records_offset : records_offset + records_length]),
+    )
+
+
+def _deserialize_legacy(
+    buf: bytes,
+) -> tuple[list[tuple[int, int, int]], dict[int, tuple[str, str]]]:
+    ranges = _legacy_ranges(buf)
+    return list(zip(*ranges.T.tolist())), _legacy_mapping(buf)
+
+
+def _legacy_ranges(buf: bytes) -> np.ndarray:
+    (n,) = struct.unpack_from("<I", buf, 0)
+    if len(buf) < 4 + n * 24:
+        raise struct.error(f"Buffer holds less than {n} ranges")
+    return np.frombuffer(buf, dtype="<i8", count=n * 3, offset=4).reshape(n, 3)
+
+
+def _legacy_mapping(buf: bytes) -> dict[int, tuple[str, str]]:
+    (n,) = struct.unpack_from("<I", buf, 0)
+    return _deserialize_mapping(buf, 4 + n * 24)
+
+
+def _deserialize_mapping(buf: bytes, off: int) -> dict[int, tuple[str, str]]:
     (m,) = struct.unpack_from("<I", buf, off)
     off += 4
     mapping = {}
@@ -89,29 +1279,164 @@ def deserialize(
         off += 8
         (l1,) = struct.unpack_from("<H", buf, off)
         off += 2
-        s1 = buf[off : off + l1].decode()
+        s1 = str(buf[off : off + l1], "utf-8")
         off += l1
         (l2,) = struct.unpack_from("<H", buf, off)
         off += 2
-        s2 = buf[off : off + l2].decode()
+        s2 = str(buf[off : off + l2], "utf-8")
         off += l2
         mapping[k] = (s1, s2)
 
-    return triples, mapping
+    return mapping
 
 
 def sort_data(info: list[tuple[int, int, int]]) -> list[tuple[int, int, int]]:
     return sorted(info, key=lambda x: (x[0], x[1]))
 
 
+class GeoIndex:
+    def __init__(
+        self,
+        info: list[tuple[int, int, int]],
+        mapping: dict[int, tuple[str, str]],
+        is_sorted: bool = False,
+        jump_table: bool = False,
+        strict: bool = False,
+    ):
+        info = info if is_sorted else sort_data(info)
+        previous_end = None
+        overlaps = False
+        for a, b, _ in info:
+            if a > b:
+                raise ValueError(f"Range start {a} is greater than its end {b}")
+            if previous_end is not None and a <= previous_end:
+                if strict:
+                    raise ValueError(f"Range starting at {a} overlaps the previous one")
+                overlaps = True
+            previous_end = b if previous_end is None else max(b, previous_end)
+        if overlaps:
+            info = list(_resolve_sorted(info))
+
+        self.starts = [a for a, _, _ in info]
+        self.ends = [b for _, b, _ in info]
+        self.geo_ids = [c for _, _, c in info]
+        self.mapping = mapping
+        self._columns = None
+        self._jump = None
+
+        if jump_table:
+            count = bisect_right(self.starts, IPV4_MAX)
+            self._jump = build_jump_table(self.starts[:count]).tolist()
+
+    @classmethod
+    def from_cdb(cls, filepath: str, jump_table: bool = False) -> "GeoIndex":
+        return cls(*read_cdb(filepath), jump_table=jump_table)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def lookup_id(self, value: int) -> int | None:
+        jump = self._jump
+        if jump is not None and 0 <= value <= IPV4_MAX:
+            prefix = value >> (32 - JUMP_BITS)
+            i = bisect_right(self.starts, value, jump[prefix], jump[prefix + 1]) - 1
+        else:
+            i = bisect_right(self.starts, value) - 1
+        if i >= 0 and self.ends[i] >= value:
+            return self.geo_ids[i]
+        return None
+
+    def lookup(self, ip: str | int) -> tuple[str, str]:
+        return _lookup(self, ip)
+
+    def lookup_ids(self, values: np.ndarray) -> np.ndarray:
+        if self._columns is None:
+            count = bisect_right(self.starts, IPV4_MAX)
+            self._columns = (
+                np.array(self.starts[:count], dtype=np.int64),
+                np.array([min(b, IPV4_MAX) for b in self.ends[:count]], dtype=np.int64),
+                np.array(self.geo_ids[:count], dtype=np.int64),
+            )
+        return _lookup_ids(*self._columns, values)
+
+
+def _lookup_ids(
+    starts: np.ndarray, ends: np.ndarray, geo_ids: np.ndarray, values: np.ndarray
+) -> np.ndarray:
+    if not len(starts):
+        return np.full(len(values), UNKNOWN_GEO_ID, dtype=np.int64)
+
+    indices = np.searchsorted(starts, values, side="right") - 1
+    found = indices >= 0
+    indices[~found] = 0
+    found &= ends[indices] >= values
+    return np.where(found, geo_ids[indices].astype(np.int64), UNKNOWN_GEO_ID)
+
+
+def _source_lookup(
+    source: GeoIndex, ip: str | int, mapping: Mapping | None = None
+) -> tuple[str, str]:
+    value = ip if isinstance(ip, int) else cidr_to_int(ip, with_broadcast=False)
+    mapping = source.mapping if mapping is None else mapping
+    return mapping.get(source.lookup_id(value), UNKNOWN_GEO)
+
+
+def _resolved_lookup(
+    resolve, ip: str | int, mapping: Mapping | None = None
+) -> tuple[str, str]:
+    # For sources that reload, resolve returns the geo id together with the
+    # version it was found in, whose geo table the id belongs to.
+    value = ip if isinstance(ip, int) else cidr_to_int(ip, with_broadcast=False)
+    geo_id, version = resolve(value)
+    mapping = version.mapping if mapping is None else mapping
+    return mapping.get(geo_id, UNKNOWN_GEO)
+
+
+def _lookup(source: GeoIndex, ip: str | int) -> tuple[str, str]:
+    recorder = metrics.active
+    if recorder is not None:
+        return _recorded_lookup(recorder, _source_lookup, source, ip)
+    return _source_lookup(source, ip)
+
+
+def _recorded_lookup(recorder: metrics.Metrics, lookup, *args) -> tuple[str, str]:
+    start = time.perf_counter()
+    geo = lookup(*args)
+    recorder.record_lookup(time.perf_counter() - start, geo is UNKNOWN_GEO)
+    return geo
+
+
 def search_geo(
-    info: list[tuple[int, int, int]],
+    info: list[tuple[int, int, int]] | GeoIndex,
     ip: str | int,
-    mapping: dict[int, tuple[str, str]],
+    mapping: dict[int, tuple[str, str]] | None = None,
     is_sorted: bool = False,
 ) -> tuple[str, str]:
+    recorder = metrics.active
+    if recorder is not None:
+        return _recorded_lookup(recorder, _search_geo, info, ip, mapping, is_sorted)
+    return _search_geo(info, ip, mapping, is_sorted)
+
+
+def _search_geo(
+    info: list[tuple[int, int, int]] | GeoIndex,
+    ip: str | int,
+    mapping: dict[int, tuple[str, str]] | None,
+    is_sorted: bool,
+) -> tuple[str, str]:
+    if hasattr(info, "lookup_id"):
+        resolve = getattr(info, "_resolve_id", None)
+        if resolve is not None:
+            return _resolved_lookup(resolve, ip, mapping)
+        return _source_lookup(info, ip, mapping)
+
     value = ip if isinstance(ip, int) else cidr_to_int(ip, with_broadcast=False)
-    info = info if is_sorted else sort_data(info)
+
+    mapping = {} if mapping is None else mapping
+    if not is_sorted:
+        info = sort_data(info)
+        if _has_overlaps(info):
+            info = list(_resolve_sorted(info))
     left, right = 0, len(info) - 1
     best_match = None
 
@@ -127,59 +1452,686 @@ def search_geo(
         else:
             left = mid + 1
 
-    return mapping.get(best_match, ("Unknown", "Unknown"))
+    return mapping.get(best_match, UNKNOWN_GEO)
+
+
+def search_geo_batch(
+    index: list[tuple[int, int, int]] | GeoIndex,
+    ips: list[str] | list[int] | np.ndarray,
+    mapping: dict[int, tuple[str, str]] | None = None,
+    geo_ids: bool = False,
+    strict: bool = False,
+) -> list[tuple[str, str]] | np.ndarray:
+    if not hasattr(index, "lookup_ids"):
+        index = GeoIndex(index, {} if mapping is None else mapping, strict=strict)
+    elif hasattr(index, "snapshot"):
+        # Ids and names come from the same version of a source that reloads.
+        index = index.snapshot()[0]
+
+    recorder = metrics.active
+    start = time.perf_counter() if recorder is not None else 0.0
+    values = _batch_values(ips)
+    if values.dtype == object:
+        ids = _lookup_mixed_ids(index, values)
+    else:
+        ids = index.lookup_ids(values)
+    if recorder is not None:
+        recorder.record_batch(
+            time.perf_counter() - start,
+            len(ids),
+            int(np.count_nonzero(ids == UNKNOWN_GEO_ID)),
+        )
+    if geo_ids:
+        return ids
+
+    get = (index.mapping if mapping is None else mapping).get
+    return [
+        UNKNOWN_GEO if geo_id == UNKNOWN_GEO_ID else get(geo_id, UNKNOWN_GEO)
+        for geo_id in ids.tolist()
+    ]
+
+
+def _lookup_mixed_ids(index: GeoIndex, values: np.ndarray) -> np.ndarray:
+    # Vectorized lookups cover the IPv4 columns only, IPv6 addresses are
+    # looked up one by one.
+    ipv6 = values > IPV4_MAX
+    ids = np.empty(len(values), dtype=np.int64)
+    ids[~ipv6] = index.lookup_ids(values[~ipv6].astype(np.int64))
+    ids[ipv6] = [
+        UNKNOWN_GEO_ID if geo_id is None else geo_id
+        for geo_id in map(index.lookup_id, values[ipv6].tolist())
+    ]
+    return ids
+
+
+def _batch_values(ips: list[str] | list[int] | bytes | np.ndarray) -> np.ndarray:
+    if isinstance(ips, np.ndarray):
+        if ips.dtype.kind in "iu":
+            return ips
+        ips = ips.tolist()
+    if isinstance(ips, (bytes, bytearray, memoryview)):
+        ips = str(ips, "ascii").split()
+    elif ips and isinstance(ips[0], bytes):
+        ips = [str(ip, "ascii") for ip in ips]
+
+    if ips and isinstance(ips[0], str):
+        try:
+            return ips_to_uint32(ips)
+        except (ValueError, OverflowError):
+            pass
+
+    values = [
+        ip if isinstance(ip, int) else cidr_to_int(ip, with_broadcast=False)
+        for ip in ips
+    ]
+    if values and max(values) > IPV4_MAX:
+        return np.array(values, dtype=object)
+    return np.array(values, dtype=np.int64)
 
 
 def merge_cdbs(
     *filepaths: str,
+    policy: str = MERGE_FIRST,
+    compact: bool = False,
 ) -> tuple[list[tuple[int, int, int], dict[int, tuple[str, str]]]]:
-    networks = set()
+    start = time.perf_counter()
     mapping = {}
-    reverse_mapping = {}
-
-    for filepath in filepaths:
-        current_networks, current_mapping = read_cdb(filepath)
-        for a, b, old_id in current_networks:
-            geo = current_mapping[old_id]
-            if geo in reverse_mapping:
-                new_id = reverse_mapping[geo]
-            else:
-                new_id = len(mapping)
-                mapping[new_id] = geo
-                reverse_mapping[geo] = new_id
-
-            networks.add((a, b, new_id))
-
-        del current_networks
-        del current_mapping
+    networks = iter_merged_ranges(filepaths, mapping, policy)
+    networks = list(compact_ranges(networks) if compact else networks)
 
+    recorder = metrics.active
+    if recorder is not None:
+        recorder.record_merge(time.perf_counter() - start, len(networks))
     return networks, mapping
 
 
 def merge_cdbs_and_save(
     output_path: str,
     *filepaths: str,
-):
-    networks = set()
+    policy: str = MERGE_FIRST,
+    compact: bool = False,
+    jump_table: bool = False,
+    compress: bool = False,
+) -> int:
+    start = time.perf_counter()
     mapping = {}
+    fields = _merged_fields(filepaths)
+    records = GeoRecords(fields) if fields else None
+
+    with CdbWriter(
+        output_path, compact=compact, jump_table=jump_table, compress=compress
+    ) as writer:
+        writer.extend(iter_merged_ranges(filepaths, mapping, policy, records))
+        writer.finish(mapping, records)
+
+    recorder = metrics.active
+    if recorder is not None:
+        recorder.record_merge(
+            time.perf_counter() - start, writer.count - writer.removed
+        )
+    return writer.removed
+
+
+def _merged_fields(filepaths: Iterable[str]) -> list[str]:
+    from .reader import CdbReader
 
-    networks, mapping = merge_cdbs(*filepaths)
+    fields = {}
+    for path in filepaths:
+        with CdbReader(path) as reader:
+            if reader.records is not None:
+                fields.update(dict.fromkeys(reader.records.fields))
+    return list(fields)
 
-    write_cdb(networks, mapping, output_path)
+
+def compact(
+    triples: list[tuple[int, int, int]],
+) -> tuple[list[tuple[int, int, int]], int]:
+    compacted = list(compact_ranges(sort_data(triples)))
+    return compacted, len(triples) - len(compacted)
+
+
+def compact_ranges(
+    triples: Iterable[tuple[int, int, int]],
+) -> Iterator[tuple[int, int, int]]:
+    current = None
+    for start, end, geo_id in triples:
+        if current is not None:
+            if geo_id == current[2] and start <= current[1] + 1:
+                if end > current[1]:
+                    current = (current[0], end, geo_id)
+                continue
+            yield current
+        current = (start, end, geo_id)
+
+    if current is not None:
+        yield current
+
+
+def compact_cdb(
+    filepath: str,
+    output_path: str | None = None,
+    jump_table: bool = False,
+    compress: bool = False,
+) -> int:
+    from .reader import CdbReader
+
+    with CdbReader(filepath) as reader, CdbWriter(
+        output_path or filepath,
+        compact=True,
+        jump_table=jump_table,
+        compress=compress,
+    ) as writer:
+        writer.extend(reader)
+        writer.finish(reader.mapping, reader.records)
+    return writer.removed
+
+
+def iter_merged_ranges(
+    filepaths: Iterable[str],
+    mapping: dict[int, tuple[str, str]],
+    policy: str = MERGE_FIRST,
+    records: GeoRecords | None = None,
+) -> Iterator[tuple[int, int, int]]:
+    from .reader import CdbReader
+
+    if policy not in MERGE_POLICIES:
+        raise ValueError(f"Unknown merge policy {policy!r}")
+
+    # With records, geos are told apart by their field values as well, and
+    # fields a file lacks get their defaults.
+    def geo_key(geo_id: int, names: tuple[str, str], source: GeoRecords | None):
+        if records is None:
+            return names
+        return names + tuple(
+            (
+                source.value(geo_id, field, default)
+                if source is not None and field in source.fields
+                else default
+            )
+            for field, default in defaults
+        )
+
+    if records is not None:
+        defaults = [
+            (field, _FIELD_DEFAULTS[records.typecode(field)])
+            for field in records.fields
+        ]
+    reverse_mapping = {
+        geo_key(geo_id, geo, records): geo_id for geo_id, geo in mapping.items()
+    }
+
+    def remapped(reader: CdbReader, file_index: int):
+        current_mapping = reader.mapping
+        current_records = reader.records
+        new_ids = {}
+        for a, b, old_id in reader:
+            if old_id not in new_ids:
+                key = geo_key(old_id, current_mapping[old_id], current_records)
+                if key not in reverse_mapping:
+                    reverse_mapping[key] = len(mapping)
+                    mapping[len(mapping)] = key[:2]
+                    if records is not None:
+                        records.rows[len(mapping) - 1] = key[2:]
+                new_ids[old_id] = reverse_mapping[key]
+
+            if policy == MERGE_FIRST:
+                priority = (file_index,)
+            elif policy == MERGE_LAST:
+                priority = (-file_index,)
+            else:
+                priority = (b - a, file_index)
+            yield a, b, priority, new_ids[old_id]
+
+    with ExitStack() as stack:
+        readers = [stack.enter_context(CdbReader(path)) for path in filepaths]
+        yield from resolve_overlaps(
+            heapq.merge(
+                *(remapped(reader, i) for i, reader in enumerate(readers)),
+                key=itemgetter(0),
+            )
+        )
+
+
+def resolve_overlaps(
+    ranges: Iterable[tuple[int, int, tuple, int]],
+) -> Iterator[tuple[int, int, int]]:
+    active = []
+    position = None
+    pending = None
+
+    def emit_until(limit: int | None):
+        nonlocal position, pending
+        while active and (limit is None or position < limit):
+            _, seq, end, geo_id = active[0]
+            if end < position:
+                heapq.heappop(active)
+                continue
+
+            segment_end = end if limit is None else min(end, limit - 1)
+            if pending and pending[3] == seq and pending[1] + 1 == position:
+                pending[1] = segment_end
+            else:
+                if pending:
+                    yield tuple(pending[:3])
+                pending = [position, segment_end, geo_id, seq]
+            position = segment_end + 1
+
+    for seq, (start, end, priority, geo_id) in enumerate(ranges):
+        if position is not None:
+            yield from emit_until(start)
+        position = start
+        heapq.heappush(active, (priority, seq, end, geo_id))
+
+    yield from emit_until(None)
+    if pending:
+        yield tuple(pending[:3])
+
+
+def _resolve_sorted(
+    triples: Iterable[tuple[int, int, int]],
+) -> Iterator[tuple[int, int, int]]:
+    # Where sorted ranges overlap, the later one wins, as with MERGE_LAST.
+    # Files, GeoIndex and search_geo all resolve overlaps this way.
+    return resolve_overlaps((a, b, (-i,), c) for i, (a, b, c) in enumerate(triples))
+
+
+def _has_overlaps(triples: Iterable[tuple[int, int, int]]) -> bool:
+    reach = None
+    for start, end, _ in triples:
+        if reach is not None and start <= reach:
+            return True
+        reach = end if reach is None else max(reach, end)
+    return False
+
+
+def _overlapping(starts: np.ndarray, ends: np.ndarray) -> bool:
+    return bool((starts[1:] <= np.maximum.accumulate(ends)[:-1]).any())
 
 
 def read_cdb(
     filepath: str,
 ) -> tuple[list[tuple[int, int, int], dict[int, tuple[str, str]]]]:
+    return _read_file(filepath, deserialize)
+
+
+def read_cdb_arrays(
+    filepath: str,
+) -> tuple[np.ndarray, np.ndarray, dict[int, tuple[str, str]]]:
+    return _read_file(filepath, deserialize_arrays)
+
+
+def _read_file(filepath: str, decode):
     if not os.path.exists(filepath):
         raise FileNotFoundError(f"File {filepath} not exists")
 
-    with open(filepath, "rb") as file:
-        return deserialize(file.read())
+    recorder = metrics.active
+    if recorder is None:
+        with open(filepath, "rb") as file:
+            return decode(file.read())
+
+    start = time.perf_counter()
+    try:
+        with open(filepath, "rb") as file:
+            buf = file.read()
+        result = decode(buf)
+    except Exception:
+        recorder.record_load(0.0, error=True)
+        raise
+    recorder.record_load(time.perf_counter() - start)
+    recorder.inc("bytes_read_total", len(buf))
+    return result
 
 
 def write_cdb(
-    ips: list[tuple[int, int, int]], mapping: dict[int, tuple[str, str]], filepath: str
+    ips: list[tuple[int, int, int]],
+    mapping: dict[int, tuple[str, str]],
+    filepath: str,
+    version: int = FORMAT_VERSION,
+    jump_table: bool = False,
+    records: GeoRecords | None = None,
+    compress: bool = False,
 ):
-    with open(filepath, "wb") as file:
-        file.write(serialize(ips, mapping))
+    data = serialize(ips, mapping, version, jump_table, records, compress)
+    with _replace_file(filepath) as file:
+        file.write(data)
+
+
+@contextmanager
+def _replace_file(filepath: str) -> Iterator[BinaryIO]:
+    # Readers map .cdb files, so files are never rewritten in place: the new
+    # content goes to a temporary file that atomically replaces the old one.
+    tmp_path = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as file:
+            yield file
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class CdbWriter:
+    def __init__(
+        self,
+        filepath: str,
+        buffer_size: int = 1 << 16,
+        tmp_dir: str | None = None,
+        compact: bool = False,
+        jump_table: bool = False,
+        compress: bool = False,
+    ):
+        if compress and jump_table:
+            raise ValueError("Compressed files have no jump table")
+        self.filepath = filepath
+        self.count = 0
+        self.removed = 0
+        self._compact = compact
+        self._jump_table = jump_table
+        self._compress = compress
+        self._tmp_dir = tmp_dir
+        self._ipv4 = _RangeSpool(False, buffer_size, tmp_dir)
+        self._ipv6 = _RangeSpool(True, buffer_size, tmp_dir)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def add(self, start: int, end: int, geo_id: int):
+        try:
+            if end <= IPV4_MAX:
+                self._ipv4.append((start, end, geo_id))
+            elif start > IPV4_MAX:
+                self._ipv6.append(
+                    (*divmod(start, 1 << 64), *divmod(end, 1 << 64), geo_id)
+                )
+            else:
+                self.add(start, IPV4_MAX, geo_id)
+                self.add(IPV4_MAX + 1, end, geo_id)
+                return
+        except OverflowError as e:
+            raise ValueError(
+                f"Range ({start}, {end}, {geo_id}) does not fit "
+                f"format version {FORMAT_VERSION}: {e}"
+            ) from None
+        self.count += 1
+
+    def add_array(self, ranges: np.ndarray):
+        # (n, 3) arrays hold IPv4 ranges, (n, 5) arrays IPv6 ranges split
+        # into (start_high, start_low, end_high, end_low, geo) words.
+        spool = self._ipv6 if ranges.shape[1] == 5 else self._ipv4
+        spool.extend_array(ranges)
+        self.count += len(ranges)
+
+    def extend(self, triples: Iterable[tuple[int, int, int]]):
+        for start, end, geo_id in triples:
+            self.add(start, end, geo_id)
+
+    def finish(
+        self, mapping: dict[int, tuple[str, str]], records: GeoRecords | None = None
+    ):
+        self._ipv4.flush()
+        self._ipv6.flush()
+        try:
+            geo_sections = _serialize_geos(mapping, records)
+        except OverflowError as e:
+            raise ValueError(
+                f"Geo ids do not fit format version {FORMAT_VERSION}: {e}"
+            ) from None
+
+        columns = [tempfile.TemporaryFile(dir=self._tmp_dir) for _ in range(9)]
+        try:
+            self.removed = self._ipv4.write_columns(columns[:3], self._compact)
+            self.removed += self._ipv6.write_columns(columns[3:6], self._compact)
+            if self._compress:
+                _compress_columns(columns[:3], columns[6:])
+                sections = [
+                    (SECTION_BLOCK_STARTS, columns[6]),
+                    (SECTION_BLOCK_OFFSETS, columns[7]),
+                    (SECTION_BLOCKS, columns[8]),
+                ]
+            else:
+                sections = [
+                    (SECTION_STARTS, columns[0]),
+                    (SECTION_ENDS, columns[1]),
+                    (SECTION_GEO_IDS, columns[2]),
+                ]
+            sections += [(tag, io.BytesIO(data)) for tag, data in geo_sections]
+            ipv6_count = _file_size(columns[3]) // 16
+            if ipv6_count:
+                sections += [
+                    (SECTION_STARTS6, columns[3]),
+                    (SECTION_ENDS6, columns[4]),
+                    (SECTION_GEO_IDS6, columns[5]),
+                ]
+            if self._jump_table:
+                sections.append(
+                    (SECTION_JUMP, io.BytesIO(_column_jump_table(columns[0])))
+                )
+            written = _file_size(columns[0]) // 4
+            header, offsets = _layout_sections(
+                FLAG_SORTED | FLAG_COMPRESSED if self._compress else FLAG_SORTED,
+                written,
+                len(mapping),
+                [(tag, _file_size(data)) for tag, data in sections],
+            )
+            checksums = []
+            with _replace_file(self.filepath) as file:
+                file.write(header)
+                for (tag, data), offset in zip(sections, offsets):
+                    file.write(b"\0" * (offset - file.tell()))
+                    data.seek(0)
+                    checksum = 0
+                    while chunk := data.read(1 << 20):
+                        checksum = zlib.crc32(chunk, checksum)
+                        file.write(chunk)
+                    checksums.append((tag, checksum))
+                file.write(b"\0" * (offsets[-1] - file.tell()))
+                file.write(_checksum_section(header, checksums)[1])
+        finally:
+            for column in columns:
+                column.close()
+            self.close()
+
+    def close(self):
+        self._ipv4.close()
+        self._ipv6.close()
+
+
+class _RangeSpool:
+    # Buffers ranges of one address family and spills sorted runs to
+    # temporary files. IPv6 bounds are stored as (high, low) uint64 words.
+    def __init__(self, wide: bool, buffer_size: int, tmp_dir: str | None):
+        self._wide = wide
+        self._typecode = "Q" if wide else "I"
+        self._width = 5 if wide else 3
+        self._columns = (
+            ((slice(0, 2), "<u8"), (slice(2, 4), "<u8"), (slice(4, 5), "<u4"))
+            if wide
+            else ((slice(0, 1), "<u4"), (slice(1, 2), "<u4"), (slice(2, 3), "<u4"))
+        )
+        self._limit = buffer_size * self._width
+        self._tmp_dir = tmp_dir
+        self._chunk = array(self._typecode)
+        self._runs = []
+        self._run_end = None
+        self._reach = None
+        self._overlaps = False
+
+    def append(self, row: tuple[int, ...]):
+        size = len(self._chunk)
+        try:
+            self._chunk.extend(row)
+        except OverflowError:
+            del self._chunk[size:]
+            raise
+        if len(self._chunk) >= self._limit:
+            self.flush()
+
+    def extend_array(self, ranges: np.ndarray):
+        if len(ranges) and (
+            ranges.min() < 0 or ranges.max() > np.iinfo(self._typecode).max
+        ):
+            raise ValueError(f"Ranges do not fit format version {FORMAT_VERSION}")
+        self._chunk.frombytes(
+            np.ascontiguousarray(ranges, dtype=self._typecode).tobytes()
+        )
+        if len(self._chunk) >= self._limit:
+            self.flush()
+
+    def flush(self):
+        if not self._chunk:
+            return
+
+        ranges = np.frombuffer(self._chunk, dtype=self._typecode).reshape(
+            -1, self._width
+        )
+        if not _is_sorted_ranges(ranges):
+            ranges = ranges[np.lexsort(ranges.T[::-1])]
+        self._chunk = array(self._typecode)
+
+        first, last = tuple(ranges[0].tolist()), tuple(ranges[-1].tolist())
+        if self._run_end is None or first < self._run_end:
+            self._runs.append(tempfile.TemporaryFile(dir=self._tmp_dir))
+            self._reach = None
+        self._runs[-1].write(ranges.tobytes())
+        self._run_end = last
+
+        starts, ends = self._bounds(ranges)
+        if (self._reach is not None and starts[0] <= self._reach) or _overlapping(
+            starts, ends
+        ):
+            self._overlaps = True
+        reach = ends.max()
+        self._reach = reach if self._reach is None else max(self._reach, reach)
+
+    def write_columns(self, columns: list[BinaryIO], compact: bool) -> int:
+        # Returns the number of ranges merged away by compaction.
+        for run in self._runs:
+            run.seek(0)
+
+        resolve = self._overlaps or len(self._runs) > 1
+        if len(self._runs) <= 1 and not compact and not resolve:
+            chunks = self._read_chunks(self._runs[0]) if self._runs else ()
+        else:
+            triples = self._to_triples(
+                heapq.merge(*(self._read_rows(run) for run in self._runs))
+            )
+            if resolve:
+                triples = _resolve_sorted(triples)
+            if compact:
+                triples = _counted(triples, counts := [0])
+                triples = compact_ranges(triples)
+            chunks = self._pack_chunks(self._to_rows(triples))
+
+        written = 0
+        for chunk in chunks:
+            rows = np.frombuffer(chunk, dtype=self._typecode).reshape(-1, self._width)
+            for column, (part, dtype) in zip(columns, self._columns):
+                column.write(rows[:, part].astype(dtype).tobytes())
+            written += len(rows)
+        return counts[0] - written if compact else 0
+
+    def close(self):
+        for run in self._runs:
+            run.close()
+        self._runs = []
+        self._chunk = array(self._typecode)
+        self._run_end = self._reach = None
+        self._overlaps = False
+
+    def _bounds(self, ranges: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        if not self._wide:
+            return ranges[:, 0].astype(np.int64), ranges[:, 1].astype(np.int64)
+        words = ranges.astype(object)
+        return words[:, 0] << 64 | words[:, 1], words[:, 2] << 64 | words[:, 3]
+
+    def _read_chunks(self, run: BinaryIO) -> Iterator[array]:
+        while data := run.read(self._limit * self._chunk.itemsize):
+            chunk = array(self._typecode)
+            chunk.frombytes(data)
+            yield chunk
+
+    def _read_rows(self, run: BinaryIO) -> Iterator[tuple[int, ...]]:
+        width = self._width
+        for chunk in self._read_chunks(run):
+            yield from zip(*(chunk[i::width] for i in range(width)))
+
+    def _pack_chunks(self, rows: Iterable[tuple[int, ...]]) -> Iterator[array]:
+        chunk = array(self._typecode)
+        for row in rows:
+            chunk.extend(row)
+            if len(chunk) >= self._limit:
+                yield chunk
+                chunk = array(self._typecode)
+        if chunk:
+            yield chunk
+
+    def _to_triples(
+        self, rows: Iterable[tuple[int, ...]]
+    ) -> Iterable[tuple[int, int, int]]:
+        if not self._wide:
+            return rows
+        return ((a << 64 | b, c << 64 | d, e) for a, b, c, d, e in rows)
+
+    def _to_rows(
+        self, triples: Iterable[tuple[int, int, int]]
+    ) -> Iterable[tuple[int, ...]]:
+        if not self._wide:
+            return triples
+        return (
+            (*divmod(start, 1 << 64), *divmod(end, 1 << 64), geo_id)
+            for start, end, geo_id in triples
+        )
+
+
+def _counted(items: Iterable, counts: list[int]) -> Iterator:
+    for item in items:
+        counts[0] += 1
+        yield item
+
+
+def _is_sorted_ranges(ranges: np.ndarray) -> bool:
+    previous, current = ranges[:-1], ranges[1:]
+    out_of_order = np.zeros(len(current), dtype=bool)
+    equal = np.ones(len(current), dtype=bool)
+    for column in range(ranges.shape[1]):
+        out_of_order |= equal & (previous[:, column] > current[:, column])
+        equal &= previous[:, column] == current[:, column]
+    return not out_of_order.any()
+
+
+def _column_jump_table(starts: BinaryIO) -> bytes:
+    counts = np.zeros(1 << JUMP_BITS, dtype=np.int64)
+    starts.seek(0)
+    while data := starts.read(1 << 20):
+        prefixes = np.frombuffer(data, dtype="<u4") >> (32 - JUMP_BITS)
+        counts += np.bincount(prefixes, minlength=len(counts))
+    table = np.concatenate(([0], np.cumsum(counts)))
+    return table.astype("<u4").tobytes()
+
+
+def _compress_columns(columns: list[BinaryIO], blocks: list[BinaryIO]):
+    # Encodes the IPv4 column files into block starts, block offsets and
+    # block data, a whole number of blocks at a time.
+    for column in columns:
+        column.seek(0)
+    position = 0
+    size = 4 * BLOCK_SIZE * (1 << 13)
+    while starts := columns[0].read(size):
+        data = (starts, columns[1].read(size), columns[2].read(size))
+        ranges = np.stack([np.frombuffer(part, dtype="<u4") for part in data], 1)
+        block_starts, offsets, chunk = _encode_blocks(ranges.astype(np.int64))
+        blocks[0].write(block_starts.astype("<u4").tobytes())
+        blocks[1].write((offsets[:-1] + position).astype("<u4").tobytes())
+        blocks[2].write(chunk)
+        position += len(chunk)
+    if position > IPV4_MAX:
+        raise ValueError(f"Block data does not fit format version {FORMAT_VERSION}")
+    blocks[1].write(struct.pack("<I", position))
+
+
+def _file_size(file: BinaryIO) -> int:
+    return file.seek(0, io.SEEK_END)
@@ -0,0 +1,506 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from itertools import islice
+from collections.abc import Iterator, Sequence
+from typing import TextIO
+
+import numpy as np
+
+from .cdb import (
+    DEFAULT_LANGUAGE,
+    FORMAT_VERSION,
+    GEO_FIELDS,
+    LEGACY_VERSION,
+    MERGE_FIRST,
+    MERGE_POLICIES,
+    SECTION_FIELDS,
+    UNKNOWN_GEO,
+    UNKNOWN_GEO_ID,
+    _ipv6_range_count,
+    _read_header,
+    _record_layout,
+    cidr_to_int,
+    compact_cdb,
+    is_legacy_format,
+    merge_cdbs_and_save,
+    mmdb_file_to_cdb,
+    search_geo_batch,
+)
+from .overlay import LayeredCdb, fold_overlays, write_overlay
+from .reader import CdbReader
+from .server import add_serve_arguments, run_serve
+from .validation import (
+    DEFAULT_SAMPLES,
+    VALIDATE_FULL,
+    VALIDATE_HEADER,
+    VALIDATION_MODES,
+    validate_cdb,
+)
+
+LOOKUP_BATCH_SIZE = 1 << 16
+FORMATS = ("tsv", "jsonl")
+
+_TSV_ESCAPES = str.maketrans("\t\r\n", "   ")
+
+
+def describe_cdb(filepath: str) -> dict:
+    with open(filepath, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if not size:
+            raise ValueError(f"File {filepath} is empty")
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            if is_legacy_format(buf):
+                return _describe_legacy(buf, size, filepath)
+
+            flags, range_count, geo_count, sections = _read_header(buf)
+            fields = {}
+            if SECTION_FIELDS in sections:
+                offset, length = sections[SECTION_FIELDS]
+                fields, _ = _record_layout(buf[offset : offset + length], geo_count)
+            return {
+                "version": FORMAT_VERSION,
+                "flags": flags,
+                "ranges": range_count,
+                "ranges6": _ipv6_range_count(sections),
+                "geos": geo_count,
+                "fields": list(fields),
+                "size": size,
+                "sections": [
+                    {"tag": tag.decode(), "offset": offset, "size": length}
+                    for tag, (offset, length) in sections.items()
+                ],
+            }
+
+
+def _describe_legacy(buf: mmap.mmap, size: int, filepath: str) -> dict:
+    # Every geo takes at least 12 bytes: its id and two string lengths.
+    # Counts that do not fit are rejected before the geos are walked.
+    range_count = struct.unpack_from("<I", buf, 0)[0] if size >= 4 else 0
+    mapping_offset = 4 + range_count * 24
+    if size < mapping_offset + 4:
+        raise ValueError(f"File {filepath} is truncated")
+    (geo_count,) = struct.unpack_from("<I", buf, mapping_offset)
+    end = mapping_offset + 4
+    if size < end + geo_count * 12:
+        raise ValueError(f"File {filepath} is truncated")
+    for _ in range(geo_count):
+        end += 8
+        for _ in range(2):
+            if size < end + 2:
+                raise ValueError(f"File {filepath} is truncated")
+            end += 2 + struct.unpack_from("<H", buf, end)[0]
+    if size < end:
+        raise ValueError(f"File {filepath} is truncated")
+    return {
+        "version": LEGACY_VERSION,
+        "flags": 0,
+        "ranges": range_count,
+        "ranges6": 0,
+        "geos": geo_count,
+        "fields": [],
+        "size": size,
+        "sections": [
+            {"tag": "ranges", "offset": 4, "size": range_count * 24},
+            {"tag": "mapping", "offset": mapping_offset, "size": size - mapping_offset},
+        ],
+    }
+
+
+def read_changes(
+    source: TextIO,
+) -> Iterator[tuple[str, tuple[str, str] | None]]:
+    # "network<TAB>country<TAB>city" sets a geo, a bare network deletes it.
+    for number, line in enumerate(source, 1):
+        line = line.rstrip("\r\n")
+        if not line.strip() or line.startswith("#"):
+            continue
+        network, *geo = line.split("\t")
+        if not geo:
+            yield network.strip(), None
+        elif len(geo) == 2:
+            yield network.strip(), (geo[0], geo[1])
+        else:
+            raise ValueError(
+                f"Line {number}: expected network, country and city "
+                "separated by tabs, or a single network to delete"
+            )
+
+
+def lookup_stream(
+    reader: CdbReader | LayeredCdb,
+    source: TextIO,
+    output: TextIO,
+    output_format: str = "tsv",
+    field: int | None = None,
+    delimiter: str | None = None,
+    batch_size: int = LOOKUP_BATCH_SIZE,
+    fields: Sequence[str] = (),
+) -> int:
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown output format {output_format!r}")
+
+    records = reader.records
+    missing = [f for f in fields if records is None or f not in records.fields]
+    if missing:
+        raise ValueError(f"File has no geo fields {', '.join(missing)}")
+
+    # Output suffixes are rendered once per geo, so a row costs one string
+    # concatenation on top of the batch lookup.
+    if output_format == "tsv":
+        render = _tsv_suffix
+    else:
+        render = _jsonl_suffix
+    suffixes = {
+        geo_id: render(geo, {f: _plain(records.value(geo_id, f)) for f in fields})
+        for geo_id, geo in reader.mapping.items()
+    }
+    unknown = render(UNKNOWN_GEO, dict.fromkeys(fields))
+
+    rows = 0
+    while True:
+        lines = [line.rstrip("\r\n") for line in islice(source, batch_size)]
+        if not lines:
+            return rows
+
+        if field is None:
+            ips = [line.strip() for line in lines]
+        else:
+            ips = [_field(line, field, delimiter) for line in lines]
+        ids = _lookup_ids(reader, ips).tolist()
+        geos = [suffixes.get(geo_id, unknown) for geo_id in ids]
+
+        if output_format == "tsv":
+            output.write("".join([line + geo for line, geo in zip(lines, geos)]))
+        elif field is None:
+            output.write(
+                "".join(
+                    [f'{{"ip": {json.dumps(ip)}{geo}' for ip, geo in zip(ips, geos)]
+                )
+            )
+        else:
+            output.write(
+                "".join(
+                    [
+                        f'{{"line": {json.dumps(line)}, "ip": {json.dumps(ip)}{geo}'
+                        for line, ip, geo in zip(lines, ips, geos)
+                    ]
+                )
+            )
+        rows += len(lines)
+
+
+def _tsv_suffix(geo: tuple[str, str], extra: dict) -> str:
+    values = [*geo, *("" if value is None else str(value) for value in extra.values())]
+    return "".join("\t" + value.translate(_TSV_ESCAPES) for value in values) + "\n"
+
+
+def _jsonl_suffix(geo: tuple[str, str], extra: dict) -> str:
+    country, city = geo
+    values = json.dumps({"country": country, "city": city, **extra})
+    return f", {values[1:]}\n"
+
+
+def _plain(value):
+    # NaN has no JSON form, missing coordinates are written as null.
+    return None if isinstance(value, float) and value != value else value
+
+
+def _field(line: str, field: int, delimiter: str | None) -> str:
+    fields = line.split(delimiter, field)
+    return fields[field - 1].strip() if len(fields) >= field else ""
+
+
+def _lookup_ids(reader: CdbReader, ips: list[str]) -> np.ndarray:
+    try:
+        return search_geo_batch(reader, ips, geo_ids=True)
+    except ValueError:
+        pass
+
+    # A malformed address in the batch, only the valid ones are looked up
+    # and the rest are reported as unknown.
+    valid = []
+    for i, ip in enumerate(ips):
+        try:
+            cidr_to_int(ip, with_broadcast=False)
+        except ValueError:
+            continue
+        valid.append(i)
+
+    ids = np.full(len(ips), UNKNOWN_GEO_ID, dtype=np.int64)
+    if valid:
+        ids[valid] = search_geo_batch(reader, [ips[i] for i in valid], geo_ids=True)
+    return ids
+
+
+def _print_summary(filepath: str):
+    info = describe_cdb(filepath)
+    print(
+        f"{filepath}: {info['ranges'] + info['ranges6']} ranges, "
+        f"{info['geos']} geos, {info['size']} bytes",
+        file=sys.stderr,
+    )
+
+
+def run_convert(args: argparse.Namespace):
+    mmdb_file_to_cdb(
+        args.mmdb,
+        args.output,
+        args.workers,
+        args.compact,
+        args.jump_table,
+        args.fields,
+        args.language,
+        args.compress,
+    )
+    _print_summary(args.output)
+
+
+def run_merge(args: argparse.Namespace):
+    merge_cdbs_and_save(
+        args.output,
+        *args.inputs,
+        policy=args.policy,
+        compact=args.compact,
+        jump_table=args.jump_table,
+        compress=args.compress,
+    )
+    _print_summary(args.output)
+
+
+def run_compact(args: argparse.Namespace):
+    removed = compact_cdb(args.path, args.output, args.jump_table, args.compress)
+    print(f"Removed {removed} ranges", file=sys.stderr)
+    _print_summary(args.output or args.path)
+
+
+def run_overlay(args: argparse.Namespace):
+    if args.input in (None, "-"):
+        count = write_overlay(args.output, read_changes(sys.stdin))
+    else:
+        with open(args.input) as source:
+            count = write_overlay(args.output, read_changes(source))
+    print(f"Wrote {count} ranges", file=sys.stderr)
+
+
+def run_fold(args: argparse.Namespace):
+    removed = fold_overlays(
+        args.output,
+        args.base,
+        *args.overlays,
+        compact=args.compact,
+        jump_table=args.jump_table,
+        compress=args.compress,
+    )
+    if args.compact:
+        print(f"Removed {removed} ranges", file=sys.stderr)
+    _print_summary(args.output)
+
+
+def run_inspect(args: argparse.Namespace):
+    info = describe_cdb(args.path)
+    if args.json:
+        print(json.dumps(info, indent=2))
+        return
+
+    print(f"version: {info['version']}")
+    print(f"flags: {info['flags']:#x}")
+    print(f"ranges: {info['ranges']} IPv4, {info['ranges6']} IPv6")
+    print(f"geos: {info['geos']}")
+    if info["fields"]:
+        print(f"fields: {', '.join(info['fields'])}")
+    print(f"size: {info['size']}")
+    for section in info["sections"]:
+        print(f"  {section['tag']:<8} {section['offset']:>12} {section['size']:>12}")
+
+
+def run_validate(args: argparse.Namespace):
+    report = validate_cdb(args.path, args.mode, args.samples)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    if not report["checksums"]:
+        checksums = "no checksums"
+    elif report["mode"] == VALIDATE_HEADER:
+        checksums = "header checksum verified"
+    else:
+        checksums = "checksums verified"
+    print(
+        f"{args.path}: ok ({report['mode']}), {report['ranges']} ranges, "
+        f"{report['checked_ranges']} checked, {checksums}"
+    )
+
+
+def run_lookup(args: argparse.Namespace):
+    if args.overlay:
+        opened = LayeredCdb(args.path, *args.overlay)
+    else:
+        opened = CdbReader(args.path)
+    with opened as reader:
+        if args.input in (None, "-"):
+            lookup_stream(
+                reader,
+                sys.stdin,
+                sys.stdout,
+                args.format,
+                args.field,
+                args.delimiter,
+                args.batch_size,
+                args.fields,
+            )
+        else:
+            with open(args.input) as source:
+                lookup_stream(
+                    reader,
+                    source,
+                    sys.stdout,
+                    args.format,
+                    args.field,
+                    args.delimiter,
+                    args.batch_size,
+                    args.fields,
+                )
+
+
+def _field_list(value: str) -> list[str]:
+    fields = [field for field in value.split(",") if field]
+    for field in fields:
+        if field not in GEO_FIELDS:
+            raise argparse.ArgumentTypeError(f"unknown geo field {field!r}")
+    return fields
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cdb")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert = commands.add_parser("convert", help="convert an .mmdb file")
+    convert.add_argument("mmdb", help="path to the .mmdb file")
+    convert.add_argument("output", help="path to the output .cdb file")
+    convert.add_argument("--workers", type=int, default=1)
+    convert.add_argument("--compact", action="store_true")
+    convert.add_argument("--jump-table", action="store_true")
+    convert.add_argument(
+        "--compress", action="store_true", help="store IPv4 ranges in blocks"
+    )
+    convert.add_argument(
+        "--fields",
+        type=_field_list,
+        default=(),
+        help=f"extra geo fields, comma separated: {', '.join(GEO_FIELDS)}",
+    )
+    convert.add_argument(
+        "--language",
+        default=DEFAULT_LANGUAGE,
+        help="preferred language of names (default %(default)s)",
+    )
+    convert.set_defaults(run=run_convert)
+
+    merge = commands.add_parser("merge", help="merge .cdb files")
+    merge.add_argument("output", help="path to the output .cdb file")
+    merge.add_argument("inputs", nargs="+", help="files in priority order")
+    merge.add_argument("--policy", choices=MERGE_POLICIES, default=MERGE_FIRST)
+    merge.add_argument("--compact", action="store_true")
+    merge.add_argument("--jump-table", action="store_true")
+    merge.add_argument(
+        "--compress", action="store_true", help="store IPv4 ranges in blocks"
+    )
+    merge.set_defaults(run=run_merge)
+
+    compact = commands.add_parser("compact", help="coalesce adjacent ranges")
+    compact.add_argument("path", help="path to the .cdb file")
+    compact.add_argument("-o", "--output", help="output path, in place by default")
+    compact.add_argument("--jump-table", action="store_true")
+    compact.add_argument(
+        "--compress", action="store_true", help="store IPv4 ranges in blocks"
+    )
+    compact.set_defaults(run=run_compact)
+
+    overlay = commands.add_parser("overlay", help="write an overlay of network changes")
+    overlay.add_argument("output", help="path to the output overlay file")
+    overlay.add_argument(
+        "input",
+        nargs="?",
+        help="lines of network, country and city separated by tabs, or a "
+        "single network to delete; stdin by default",
+    )
+    overlay.set_defaults(run=run_overlay)
+
+    fold = commands.add_parser("fold", help="apply overlays to a base file")
+    fold.add_argument("output", help="path to the output .cdb file")
+    fold.add_argument("base", help="path to the base .cdb file")
+    fold.add_argument("overlays", nargs="+", help="overlays, later ones win")
+    fold.add_argument("--compact", action="store_true")
+    fold.add_argument("--jump-table", action="store_true")
+    fold.add_argument(
+        "--compress", action="store_true", help="store IPv4 ranges in blocks"
+    )
+    fold.set_defaults(run=run_fold)
+
+    inspect = commands.add_parser("inspect", help="show the header and sections")
+    inspect.add_argument("path", help="path to the .cdb file")
+    inspect.add_argument("--json", action="store_true")
+    inspect.set_defaults(run=run_inspect)
+
+    validate = commands.add_parser("validate", help="check a file before using it")
+    validate.add_argument("path", help="path to the .cdb file")
+    validate.add_argument("--mode", choices=VALIDATION_MODES, default=VALIDATE_FULL)
+    validate.add_argument(
+        "--samples",
+        type=int,
+        default=DEFAULT_SAMPLES,
+        help="ranges checked in sampled mode (default %(default)s)",
+    )
+    validate.add_argument("--json", action="store_true")
+    validate.set_defaults(run=run_validate)
+
+    lookup = commands.add_parser("lookup", help="look up addresses line by line")
+    lookup.add_argument("path", help="path to the .cdb file")
+    lookup.add_argument("input", nargs="?", help="input file, stdin by default")
+    lookup.add_argument("--format", choices=FORMATS, default="tsv")
+    lookup.add_argument(
+        "--field", type=int, help="take the address from this 1-based field"
+    )
+    lookup.add_argument("--delimiter", help="field delimiter, whitespace by default")
+    lookup.add_argument("--batch-size", type=int, default=LOOKUP_BATCH_SIZE)
+    lookup.add_argument(
+        "--fields",
+        type=_field_list,
+        default=(),
+        help="geo fields of the file to add after country and city",
+    )
+    lookup.add_argument(
+        "--overlay",
+        action="append",
+        default=[],
+        help="overlay file to apply, may be repeated; later ones win",
+    )
+    lookup.set_defaults(run=run_lookup)
+
+    serve = commands.add_parser("serve", help="run a lookup server")
+    add_serve_arguments(serve)
+    serve.set_defaults(run=run_serve)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, "field", None) is not None and args.field < 1:
+        parser.error("--field must be 1 or greater")
+
+    try:
+        args.run(args)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader of a shell pipeline (e.g. head) went away.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    except (OSError, ValueError, struct.error) as e:
+        print(f"cdb: {e}", file=sys.stderr)
+        return 1
+    return 0
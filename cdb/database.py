@@ -0,0 +1,168 @@
+import os
+import struct
+import threading
+from collections.abc import Sequence
+
+import numpy as np
+
+from . import metrics
+from .cdb import RecordTable, _lookup
+from .overlay import LayeredCdb
+from .reader import CdbReader
+
+
+def _open_reader(
+    filepath: str,
+    jump_table: bool,
+    overlays: Sequence[str] = (),
+    validate: str | None = None,
+) -> CdbReader | LayeredCdb:
+    # Decodes the geo table up front, so the first lookup after a load does
+    # not pay for it on the caller's thread.
+    if overlays:
+        reader = LayeredCdb(
+            filepath, *overlays, jump_table=jump_table, validate=validate
+        )
+    else:
+        reader = CdbReader(filepath, jump_table, validate)
+    try:
+        reader.mapping
+    except Exception:
+        reader.close()
+        raise
+    return reader
+
+
+def _file_signature(filepath: str) -> tuple[int, int, int, int]:
+    stat = os.stat(filepath)
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _reload(source, force: bool, load, swap) -> bool:
+    # Loads a new version only when the files changed. A version that fails
+    # to load is not retried until they change again, and the current one
+    # stays in use.
+    with source._lock:
+        signature = None
+        try:
+            signature = source._signatures()
+            if not force and signature in (
+                source._signature,
+                source._failed_signature,
+            ):
+                return False
+            loaded = load()
+        except (OSError, ValueError, struct.error) as e:
+            source.last_error = e
+            source._failed_signature = signature
+            recorder = metrics.active
+            if recorder is not None:
+                recorder.inc("reload_errors_total")
+            return False
+
+        swap(loaded)
+        source._signature = signature
+        source.last_error = None
+        recorder = metrics.active
+        if recorder is not None:
+            recorder.inc("reloads_total")
+        return True
+
+
+class CdbDatabase:
+    def __init__(
+        self,
+        filepath: str,
+        interval: float | None = 1.0,
+        jump_table: bool = False,
+        overlays: Sequence[str] = (),
+        validate: str | None = None,
+    ):
+        self.filepath = filepath
+        self.overlays = tuple(overlays)
+        self.last_error = None
+        self._jump_table = jump_table
+        self._validate = validate
+        self._signature = self._signatures()
+        self._failed_signature = None
+        self._state = (_open_reader(filepath, jump_table, self.overlays, validate), 0)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        if interval:
+            self._thread = threading.Thread(
+                target=self._watch, args=(interval,), name="cdb-reload", daemon=True
+            )
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def reader(self) -> CdbReader | LayeredCdb:
+        # The current version. A caller holding it keeps that version mapped
+        # after a reload; it is released once the last reference is gone.
+        return self._state[0]
+
+    @property
+    def generation(self) -> int:
+        return self._state[1]
+
+    def snapshot(self) -> tuple[CdbReader | LayeredCdb, int]:
+        return self._state
+
+    @property
+    def mapping(self) -> dict[int, tuple[str, str]]:
+        return self._state[0].mapping
+
+    @property
+    def records(self) -> RecordTable | None:
+        return self._state[0].records
+
+    def __len__(self) -> int:
+        return len(self._state[0])
+
+    def lookup_id(self, value: int) -> int | None:
+        return self._state[0].lookup_id(value)
+
+    def _resolve_id(self, value: int) -> tuple[int | None, CdbReader | LayeredCdb]:
+        reader = self._state[0]
+        return reader.lookup_id(value), reader
+
+    def lookup(self, ip: str | int) -> tuple[str, str]:
+        return _lookup(self._state[0], ip)
+
+    def lookup_record(self, ip: str | int) -> dict:
+        return self._state[0].lookup_record(ip)
+
+    def lookup_ids(self, values: np.ndarray) -> np.ndarray:
+        return self._state[0].lookup_ids(values)
+
+    def reload(self, force: bool = False) -> bool:
+        return _reload(self, force, self._load, self._swap)
+
+    def _load(self) -> CdbReader | LayeredCdb:
+        return _open_reader(
+            self.filepath, self._jump_table, self.overlays, self._validate
+        )
+
+    def _swap(self, reader: CdbReader | LayeredCdb):
+        self._state = (reader, self._state[1] + 1)
+
+    def _signatures(self) -> tuple[tuple[int, int, int, int], ...]:
+        # Replacing an overlay reloads the whole stack like replacing the base.
+        return tuple(map(_file_signature, (self.filepath, *self.overlays)))
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        self._state[0].close()
+
+    def _watch(self, interval: float):
+        while not self._stopped.wait(interval):
+            self.reload()
@@ -0,0 +1,181 @@
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds in seconds, from 1µs to about 4s.
+DEFAULT_BUCKETS = tuple(1e-6 * 4**i for i in range(12))
+
+COUNTERS = {
+    "loads_total": "Files loaded",
+    "load_errors_total": "Files that failed to load",
+    "bytes_read_total": "Bytes read into memory by read_cdb",
+    "lookups_total": "Addresses looked up",
+    "lookup_misses_total": "Addresses without a geo",
+    "batches_total": "Batch lookups",
+    "cache_hits_total": "LookupCache hits",
+    "cache_misses_total": "LookupCache misses",
+    "reloads_total": "Successful reloads of CdbDatabase and SharedCdb",
+    "reload_errors_total": "Failed reloads of CdbDatabase and SharedCdb",
+    "merges_total": "Merges",
+    "merged_ranges_total": "Ranges written by merges",
+}
+GAUGES = {
+    "bytes_mapped": "Bytes of .cdb files mapped by open readers",
+}
+HISTOGRAMS = {
+    "load_seconds": "Time to open or read a file",
+    "lookup_seconds": "Time of a single lookup",
+    "batch_seconds": "Time of a batch lookup",
+    "merge_seconds": "Time of a merge",
+}
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the quantile.
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if count and seen >= target:
+                return bound
+        return self.buckets[-1] if self.count else 0.0
+
+
+class Metrics:
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.monotonic()
+            self.counters = dict.fromkeys(COUNTERS, 0)
+            self.gauges = dict.fromkeys(GAUGES, 0)
+            self.histograms = {name: Histogram(self._buckets) for name in HISTOGRAMS}
+
+    def inc(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def add(self, name: str, value: int):
+        with self._lock:
+            self.gauges[name] += value
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            self.histograms[name].observe(seconds)
+
+    def record_load(self, seconds: float, error: bool = False):
+        with self._lock:
+            if error:
+                self.counters["load_errors_total"] += 1
+            else:
+                self.counters["loads_total"] += 1
+                self.histograms["load_seconds"].observe(seconds)
+
+    def record_lookup(self, seconds: float, miss: bool):
+        with self._lock:
+            self.counters["lookups_total"] += 1
+            self.counters["lookup_misses_total"] += miss
+            self.histograms["lookup_seconds"].observe(seconds)
+
+    def record_batch(self, seconds: float, count: int, misses: int):
+        with self._lock:
+            self.counters["batches_total"] += 1
+            self.counters["lookups_total"] += count
+            self.counters["lookup_misses_total"] += misses
+            self.histograms["batch_seconds"].observe(seconds)
+
+    def record_merge(self, seconds: float, ranges: int):
+        with self._lock:
+            self.counters["merges_total"] += 1
+            self.counters["merged_ranges_total"] += ranges
+            self.histograms["merge_seconds"].observe(seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+            uptime = time.monotonic() - self.started
+            histograms = {
+                name: {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "p50": histogram.quantile(0.5),
+                    "p99": histogram.quantile(0.99),
+                }
+                for name, histogram in self.histograms.items()
+            }
+            gauges = dict(self.gauges)
+
+        lookups = counters["lookups_total"]
+        cache_requests = counters["cache_hits_total"] + counters["cache_misses_total"]
+        return {
+            **counters,
+            **gauges,
+            "uptime_seconds": uptime,
+            "lookups_per_second": lookups / uptime if uptime else 0.0,
+            "miss_rate": counters["lookup_misses_total"] / lookups if lookups else 0.0,
+            "cache_hit_rate": (
+                counters["cache_hits_total"] / cache_requests if cache_requests else 0.0
+            ),
+            "histograms": histograms,
+        }
+
+    def prometheus(self, prefix: str = "cdb") -> str:
+        lines = []
+        with self._lock:
+            for name, value in self.counters.items():
+                lines += _prometheus_header(prefix, name, "counter", COUNTERS[name])
+                lines.append(f"{prefix}_{name} {value}")
+            for name, value in self.gauges.items():
+                lines += _prometheus_header(prefix, name, "gauge", GAUGES[name])
+                lines.append(f"{prefix}_{name} {value}")
+            for name, histogram in self.histograms.items():
+                lines += _prometheus_header(prefix, name, "histogram", HISTOGRAMS[name])
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f'{prefix}_{name}_bucket{{le="{bound:g}"}} {cumulative}'
+                    )
+                lines.append(f'{prefix}_{name}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{prefix}_{name}_sum {histogram.sum!r}")
+                lines.append(f"{prefix}_{name}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _prometheus_header(prefix: str, name: str, kind: str, help: str) -> list[str]:
+    return [f"# HELP {prefix}_{name} {help}", f"# TYPE {prefix}_{name} {kind}"]
+
+
+# The instrumented paths check this once per call and skip all bookkeeping
+# while it is None.
+active: Metrics | None = None
+
+
+def enable_metrics(metrics: Metrics | None = None) -> Metrics:
+    global active
+    active = Metrics() if metrics is None else metrics
+    return active
+
+
+def disable_metrics():
+    global active
+    active = None
+
+
+def get_metrics() -> Metrics | None:
+    return active
@@ -0,0 +1,194 @@
+import heapq
+from bisect import bisect_right
+from collections.abc import Iterable, Iterator, Mapping
+from contextlib import ExitStack
+
+import numpy as np
+
+from .cdb import (
+    DELETED_GEO_ID,
+    FLAG_OVERLAY,
+    FLAG_SORTED,
+    UNKNOWN_GEO_ID,
+    CdbWriter,
+    RecordTable,
+    _geo_record,
+    _lookup,
+    _replace_file,
+    _serialize_ranges,
+    cidr_to_int,
+    compact_ranges,
+    resolve_overlaps,
+)
+from .reader import CdbReader
+
+
+def write_overlay(
+    filepath: str,
+    changes: (
+        Mapping[str | tuple[int, int], tuple[str, str] | None]
+        | Iterable[tuple[str | tuple[int, int], tuple[str, str] | None]]
+    ),
+) -> int:
+    # Changes map a network or a (start, end) range to a geo, or to None to
+    # delete it. Later changes win where networks overlap.
+    if isinstance(changes, Mapping):
+        changes = changes.items()
+
+    geo_ids = {}
+    ranges = []
+    for i, (network, geo) in enumerate(changes):
+        start, end = cidr_to_int(network) if isinstance(network, str) else network
+        if start > end:
+            raise ValueError(f"Range start {start} is greater than its end {end}")
+        if geo is None:
+            geo_id = DELETED_GEO_ID
+        else:
+            country, city = geo
+            geo_id = geo_ids.setdefault((country, city), len(geo_ids))
+        ranges.append((start, end, (-i,), geo_id))
+
+    ranges.sort(key=lambda row: row[0])
+    triples = list(compact_ranges(resolve_overlaps(ranges)))
+    mapping = {geo_id: geo for geo, geo_id in geo_ids.items()}
+    data = _serialize_ranges(triples, mapping, False, None, FLAG_SORTED | FLAG_OVERLAY)
+    with _replace_file(filepath) as file:
+        file.write(data)
+    return len(triples)
+
+
+class LayeredCdb:
+    # A base file with overlays on top, later overlays first. Geo ids of an
+    # overlay are shifted past those of the layers below, so every layer
+    # keeps its own geo table.
+    def __init__(
+        self,
+        filepath: str,
+        *overlays: str,
+        jump_table: bool = False,
+        validate: str | None = None,
+    ):
+        self.filepath = filepath
+        self.overlays = overlays
+        with ExitStack() as stack:
+            self.base = stack.enter_context(CdbReader(filepath, jump_table, validate))
+            layers = [(0, self.base.mapping)]
+            self._layers = []
+            offset = _id_limit(self.base.mapping)
+            for path in overlays:
+                reader = stack.enter_context(CdbReader(path, jump_table, validate))
+                deletes = bool(reader.flags & FLAG_OVERLAY)
+                self._layers.insert(0, (reader, offset, deletes))
+                layers.append((offset, reader.mapping))
+                offset += _id_limit(reader.mapping)
+            stack.pop_all()
+        self.mapping = _LayeredMapping(layers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.base) + sum(len(reader) for reader, _, _ in self._layers)
+
+    def __iter__(self) -> Iterator[tuple[int, int, int]]:
+        def prioritized(source: Iterable, priority: int, offset: int, deletes: bool):
+            for start, end, geo_id in source:
+                if deletes and geo_id == DELETED_GEO_ID:
+                    geo_id = UNKNOWN_GEO_ID
+                else:
+                    geo_id += offset
+                yield start, end, (priority,), geo_id
+
+        layers = [(self.base, 0, False), *self._layers[::-1]]
+        ranges = heapq.merge(
+            *(
+                prioritized(reader, -i, offset, deletes)
+                for i, (reader, offset, deletes) in enumerate(layers)
+            ),
+            key=lambda row: row[0],
+        )
+        # Deleted ranges are resolved like any other and dropped afterwards,
+        # so they hide the layers below.
+        for triple in resolve_overlaps(ranges):
+            if triple[2] != UNKNOWN_GEO_ID:
+                yield triple
+
+    @property
+    def records(self) -> RecordTable | None:
+        return self.base.records
+
+    def lookup_id(self, value: int) -> int | None:
+        for reader, offset, deletes in self._layers:
+            geo_id = reader.lookup_id(value)
+            if geo_id is not None:
+                if deletes and geo_id == DELETED_GEO_ID:
+                    return None
+                return geo_id + offset
+        return self.base.lookup_id(value)
+
+    def lookup(self, ip: str | int) -> tuple[str, str]:
+        return _lookup(self, ip)
+
+    def lookup_record(self, ip: str | int) -> dict:
+        value = ip if isinstance(ip, int) else cidr_to_int(ip, with_broadcast=False)
+        return _geo_record(self.mapping, self.records, self.lookup_id(value))
+
+    def lookup_ids(self, values: np.ndarray) -> np.ndarray:
+        ids = self.base.lookup_ids(values)
+        for reader, offset, deletes in self._layers[::-1]:
+            layer_ids = reader.lookup_ids(values)
+            found = layer_ids != UNKNOWN_GEO_ID
+            if deletes:
+                deleted = layer_ids == DELETED_GEO_ID
+                ids[deleted] = UNKNOWN_GEO_ID
+                found &= ~deleted
+            ids[found] = layer_ids[found] + offset
+        return ids
+
+    def close(self):
+        for reader, _, _ in self._layers:
+            reader.close()
+        self.base.close()
+
+
+class _LayeredMapping(Mapping):
+    def __init__(self, layers: list[tuple[int, Mapping]]):
+        self._offsets = [offset for offset, _ in layers]
+        self._mappings = [mapping for _, mapping in layers]
+
+    def __getitem__(self, geo_id: int) -> tuple[str, str]:
+        if not isinstance(geo_id, int):
+            raise KeyError(geo_id)
+        i = max(bisect_right(self._offsets, geo_id) - 1, 0)
+        return self._mappings[i][geo_id - self._offsets[i]]
+
+    def __iter__(self) -> Iterator[int]:
+        for offset, mapping in zip(self._offsets, self._mappings):
+            for geo_id in mapping:
+                yield geo_id + offset
+
+    def __len__(self) -> int:
+        return sum(map(len, self._mappings))
+
+
+def _id_limit(mapping: Mapping) -> int:
+    return max(mapping, default=-1) + 1
+
+
+def fold_overlays(
+    output_path: str,
+    filepath: str,
+    *overlays: str,
+    compact: bool = False,
+    jump_table: bool = False,
+    compress: bool = False,
+) -> int:
+    with LayeredCdb(filepath, *overlays) as layered, CdbWriter(
+        output_path, compact=compact, jump_table=jump_table, compress=compress
+    ) as writer:
+        writer.extend(layered)
+        writer.finish(dict(layered.mapping), layered.records)
+    return writer.removed
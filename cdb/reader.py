@@ -0,0 +1,344 @@
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import weakref
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from collections.abc import Mapping
+from operator import add, le
+
+import numpy as np
+
+from . import metrics
+from .cdb import (
+    BLOCK_CACHE_SIZE,
+    FLAG_COMPRESSED,
+    FLAG_SORTED,
+    FORMAT_VERSION,
+    LEGACY_VERSION,
+    IPV4_MAX,
+    RecordTable,
+    JUMP_BITS,
+    SECTION_BLOCK_OFFSETS,
+    SECTION_BLOCK_STARTS,
+    SECTION_BLOCKS,
+    SECTION_ENDS,
+    SECTION_ENDS6,
+    SECTION_GEO_IDS,
+    SECTION_GEO_IDS6,
+    SECTION_JUMP,
+    SECTION_STARTS,
+    SECTION_STARTS6,
+    _geo_table,
+    _record_table,
+    _decode_block,
+    _deserialize_mapping,
+    _geo_record,
+    _ipv4_columns,
+    _ipv6_range_count,
+    _lookup,
+    _lookup_ids,
+    _read_header,
+    build_jump_table,
+    cidr_to_int,
+    is_legacy_format,
+)
+from .validation import validate_buffer
+
+
+def _int64_view(buf: memoryview) -> memoryview:
+    return _typed_view(buf, "q")
+
+
+def _typed_view(buf: memoryview, typecode: str) -> memoryview:
+    if sys.byteorder == "little":
+        return buf.cast(typecode)
+    values = array(typecode, buf.tobytes())
+    values.byteswap()
+    return memoryview(values)
+
+
+class _Uint128Column:
+    def __init__(self, words: memoryview):
+        self._words = words
+
+    def __len__(self) -> int:
+        return len(self._words) // 2
+
+    def __getitem__(self, i: int) -> int:
+        return self._words[2 * i] << 64 | self._words[2 * i + 1]
+
+    def release(self):
+        self._words.release()
+
+
+class CdbReader:
+    def __init__(
+        self,
+        filepath: str,
+        jump_table: bool = False,
+        validate: str | None = None,
+        block_cache: int = BLOCK_CACHE_SIZE,
+    ):
+        if not os.path.exists(filepath):
+            raise FileNotFoundError(f"File {filepath} not exists")
+
+        recorder = metrics.active
+        start = time.perf_counter() if recorder is not None else 0.0
+        self.filepath = filepath
+        self._release = None
+        with open(filepath, "rb") as file:
+            if os.fstat(file.fileno()).st_size:
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._mmap = None
+
+        self._buffer = memoryview(self._mmap if self._mmap is not None else b"")
+        self._order = None
+        self._is_sorted = None
+        self._mapping = None
+        self._records = None
+        self._columns = None
+        self._jump = None
+        self._block_cache = block_cache
+        self._blocks = OrderedDict()
+        self._blocks_lock = threading.Lock()
+        try:
+            if is_legacy_format(self._buffer):
+                self._open_legacy()
+            else:
+                self._open_v2()
+            if validate is not None:
+                validate_buffer(self._buffer, validate)
+            if jump_table and self._jump is None:
+                if self.flags & FLAG_COMPRESSED:
+                    # Compressed files jump to blocks instead of ranges.
+                    table = build_jump_table(self._block_starts).astype("<u4")
+                else:
+                    self._columns = self._numpy_columns()
+                    table = build_jump_table(self._columns[0]).astype("<u4")
+                self._jump = _typed_view(memoryview(table.tobytes()), "I")
+        except Exception:
+            self.close()
+            if recorder is not None:
+                recorder.record_load(0.0, error=True)
+            raise
+
+        if recorder is not None:
+            # The gauge is decremented by the recorder that counted the file,
+            # even if metrics were switched since, on close or once a reader
+            # that was dropped without closing it is collected.
+            recorder.record_load(time.perf_counter() - start)
+            recorder.add("bytes_mapped", len(self._buffer))
+            self._release = weakref.finalize(
+                self, recorder.add, "bytes_mapped", -len(self._buffer)
+            )
+
+    def _open_legacy(self):
+        (n,) = struct.unpack_from("<I", self._buffer, 0)
+        self._mapping_offset = 4 + n * 24
+        if len(self._buffer) < self._mapping_offset + 4:
+            raise struct.error(f"File {self.filepath} is truncated")
+
+        self.version = LEGACY_VERSION
+        self.flags = 0
+        self._count = n
+        self._count6 = 0
+        self._ranges = _int64_view(self._buffer[4 : self._mapping_offset])
+        self._starts = self._ranges[0::3]
+        self._ends = self._ranges[1::3]
+        self._geo_ids = self._ranges[2::3]
+
+    def _open_v2(self):
+        self.flags, self._count, _, self._sections = _read_header(self._buffer)
+        self.version = FORMAT_VERSION
+        if self.flags & FLAG_COMPRESSED:
+            self._block_starts = self._section_view(SECTION_BLOCK_STARTS)
+            self._block_offsets = self._section_view(SECTION_BLOCK_OFFSETS)
+            offset, length = self._sections[SECTION_BLOCKS]
+            self._block_data = self._buffer[offset : offset + length]
+        else:
+            self._starts = self._section_view(SECTION_STARTS)
+            self._ends = self._section_view(SECTION_ENDS)
+            self._geo_ids = self._section_view(SECTION_GEO_IDS)
+        self._count6 = _ipv6_range_count(self._sections)
+        self._starts6 = _Uint128Column(self._section_view(SECTION_STARTS6, "Q"))
+        self._ends6 = _Uint128Column(self._section_view(SECTION_ENDS6, "Q"))
+        self._geo_ids6 = self._section_view(SECTION_GEO_IDS6)
+        if SECTION_JUMP in self._sections:
+            self._jump = self._section_view(SECTION_JUMP)
+        if self.flags & FLAG_SORTED:
+            self._is_sorted = True
+
+    def _section_view(self, tag: bytes, typecode: str = "I") -> memoryview:
+        offset, length = self._sections.get(tag, (0, 0))
+        return _typed_view(self._buffer[offset : offset + length], typecode)
+
+    def __len__(self) -> int:
+        return self._count + self._count6
+
+    def __iter__(self):
+        if self.flags & FLAG_COMPRESSED:
+            for block in range(len(self._block_starts)):
+                starts, lengths, geo_ids = self._decode_block(block)
+                yield from zip(starts, map(add, starts, lengths), geo_ids)
+        else:
+            for i in self._sorted_indices():
+                yield self._starts[i], self._ends[i], self._geo_ids[i]
+        for i in range(self._count6):
+            yield self._starts6[i], self._ends6[i], self._geo_ids6[i]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def mapping(self) -> Mapping[int, tuple[str, str]]:
+        if self._mapping is None:
+            if self.version == LEGACY_VERSION:
+                self._mapping = _deserialize_mapping(self._buffer, self._mapping_offset)
+            else:
+                self._mapping = _geo_table(self._buffer, self._sections)
+        return self._mapping
+
+    @property
+    def records(self) -> RecordTable | None:
+        if self._records is None and self.version == FORMAT_VERSION:
+            self._records = _record_table(self._buffer, self._sections, self.mapping)
+        return self._records
+
+    def lookup_id(self, value: int) -> int | None:
+        if value > IPV4_MAX and self._count6:
+            i = bisect_right(self._starts6, value) - 1
+            if i >= 0 and self._ends6[i] >= value:
+                return self._geo_ids6[i]
+            return None
+
+        jump = self._jump
+        if jump is not None and 0 <= value <= IPV4_MAX:
+            prefix = value >> (32 - JUMP_BITS)
+            lo, hi = jump[prefix], jump[prefix + 1]
+        else:
+            lo, hi = 0, None
+        if self.flags & FLAG_COMPRESSED:
+            return self._lookup_block(value, lo, hi)
+
+        self._ensure_sorted()
+        starts = self._starts
+        hi = self._count if hi is None else hi
+
+        if self._order is None:
+            i = bisect_right(starts, value, lo, hi) - 1
+        else:
+            i = bisect_right(self._order, value, lo, hi, key=starts.__getitem__) - 1
+            i = self._order[i] if i >= 0 else i
+
+        if i >= 0 and self._ends[i] >= value:
+            return self._geo_ids[i]
+        return None
+
+    def _lookup_block(self, value: int, lo: int, hi: int | None) -> int | None:
+        block = bisect_right(self._block_starts, value, lo, hi) - 1
+        if block < 0:
+            return None
+        starts, lengths, geo_ids = self._cached_block(block)
+        i = bisect_right(starts, value) - 1
+        if starts[i] + lengths[i] >= value:
+            return geo_ids[i]
+        return None
+
+    def _cached_block(self, block: int) -> tuple[list[int], array, array]:
+        with self._blocks_lock:
+            if block in self._blocks:
+                self._blocks.move_to_end(block)
+                return self._blocks[block]
+        decoded = self._decode_block(block)
+        if self._block_cache > 0:
+            with self._blocks_lock:
+                self._blocks[block] = decoded
+                if len(self._blocks) > self._block_cache:
+                    self._blocks.popitem(last=False)
+        return decoded
+
+    def _decode_block(self, block: int) -> tuple[list[int], array, array]:
+        start, end = self._block_offsets[block], self._block_offsets[block + 1]
+        return _decode_block(self._block_data[start:end], self._block_starts[block])
+
+    def lookup(self, ip: str | int) -> tuple[str, str]:
+        return _lookup(self, ip)
+
+    def lookup_record(self, ip: str | int) -> dict:
+        value = ip if isinstance(ip, int) else cidr_to_int(ip, with_broadcast=False)
+        return _geo_record(self.mapping, self.records, self.lookup_id(value))
+
+    def lookup_ids(self, values: np.ndarray) -> np.ndarray:
+        if self._columns is None:
+            self._columns = self._numpy_columns()
+        return _lookup_ids(*self._columns, values)
+
+    def _numpy_columns(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self.version == LEGACY_VERSION:
+            ranges = np.frombuffer(
+                self._buffer, dtype="<i8", count=self._count * 3, offset=4
+            ).reshape(-1, 3)
+            columns = ranges[:, 0], ranges[:, 1], ranges[:, 2]
+        else:
+            columns = _ipv4_columns(
+                self._buffer, self.flags, self._count, self._sections
+            )
+
+        self._ensure_sorted()
+        if self._order is not None:
+            order = np.array(self._order, dtype=np.intp)
+            columns = tuple(column[order] for column in columns)
+        return columns
+
+    def close(self):
+        self._columns = None
+        self._blocks.clear()
+        if self._release is not None:
+            self._release()
+        for name in (
+            "_starts",
+            "_ends",
+            "_geo_ids",
+            "_ranges",
+            "_starts6",
+            "_ends6",
+            "_geo_ids6",
+            "_jump",
+            "_block_starts",
+            "_block_offsets",
+            "_block_data",
+        ):
+            view = self.__dict__.pop(name, None)
+            if view is not None:
+                view.release()
+        self._buffer.release()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # The geo table reads the file in place and may outlive the
+                # reader, the file is unmapped once the table is dropped.
+                pass
+            self._mmap = None
+
+    def _ensure_sorted(self):
+        if self._is_sorted is None:
+            starts = self._starts
+            self._is_sorted = all(map(le, starts[:-1], starts[1:]))
+            if not self._is_sorted:
+                self._order = array(
+                    "L", sorted(range(self._count), key=starts.__getitem__)
+                )
+
+    def _sorted_indices(self):
+        self._ensure_sorted()
+        return range(self._count) if self._order is None else self._order
@@ -0,0 +1,441 @@
+import argparse
+import asyncio
+import json
+import mmap
+import os
+import signal
+import socket
+import stat
+import struct
+import sys
+import time
+import traceback
+from collections.abc import Iterable, Iterator
+
+import numpy as np
+
+from .cdb import (
+    IPV4_MAX,
+    SECTION_GEOS,
+    SECTION_STRINGS,
+    UNKNOWN_GEO,
+    UNKNOWN_GEO_ID,
+    _batch_values,
+    _deserialize_geos,
+    _serialize_geos,
+    search_geo_batch,
+)
+from .database import CdbDatabase
+from .reader import CdbReader
+
+OP_LOOKUP = 1
+OP_LOOKUP6 = 2
+OP_MAPPING = 3
+OP_STATS = 4
+OP_RELOAD = 5
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+DEFAULT_ADDRESS = ("127.0.0.1", 7373)
+MAX_FRAME_SIZE = 64 << 20
+
+# Requests are (payload length, request id, opcode) followed by the payload,
+# responses (payload length, request id, status, generation). Lookup payloads
+# are uint32 IPv4 keys (OP_LOOKUP) or (high, low) uint64 key pairs
+# (OP_LOOKUP6); the response carries one int64 geo id per key.
+_REQUEST = struct.Struct("<IIB")
+_RESPONSE = struct.Struct("<IIBQ")
+
+_STATS_FIELDS = ("connections", "requests", "addresses", "errors", "busy_seconds")
+_LATENCY_BUCKETS = 24
+_WRITE_BUFFER_LIMIT = 1 << 20
+
+
+class _Stats:
+    # One row of counters per worker in anonymous shared memory, so any
+    # worker can report totals for the whole server. Latencies go to
+    # power-of-two microsecond buckets.
+    def __init__(self, workers: int):
+        width = len(_STATS_FIELDS) + _LATENCY_BUCKETS
+        self._shared = mmap.mmap(-1, workers * width * 8)
+        self._table = np.frombuffer(self._shared, dtype=np.float64).reshape(
+            workers, width
+        )
+        self._started = time.time()
+
+    def connection(self, worker: int):
+        self._table[worker, 0] += 1
+
+    def record(self, worker: int, addresses: int, seconds: float, error: bool):
+        row = self._table[worker]
+        row[1] += 1
+        row[2] += addresses
+        row[3] += error
+        row[4] += seconds
+        bucket = min(int(seconds * 1e6).bit_length(), _LATENCY_BUCKETS - 1)
+        row[len(_STATS_FIELDS) + bucket] += 1
+
+    def snapshot(self) -> dict[str, int | float | dict[str, float]]:
+        totals = self._table.sum(axis=0)
+        uptime = time.time() - self._started
+        result = {name: totals[i].item() for i, name in enumerate(_STATS_FIELDS)}
+        for name in ("connections", "requests", "addresses", "errors"):
+            result[name] = int(result[name])
+        result["workers"] = len(self._table)
+        result["uptime_seconds"] = uptime
+        result["requests_per_second"] = result["requests"] / uptime
+        result["addresses_per_second"] = result["addresses"] / uptime
+
+        histogram = totals[len(_STATS_FIELDS) :]
+        cumulative = np.cumsum(histogram)
+        result["latency_ms"] = {
+            f"p{int(q * 100)}": (
+                float(2 ** int(np.searchsorted(cumulative, q * cumulative[-1]))) / 1000
+                if cumulative[-1]
+                else 0.0
+            )
+            for q in (0.5, 0.9, 0.99)
+        }
+        return result
+
+
+class _Worker:
+    def __init__(
+        self,
+        index: int,
+        filepath: str,
+        interval: float | None,
+        jump_table: bool,
+        stats: _Stats,
+        master_pid: int | None,
+    ):
+        self.index = index
+        self.filepath = filepath
+        self.interval = interval
+        self.jump_table = jump_table
+        self.stats = stats
+        self.master_pid = master_pid
+        self.db = None
+
+    async def run(self, sock: socket.socket):
+        loop = asyncio.get_running_loop()
+        self.db = CdbDatabase(self.filepath, self.interval, self.jump_table)
+        stopped = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stopped.set)
+        if hasattr(signal, "SIGHUP"):
+            loop.add_signal_handler(
+                signal.SIGHUP, lambda: loop.run_in_executor(None, self.db.reload)
+            )
+
+        if sock.family == getattr(socket, "AF_UNIX", None):
+            server = await asyncio.start_unix_server(self.handle, sock=sock)
+        else:
+            server = await asyncio.start_server(self.handle, sock=sock)
+        try:
+            async with server:
+                await stopped.wait()
+        finally:
+            self.db.close()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.stats.connection(self.index)
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(_REQUEST.size)
+                except asyncio.IncompleteReadError:
+                    break
+                length, request_id, opcode = _REQUEST.unpack(header)
+                if length > MAX_FRAME_SIZE:
+                    break
+                payload = await reader.readexactly(length)
+
+                started = time.perf_counter()
+                snapshot, generation = self.db.snapshot()
+                try:
+                    body, count = await self.dispatch(opcode, payload, snapshot)
+                    status = STATUS_OK
+                except Exception as e:
+                    body, count, status = str(e).encode(), 0, STATUS_ERROR
+                writer.write(
+                    _RESPONSE.pack(len(body), request_id, status, generation) + body
+                )
+                self.stats.record(
+                    self.index,
+                    count,
+                    time.perf_counter() - started,
+                    status != STATUS_OK,
+                )
+
+                # Responses to pipelined requests are buffered and flushed
+                # together; only a slow reader makes the worker wait.
+                if writer.transport.get_write_buffer_size() > _WRITE_BUFFER_LIMIT:
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(
+        self, opcode: int, payload: bytes, reader: CdbReader
+    ) -> tuple[bytes, int]:
+        if opcode == OP_LOOKUP:
+            values = np.frombuffer(payload, dtype="<u4")
+            return reader.lookup_ids(values).astype("<i8").tobytes(), len(values)
+        if opcode == OP_LOOKUP6:
+            words = np.frombuffer(payload, dtype="<u8").reshape(-1, 2)
+            values = [high << 64 | low for high, low in words.tolist()]
+            ids = search_geo_batch(reader, values, geo_ids=True)
+            return ids.astype("<i8").tobytes(), len(values)
+        if opcode == OP_MAPPING:
+            sections = dict(_serialize_geos(reader.mapping))
+            records, strings = sections[SECTION_GEOS], sections[SECTION_STRINGS]
+            return struct.pack("<I", len(records)) + records + strings, 0
+        if opcode == OP_STATS:
+            stats = self.stats.snapshot()
+            stats["generation"] = self.db.generation
+            return json.dumps(stats).encode(), 0
+        if opcode == OP_RELOAD:
+            loop = asyncio.get_running_loop()
+            changed = await loop.run_in_executor(None, self.db.reload)
+            if self.master_pid is not None and hasattr(signal, "SIGHUP"):
+                os.kill(self.master_pid, signal.SIGHUP)
+            return bytes([changed]), 0
+        raise ValueError(f"Unknown opcode {opcode}")
+
+
+def _listen(address: str | tuple[str, int]) -> socket.socket:
+    if isinstance(address, str):
+        # Only a socket left by a previous run is replaced.
+        try:
+            mode = os.lstat(address).st_mode
+        except FileNotFoundError:
+            pass
+        else:
+            if not stat.S_ISSOCK(mode):
+                raise FileExistsError(f"{address} exists and is not a socket")
+            os.unlink(address)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(address)
+    sock.listen(1024)
+    sock.setblocking(False)
+    return sock
+
+
+def serve(
+    filepath: str,
+    address: str | tuple[str, int] = DEFAULT_ADDRESS,
+    workers: int = 1,
+    interval: float | None = 1.0,
+    jump_table: bool = False,
+):
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"File {filepath} not exists")
+    if not hasattr(os, "fork"):
+        workers = 1
+
+    sock = _listen(address)
+    stats = _Stats(workers)
+    try:
+        if workers == 1:
+            worker = _Worker(0, filepath, interval, jump_table, stats, None)
+            asyncio.run(worker.run(sock))
+            return
+
+        # Pre-forked workers share the listening socket and the page cache
+        # of the mapped file, each with its own event loop.
+        master_pid = os.getpid()
+        pids = []
+        for index in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                code = 0
+                try:
+                    worker = _Worker(
+                        index, filepath, interval, jump_table, stats, master_pid
+                    )
+                    asyncio.run(worker.run(sock))
+                except BaseException:
+                    traceback.print_exc()
+                    code = 1
+                finally:
+                    os._exit(code)
+            pids.append(pid)
+
+        def forward(signum, _):
+            for pid in pids:
+                try:
+                    os.kill(pid, signal.SIGTERM if signum == signal.SIGINT else signum)
+                except ProcessLookupError:
+                    pass
+
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, forward)
+        for pid in pids:
+            os.waitpid(pid, 0)
+    finally:
+        sock.close()
+        if isinstance(address, str) and os.path.exists(address):
+            os.unlink(address)
+
+
+class CdbClient:
+    def __init__(
+        self, address: str | tuple[str, int] = DEFAULT_ADDRESS, timeout: float = None
+    ):
+        if isinstance(address, str):
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.settimeout(timeout)
+            self._sock.connect(address)
+        else:
+            self._sock = socket.create_connection(address, timeout)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+        self._next_id = 0
+        self._responses = {}
+        self._mapping = None
+        self._mapping_generation = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+    def lookup(self, ip: str | int) -> tuple[str, str]:
+        return self.lookup_many([ip])[0]
+
+    def lookup_many(
+        self, ips: list[str] | list[int] | bytes | np.ndarray, geo_ids: bool = False
+    ) -> list[tuple[str, str]] | np.ndarray:
+        return next(self.lookup_batches([ips], geo_ids))
+
+    def lookup_batches(
+        self,
+        batches: Iterable[list[str] | list[int] | bytes | np.ndarray],
+        geo_ids: bool = False,
+        depth: int = 16,
+    ) -> Iterator[list[tuple[str, str]] | np.ndarray]:
+        # Keeps up to `depth` requests in flight on the connection.
+        pending = []
+        for batch in batches:
+            request = self._encode(batch)
+            pending.append((self._send(*request), request))
+            if len(pending) >= depth:
+                yield self._lookup_result(*pending.pop(0), geo_ids)
+        while pending:
+            yield self._lookup_result(*pending.pop(0), geo_ids)
+
+    def mapping(self) -> dict[int, tuple[str, str]]:
+        generation, body = self._receive(self._send(OP_MAPPING))
+        (length,) = struct.unpack_from("<I", body)
+        sections = {
+            SECTION_GEOS: (4, length),
+            SECTION_STRINGS: (4 + length, len(body) - 4 - length),
+        }
+        self._mapping = _deserialize_geos(body, sections)
+        self._mapping_generation = generation
+        return self._mapping
+
+    def stats(self) -> dict[str, int | float | dict[str, float]]:
+        return json.loads(self._receive(self._send(OP_STATS))[1])
+
+    def reload(self) -> bool:
+        return self._receive(self._send(OP_RELOAD))[1] == b"\x01"
+
+    def _encode(self, ips: list[str] | list[int] | bytes | np.ndarray) -> tuple:
+        values = _batch_values(ips)
+        if len(values) and values.min() < 0:
+            raise ValueError("Addresses must not be negative")
+        if len(values) and values.max() > IPV4_MAX:
+            words = [divmod(value, 1 << 64) for value in values.tolist()]
+            return OP_LOOKUP6, np.array(words, dtype="<u8").tobytes()
+        return OP_LOOKUP, values.astype("<u4").tobytes()
+
+    def _lookup_result(
+        self, request_id: int, request: tuple, geo_ids: bool
+    ) -> list[tuple[str, str]] | np.ndarray:
+        while True:
+            generation, body = self._receive(request_id)
+            ids = np.frombuffer(body, dtype="<i8").astype(np.int64)
+            if geo_ids:
+                return ids
+            if self._mapping_generation != generation:
+                self.mapping()
+            if self._mapping_generation == generation:
+                break
+            # The file was reloaded between the lookup and the mapping fetch.
+            request_id = self._send(*request)
+
+        get = self._mapping.get
+        return [
+            UNKNOWN_GEO if geo_id == UNKNOWN_GEO_ID else get(geo_id, UNKNOWN_GEO)
+            for geo_id in ids.tolist()
+        ]
+
+    def _send(self, opcode: int, payload: bytes = b"") -> int:
+        request_id = self._next_id
+        self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+        self._sock.sendall(_REQUEST.pack(len(payload), request_id, opcode) + payload)
+        return request_id
+
+    def _receive(self, request_id: int) -> tuple[int, bytes]:
+        while request_id not in self._responses:
+            header = self._file.read(_RESPONSE.size)
+            if len(header) < _RESPONSE.size:
+                raise ConnectionError("Server closed the connection")
+            length, response_id, status, generation = _RESPONSE.unpack(header)
+            body = self._file.read(length)
+            if len(body) < length:
+                raise ConnectionError("Server closed the connection")
+            self._responses[response_id] = (status, generation, body)
+
+        status, generation, body = self._responses.pop(request_id)
+        if status != STATUS_OK:
+            raise RuntimeError(f"Server error: {body.decode()}")
+        return generation, body
+
+
+def _parse_address(tcp: str | None, unix: str | None) -> str | tuple[str, int]:
+    if unix:
+        return unix
+    if tcp:
+        host, _, port = tcp.rpartition(":")
+        return host or DEFAULT_ADDRESS[0], int(port)
+    return DEFAULT_ADDRESS
+
+
+def add_serve_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("path", help="path to the .cdb file")
+    listen = parser.add_mutually_exclusive_group()
+    listen.add_argument(
+        "--tcp", metavar="HOST:PORT", help="TCP address (default 127.0.0.1:7373)"
+    )
+    listen.add_argument("--unix", metavar="PATH", help="Unix socket path")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        help="seconds between file change checks, 0 disables reloading",
+    )
+    parser.add_argument("--jump-table", action="store_true")
+
+
+def run_serve(args: argparse.Namespace):
+    address = _parse_address(args.tcp, args.unix)
+    print(
+        f"Serving {args.path} on {address} with {args.workers} workers",
+        file=sys.stderr,
+        flush=True,
+    )
+    serve(args.path, address, args.workers, args.interval or None, args.jump_table)
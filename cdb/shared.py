@@ -0,0 +1,237 @@
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+from collections.abc import Sequence
+
+import numpy as np
+
+from .cdb import (
+    RecordTable,
+    _lookup,
+    _replace_file,
+)
+from .database import _file_signature, _reload
+from .overlay import LayeredCdb, fold_overlays
+from .reader import CdbReader
+from .validation import VALIDATE_HEADER, validate_cdb
+
+SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+# The generation is only read on this host, so it is kept in native order
+# and read through a memoryview on every lookup.
+_CONTROL = struct.Struct("=8sQ")
+_CONTROL_MAGIC = b"CDBSHARE"
+
+
+def _control_path(directory: str, name: str) -> str:
+    if not name or os.sep in name:
+        raise ValueError(f"Invalid shared table name {name!r}")
+    return os.path.join(directory, f"cdb-{name}")
+
+
+def _segment_path(directory: str, name: str, generation: int) -> str:
+    return f"{_control_path(directory, name)}.{generation}"
+
+
+class SharedCdb:
+    # Publishes a table once for processes that attach to it by name, such
+    # as the workers of a pre-fork server. Every version is a file in a
+    # shared memory directory, so all processes map the same pages, and a
+    # control file holds the generation the workers switch to.
+    def __init__(
+        self,
+        filepath: str,
+        name: str | None = None,
+        directory: str | None = None,
+        jump_table: bool = False,
+        overlays: Sequence[str] = (),
+        validate: str | None = None,
+    ):
+        self.filepath = filepath
+        self.name = name or str(os.getpid())
+        self.directory = directory or SHARED_DIR
+        self.overlays = tuple(overlays)
+        self.last_error = None
+        self._jump_table = jump_table
+        self._validate = validate
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._signature = self._signatures()
+        self._failed_signature = None
+        self._control_path = _control_path(self.directory, self.name)
+        self._write_segment(0)
+        try:
+            with _replace_file(self._control_path) as file:
+                file.write(_CONTROL.pack(_CONTROL_MAGIC, 0))
+            with open(self._control_path, "r+b") as file:
+                self._mmap = mmap.mmap(file.fileno(), _CONTROL.size)
+        except BaseException:
+            os.unlink(_segment_path(self.directory, self.name, 0))
+            raise
+        self._generation_word = memoryview(self._mmap)[8:].cast("Q")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def attach(self) -> "SharedCdbReader":
+        return SharedCdbReader(self.name, self.directory)
+
+    def reload(self, force: bool = False) -> bool:
+        return _reload(self, force, self._load, self._swap)
+
+    def _load(self):
+        self._write_segment(self._generation + 1)
+
+    def _swap(self, _):
+        # Workers that still map the previous version keep its pages until
+        # they switch, unlinking only drops the name.
+        previous = _segment_path(self.directory, self.name, self._generation)
+        self._generation += 1
+        self._generation_word[0] = self._generation
+        os.unlink(previous)
+
+    def _signatures(self) -> tuple[tuple[int, int, int, int], ...]:
+        return tuple(map(_file_signature, (self.filepath, *self.overlays)))
+
+    def _write_segment(self, generation: int):
+        # Overlays and the jump table are folded in here, so that workers
+        # only map the result.
+        path = _segment_path(self.directory, self.name, generation)
+        try:
+            if self.overlays or self._jump_table:
+                fold_overlays(
+                    path, self.filepath, *self.overlays, jump_table=self._jump_table
+                )
+            else:
+                with open(self.filepath, "rb") as source, _replace_file(path) as file:
+                    shutil.copyfileobj(source, file, 1 << 20)
+            validate_cdb(path, self._validate or VALIDATE_HEADER)
+        except BaseException:
+            if os.path.exists(path):
+                os.unlink(path)
+            raise
+
+    def close(self):
+        with self._lock:
+            if self._mmap is None:
+                return
+            self._generation_word.release()
+            self._mmap.close()
+            self._mmap = None
+            for path in (
+                self._control_path,
+                _segment_path(self.directory, self.name, self._generation),
+            ):
+                if os.path.exists(path):
+                    os.unlink(path)
+
+
+class SharedCdbReader:
+    # Attaches to a table published by SharedCdb. Attaching maps the current
+    # version without copying it, and every lookup first compares the
+    # generation with the published one, so the whole pool switches to a new
+    # version on its next lookup.
+    def __init__(self, name: str, directory: str | None = None):
+        self.name = name
+        self.directory = directory or SHARED_DIR
+        self.last_error = None
+        with open(_control_path(self.directory, name), "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < _CONTROL.size or self._mmap[:8] != _CONTROL_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"Not a shared cdb table: {name}")
+        self._generation_word = memoryview(self._mmap)[8 : _CONTROL.size].cast("Q")
+        self._lock = threading.Lock()
+        try:
+            self._state = self._attach()
+        except Exception:
+            self._generation_word.release()
+            self._mmap.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _attach(self) -> tuple[CdbReader | LayeredCdb, int]:
+        while True:
+            generation = self._generation_word[0]
+            path = _segment_path(self.directory, self.name, generation)
+            try:
+                # The geo table is not touched, it is read in place on the
+                # first lookup.
+                return CdbReader(path), generation
+            except FileNotFoundError:
+                # The version was replaced between reading the generation
+                # and opening it.
+                if self._generation_word[0] == generation:
+                    raise
+
+    def _current(self) -> tuple[CdbReader | LayeredCdb, int]:
+        state = self._state
+        if self._generation_word[0] != state[1]:
+            with self._lock:
+                state = self._state
+                if self._generation_word[0] != state[1]:
+                    try:
+                        state = self._state = self._attach()
+                        self.last_error = None
+                    except (OSError, ValueError, struct.error) as e:
+                        # The publisher is gone, the current version stays.
+                        self.last_error = e
+        return state
+
+    @property
+    def reader(self) -> CdbReader | LayeredCdb:
+        return self._current()[0]
+
+    @property
+    def generation(self) -> int:
+        return self._current()[1]
+
+    def snapshot(self) -> tuple[CdbReader | LayeredCdb, int]:
+        return self._current()
+
+    @property
+    def mapping(self) -> dict[int, tuple[str, str]]:
+        return self._current()[0].mapping
+
+    @property
+    def records(self) -> RecordTable | None:
+        return self._current()[0].records
+
+    def __len__(self) -> int:
+        return len(self._current()[0])
+
+    def lookup_id(self, value: int) -> int | None:
+        return self._current()[0].lookup_id(value)
+
+    def _resolve_id(self, value: int) -> tuple[int | None, CdbReader | LayeredCdb]:
+        reader = self._current()[0]
+        return reader.lookup_id(value), reader
+
+    def lookup(self, ip: str | int) -> tuple[str, str]:
+        return _lookup(self._current()[0], ip)
+
+    def lookup_record(self, ip: str | int) -> dict:
+        return self._current()[0].lookup_record(ip)
+
+    def lookup_ids(self, values: np.ndarray) -> np.ndarray:
+        return self._current()[0].lookup_ids(values)
+
+    def close(self):
+        self._state[0].close()
+        self._generation_word.release()
+        self._mmap.close()
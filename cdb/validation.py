@@ -0,0 +1,396 @@
+import mmap
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from .cdb import (
+    BLOCK_SIZE,
+    DELETED_GEO_ID,
+    FLAG_COMPRESSED,
+    FLAG_OVERLAY,
+    FLAG_SORTED,
+    FORMAT_VERSION,
+    IPV4_MAX,
+    JUMP_BITS,
+    LEGACY_VERSION,
+    SECTION_BLOCK_OFFSETS,
+    SECTION_BLOCK_STARTS,
+    SECTION_BLOCKS,
+    SECTION_CHECKSUMS,
+    SECTION_ENDS,
+    SECTION_ENDS6,
+    SECTION_FIELDS,
+    SECTION_GEO_IDS,
+    SECTION_GEO_IDS6,
+    SECTION_GEOS,
+    SECTION_JUMP,
+    SECTION_RECORDS,
+    SECTION_STARTS,
+    SECTION_STARTS6,
+    SECTION_STRINGS,
+    _HEADER,
+    _decode_blocks,
+    _ipv4_columns,
+    _ipv6_range_count,
+    _legacy_mapping,
+    _legacy_ranges,
+    _read_checksums,
+    _read_header,
+    _record_layout,
+    _uint32_column,
+    build_jump_table,
+    is_legacy_format,
+)
+
+VALIDATE_HEADER = "header"
+VALIDATE_SAMPLED = "sampled"
+VALIDATE_FULL = "full"
+VALIDATION_MODES = (VALIDATE_HEADER, VALIDATE_SAMPLED, VALIDATE_FULL)
+DEFAULT_SAMPLES = 1024
+
+_RANGE_SECTIONS = {
+    SECTION_STARTS,
+    SECTION_ENDS,
+    SECTION_GEO_IDS,
+    SECTION_STARTS6,
+    SECTION_ENDS6,
+    SECTION_GEO_IDS6,
+    SECTION_JUMP,
+    SECTION_BLOCK_STARTS,
+    SECTION_BLOCK_OFFSETS,
+    SECTION_BLOCKS,
+}
+
+
+def validate_cdb(
+    filepath: str, mode: str = VALIDATE_FULL, samples: int = DEFAULT_SAMPLES
+) -> dict:
+    with open(filepath, "rb") as file:
+        if not os.fstat(file.fileno()).st_size:
+            raise ValueError(f"File {filepath} is empty")
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return validate_buffer(buf, mode, samples)
+
+
+def validate_buffer(
+    buf: bytes, mode: str = VALIDATE_FULL, samples: int = DEFAULT_SAMPLES
+) -> dict:
+    # Header mode checks the header and the directory, sampled mode also the
+    # checksums of the geo sections and ranges at evenly spaced positions,
+    # full mode every checksum and every range. The checks return an error
+    # instead of raising it, so that no array over the buffer outlives them
+    # and a mapped buffer can be closed right after a failure.
+    if mode not in VALIDATION_MODES:
+        raise ValueError(f"Unknown validation mode {mode!r}")
+    try:
+        if is_legacy_format(buf):
+            return _validate_legacy(buf, mode, samples)
+        return _validate_v2(buf, mode, samples)
+    except struct.error as e:
+        error = f"File is truncated: {e}"
+    raise ValueError(error)
+
+
+def _validate_v2(buf: bytes, mode: str, samples: int) -> dict:
+    flags, count, geo_count, sections = _read_header(buf)
+    checksums = _read_checksums(buf, _HEADER.unpack_from(buf)[3], sections)
+    count6 = _ipv6_range_count(sections)
+    report = {
+        "mode": mode,
+        "version": FORMAT_VERSION,
+        "ranges": count + count6,
+        "geos": geo_count,
+        "checksums": checksums is not None,
+        "checked_ranges": 0,
+    }
+    if mode == VALIDATE_HEADER:
+        return report
+
+    if checksums is not None:
+        tags = [
+            tag
+            for tag in sections
+            if tag != SECTION_CHECKSUMS
+            and (mode == VALIDATE_FULL or tag not in _RANGE_SECTIONS)
+        ]
+        _raise(_checksum_error(buf, sections, checksums, tags))
+
+    positions = positions6 = None
+    if mode == VALIDATE_SAMPLED:
+        positions = _sample_positions(count, samples)
+        positions6 = _sample_positions(count6, samples)
+    _raise(_geo_error(buf, sections, geo_count))
+    if flags & FLAG_COMPRESSED:
+        # Sampled blocks are decoded whole, so they are checked in full.
+        error, checked = _block_error(buf, sections, flags, count, positions)
+        _raise(error)
+    else:
+        _raise(_ipv4_error(buf, sections, flags, count, positions))
+        checked = count if positions is None else len(positions)
+    _raise(_ipv6_error(buf, sections, flags, count6, positions6))
+    if mode == VALIDATE_FULL and SECTION_JUMP in sections:
+        _raise(_jump_error(buf, sections, flags, count))
+
+    report["checked_ranges"] = checked + (
+        count6 if positions6 is None else len(positions6)
+    )
+    return report
+
+
+def _validate_legacy(buf: bytes, mode: str, samples: int) -> dict:
+    mapping = _legacy_mapping(buf)
+    count = len(_legacy_ranges(buf))
+    report = {
+        "mode": mode,
+        "version": LEGACY_VERSION,
+        "ranges": count,
+        "geos": len(mapping),
+        "checksums": False,
+        "checked_ranges": 0,
+    }
+    if mode == VALIDATE_HEADER:
+        return report
+
+    positions = None
+    if mode == VALIDATE_SAMPLED:
+        positions = _sample_positions(count, samples)
+    known = np.fromiter(mapping, dtype=np.int64, count=len(mapping))
+    _raise(_legacy_error(buf, known, positions))
+    report["checked_ranges"] = count if positions is None else len(positions)
+    return report
+
+
+def _raise(error: str | None):
+    if error is not None:
+        raise ValueError(error)
+
+
+def _sample_positions(count: int, samples: int) -> np.ndarray:
+    if count <= samples:
+        return np.arange(count)
+    return np.unique(np.linspace(0, count - 1, samples).astype(np.int64))
+
+
+def _sampled(column: np.ndarray, positions: np.ndarray | None) -> np.ndarray:
+    return column if positions is None else column[positions]
+
+
+def _neighbours(
+    column: np.ndarray, positions: np.ndarray | None
+) -> tuple[np.ndarray, np.ndarray]:
+    # Values at the positions and right after them, for order checks.
+    if positions is None:
+        return column[:-1], column[1:]
+    positions = positions[positions < len(column) - 1]
+    return column[positions], column[positions + 1]
+
+
+def _checksum_error(
+    buf: bytes,
+    sections: dict[bytes, tuple[int, int]],
+    checksums: dict[bytes, int],
+    tags: list[bytes],
+) -> str | None:
+    with memoryview(buf) as view:
+        for tag in tags:
+            if tag not in checksums:
+                return f"Section {tag.decode()} has no checksum"
+            offset, length = sections[tag]
+            with view[offset : offset + length] as data:
+                if zlib.crc32(data) != checksums[tag]:
+                    return f"Section {tag.decode()} checksum mismatch"
+    return None
+
+
+def _geo_error(
+    buf: bytes, sections: dict[bytes, tuple[int, int]], geo_count: int
+) -> str | None:
+    geos = _uint32_column(buf, sections[SECTION_GEOS][0], geo_count * 3)
+    geos = geos.reshape(geo_count, 3)
+    if len(np.unique(geos[:, 0])) != geo_count:
+        return "Geo ids are not unique"
+
+    offsets = [geos[:, 1:].ravel()]
+    if SECTION_FIELDS in sections:
+        fields_offset, fields_length = sections[SECTION_FIELDS]
+        layout, _ = _record_layout(
+            bytes(buf[fields_offset : fields_offset + fields_length]), geo_count
+        )
+        records_offset = sections[SECTION_RECORDS][0]
+        offsets += [
+            _uint32_column(buf, records_offset + offset, geo_count)
+            for typecode, offset in layout.values()
+            if typecode == "s"
+        ]
+
+    # Every name is a uint16 length and the UTF-8 bytes within the pool.
+    strings_offset, strings_length = sections.get(SECTION_STRINGS, (0, 0))
+    strings = np.frombuffer(buf, np.uint8, strings_length, strings_offset)
+    offsets = np.unique(np.concatenate(offsets)).astype(np.int64)
+    if len(offsets) and offsets[-1] + 2 > strings_length:
+        return f"Section {SECTION_STRINGS.decode()} is shorter than its references"
+    lengths = strings[offsets] | strings[offsets + 1].astype(np.int64) << 8
+    if (offsets + 2 + lengths > strings_length).any():
+        return f"Section {SECTION_STRINGS.decode()} is shorter than its references"
+    return None
+
+
+def _unknown_geo_ids(
+    buf: bytes,
+    sections: dict[bytes, tuple[int, int]],
+    flags: int,
+    geo_ids: np.ndarray,
+) -> bool:
+    offset, length = sections[SECTION_GEOS]
+    known = _uint32_column(buf, offset, length // 4)[0::3]
+    if flags & FLAG_OVERLAY:
+        geo_ids = geo_ids[geo_ids != DELETED_GEO_ID]
+    return not _all_known(geo_ids, known)
+
+
+def _all_known(geo_ids: np.ndarray, known: np.ndarray) -> bool:
+    if not len(geo_ids):
+        return True
+    if not len(known):
+        return False
+    # Geo ids are dense in practice and a lookup table takes half the time of
+    # np.isin.
+    limit = int(known.max()) + 1
+    if limit > 1 << 24:
+        return bool(np.isin(geo_ids, known).all())
+    table = np.zeros(limit, dtype=bool)
+    table[known] = True
+    return int(geo_ids.max()) < limit and bool(table[geo_ids].all())
+
+
+def _ipv4_error(
+    buf: bytes,
+    sections: dict[bytes, tuple[int, int]],
+    flags: int,
+    count: int,
+    positions: np.ndarray | None,
+) -> str | None:
+    starts, ends, geo_ids = (
+        _uint32_column(buf, sections[tag][0], count)
+        for tag in (SECTION_STARTS, SECTION_ENDS, SECTION_GEO_IDS)
+    )
+    return _range_error(buf, sections, flags, starts, ends, geo_ids, positions)
+
+
+def _block_error(
+    buf: bytes,
+    sections: dict[bytes, tuple[int, int]],
+    flags: int,
+    count: int,
+    positions: np.ndarray | None,
+) -> tuple[str | None, int]:
+    blocks = sections[SECTION_BLOCK_STARTS][1] // 4
+    block_starts = _uint32_column(buf, sections[SECTION_BLOCK_STARTS][0], blocks)
+    offsets = _uint32_column(buf, sections[SECTION_BLOCK_OFFSETS][0], blocks + 1)
+    offsets = offsets.astype(np.int64)
+    if (block_starts[:-1] > block_starts[1:]).any():
+        return "IPv4 blocks are not sorted", 0
+    if (offsets[:-1] + 2 > offsets[1:]).any():
+        return "Block data is truncated", 0
+
+    try:
+        if positions is None:
+            columns = _ipv4_columns(buf, flags, count, sections)
+        else:
+            # Enough blocks to hold the sampled ranges, even with a short
+            # last block.
+            selected = _sample_positions(blocks, -(-len(positions) // BLOCK_SIZE) + 1)
+            offset, length = sections[SECTION_BLOCKS]
+            data = np.frombuffer(buf, np.uint8, length, offset)
+            parts = [data[offsets[i] : offsets[i + 1]] for i in selected.tolist()]
+            sizes = np.array([len(part) for part in parts], dtype=np.int64)
+            columns = _decode_blocks(
+                block_starts[selected],
+                np.concatenate(([0], np.cumsum(sizes))),
+                np.concatenate(parts) if parts else data[:0],
+                int(data[offsets[selected]].sum()) + len(selected),
+            )
+    except ValueError as e:
+        return str(e), 0
+    return _range_error(buf, sections, flags, *columns, None), len(columns[0])
+
+
+def _range_error(
+    buf: bytes,
+    sections: dict[bytes, tuple[int, int]],
+    flags: int,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    geo_ids: np.ndarray,
+    positions: np.ndarray | None,
+) -> str | None:
+    if (_sampled(starts, positions) > _sampled(ends, positions)).any():
+        return "IPv4 range start is greater than its end"
+    if flags & FLAG_SORTED:
+        previous, following = _neighbours(starts, positions)
+        if (previous > following).any():
+            return "IPv4 ranges are not sorted"
+    if _unknown_geo_ids(buf, sections, flags, _sampled(geo_ids, positions)):
+        return "IPv4 range refers to an unknown geo id"
+    return None
+
+
+def _ipv6_error(
+    buf: bytes,
+    sections: dict[bytes, tuple[int, int]],
+    flags: int,
+    count: int,
+    positions: np.ndarray | None,
+) -> str | None:
+    if not count:
+        return None
+    starts, ends = (
+        np.frombuffer(buf, "<u8", count * 2, sections[tag][0]).reshape(count, 2)
+        for tag in (SECTION_STARTS6, SECTION_ENDS6)
+    )
+    geo_ids = _uint32_column(buf, sections[SECTION_GEO_IDS6][0], count)
+
+    first, last = _sampled(starts, positions), _sampled(ends, positions)
+    if ((first[:, 0] == 0) & (first[:, 1] <= IPV4_MAX)).any():
+        return "IPv6 range starts within the IPv4 space"
+    if not _ordered(first, last).all():
+        return "IPv6 range start is greater than its end"
+    if not _ordered(*_neighbours(starts, positions)).all():
+        return "IPv6 ranges are not sorted"
+    if _unknown_geo_ids(buf, sections, flags, _sampled(geo_ids, positions)):
+        return "IPv6 range refers to an unknown geo id"
+    return None
+
+
+def _ordered(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    # left <= right for rows of (high, low) 64-bit words.
+    return (left[:, 0] < right[:, 0]) | (
+        (left[:, 0] == right[:, 0]) & (left[:, 1] <= right[:, 1])
+    )
+
+
+def _jump_error(
+    buf: bytes, sections: dict[bytes, tuple[int, int]], flags: int, count: int
+) -> str | None:
+    if not flags & FLAG_SORTED:
+        return f"Section {SECTION_JUMP.decode()} needs sorted ranges"
+    starts = _uint32_column(buf, sections[SECTION_STARTS][0], count)
+    jump = _uint32_column(buf, sections[SECTION_JUMP][0], (1 << JUMP_BITS) + 1)
+    if not np.array_equal(jump, build_jump_table(starts)):
+        return f"Section {SECTION_JUMP.decode()} does not match ranges"
+    return None
+
+
+def _legacy_error(
+    buf: bytes, known: np.ndarray, positions: np.ndarray | None
+) -> str | None:
+    ranges = _sampled(_legacy_ranges(buf), positions)
+    if (ranges[:, 0] < 0).any():
+        return "Range start is negative"
+    if (ranges[:, 0] > ranges[:, 1]).any():
+        return "Range start is greater than its end"
+    if not _all_known(ranges[:, 2], known):
+        return "Range refers to an unknown geo id"
+    return None
@@ -7,7 +7,13 @@ setup(
     install_requires=[
         "maxminddb",
         "netaddr",
+        "numpy",
     ],
+    entry_points={
+        "console_scripts": [
+            "cdb=cdb.cli:main",
+        ],
+    },
     author="Kuzmin Rodion",
     author_email="r.kuzmin@crpt.ru",
     description="Library for mmdb data minimization",
@@ -0,0 +1,103 @@
+import pytest
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import NamedTemporaryFile
+from cdb import (
+    CdbReader,
+    GeoIndex,
+    lookup_many_async,
+    open_cdb_async,
+    open_database_async,
+    write_cdb,
+)
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    def __init__(self):
+        super().__init__(1)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+@pytest.fixture
+def cdb_path():
+    with NamedTemporaryFile(delete=False) as tmp_file:
+        path = tmp_file.name
+    write_cdb([(10, 20, 0), (30, 40, 1)], {0: ("A", "B"), 1: ("C", "D")}, path)
+    yield path
+    os.unlink(path)
+
+
+def test_open_cdb_async(cdb_path):
+    async def main():
+        with CountingExecutor() as executor:
+            reader = await open_cdb_async(cdb_path, executor=executor)
+            assert executor.submitted == 1
+        return reader
+
+    with asyncio.run(main()) as reader:
+        assert isinstance(reader, CdbReader)
+        assert reader._mapping is not None
+        assert reader.lookup(35) == ("C", "D")
+
+
+def test_open_cdb_async_missing_file():
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(open_cdb_async("non_existent_file.cdb"))
+
+
+def test_open_database_async(cdb_path):
+    async def main():
+        db = await open_database_async(cdb_path, interval=None)
+        with db:
+            return db.lookup(15)
+
+    assert asyncio.run(main()) == ("A", "B")
+
+
+def test_lookup_many_async():
+    index = GeoIndex([(10, 20, 0), (30, 40, 1)], {0: ("A", "B"), 1: ("C", "D")})
+
+    async def main(ips, inline_size):
+        with CountingExecutor() as executor:
+            result = await lookup_many_async(
+                index, ips, executor=executor, inline_size=inline_size
+            )
+            return result, executor.submitted
+
+    ips = [15, 25, 35] * 10
+    expected = [("A", "B"), ("Unknown", "Unknown"), ("C", "D")] * 10
+    assert asyncio.run(main(ips, 30)) == (expected, 0)
+    assert asyncio.run(main(ips, 29)) == (expected, 1)
+
+    # Packed addresses count by address, not by byte.
+    packed = b" ".join([b"0.0.0.15", b"0.0.0.25", b"0.0.0.35"] * 10)
+    assert asyncio.run(main(packed, 30)) == (expected, 0)
+    assert asyncio.run(main(packed, 29)) == (expected, 1)
+    padded = b" \n".join([b"0.0.0.15", b"0.0.0.25", b"0.0.0.35"] * 10) + b" " * 5000
+    assert asyncio.run(main(padded, 30)) == (expected, 0)
+
+    # The index for raw triples is built in the executor.
+    index = [(10, 20, 0), (30, 40, 1)]
+
+    async def main_triples():
+        with CountingExecutor() as executor:
+            result = await lookup_many_async(
+                index, [15], {0: ("A", "B")}, executor=executor
+            )
+            return result, executor.submitted
+
+    assert asyncio.run(main_triples()) == ([("A", "B")], 1)
+
+
+def test_lookup_many_async_geo_ids(cdb_path):
+    async def main():
+        reader = await open_cdb_async(cdb_path)
+        with reader:
+            return (await lookup_many_async(reader, [15, 35], geo_ids=True)).tolist()
+
+    assert asyncio.run(main()) == [0, 1]
@@ -0,0 +1,51 @@
+import json
+from benchmarks import compare, run
+from benchmarks.datasets import (
+    generate_networks,
+    sample_addresses,
+    to_triples,
+    write_mmdb,
+)
+from cdb import GeoIndex, mmdb_file_to_cdb, read_cdb, search_geo_batch
+
+
+def test_generated_mmdb_converts(tmp_path):
+    networks, mapping = generate_networks(2000, 50, seed=3)
+    assert (networks[1:, 0] > networks[:-1, 1]).all()
+    assert (networks[:, 1] >= networks[:, 0]).all()
+
+    write_mmdb(str(tmp_path / "data.mmdb"), networks, mapping)
+    mmdb_file_to_cdb(str(tmp_path / "data.mmdb"), str(tmp_path / "data.cdb"))
+    addresses = sample_addresses(networks, 5000)
+    assert search_geo_batch(
+        GeoIndex(*read_cdb(str(tmp_path / "data.cdb"))), addresses
+    ) == search_geo_batch(GeoIndex(to_triples(networks), mapping), addresses)
+
+
+def test_run_and_compare(tmp_path, capsys):
+    output = str(tmp_path / "results.json")
+    argv = ["--ranges", "3000", "--geos", "100", "--mmdb-ranges", "500"]
+    argv += ["--lookups", "500", "--batch", "2000", "--repeat", "1"]
+    argv += ["--workers", "1", "--tmp-dir", str(tmp_path), "-o", output]
+    assert run.main(argv) == 0
+
+    with open(output) as file:
+        report = json.load(file)
+    assert report["meta"]["params"]["ranges"] == 3000
+    results = report["results"]
+    assert set(results) >= {
+        "convert.workers_1",
+        "write.write_cdb",
+        "load.reader",
+        "lookup.reader_jump_table",
+        "lookup.reader_compressed",
+        "batch.reader_str",
+        "merge.merge_cdbs_and_save",
+        "validate.full",
+    }
+    assert results["lookup.reader"]["p99_us"] >= results["lookup.reader"]["p50_us"]
+    assert results["load.read_cdb"]["rss_bytes"] > 0
+
+    capsys.readouterr()
+    assert compare.main([output, output, "--fail"]) == 0
+    assert "REGRESSION" not in capsys.readouterr().out
@@ -0,0 +1,142 @@
+import pytest
+import os
+import struct
+import numpy as np
+from array import array
+from tempfile import NamedTemporaryFile
+from cdb import CdbReader, FORMAT_VERSION, LEGACY_VERSION, write_cdb, search_geo
+from cdb.cdb import GeoTable
+
+
+@pytest.fixture
+def cdb_file():
+    paths = []
+
+    def _create(networks, mapping, version=FORMAT_VERSION):
+        with NamedTemporaryFile(delete=False) as tmp_file:
+            paths.append(tmp_file.name)
+        write_cdb(networks, mapping, tmp_file.name, version)
+        return tmp_file.name
+
+    yield _create
+    for path in paths:
+        os.unlink(path)
+
+
+def test_reader_file_not_found():
+    with pytest.raises(FileNotFoundError):
+        CdbReader("non_existent_file.cdb")
+
+
+def test_reader_truncated_file():
+    with NamedTemporaryFile(delete=False) as tmp_file:
+        tmp_file.write(struct.pack("<I", 10))
+
+    try:
+        with pytest.raises(struct.error):
+            CdbReader(tmp_file.name)
+    finally:
+        os.unlink(tmp_file.name)
+
+
+def test_reader_lookup(cdb_file):
+    networks = [(10, 20, 1), (30, 40, 2), (50, 60, 3)]
+    mapping = {1: ("Country1", "City1"), 2: ("Country2", "City2")}
+
+    with CdbReader(cdb_file(networks, mapping)) as reader:
+        assert len(reader) == 3
+        assert reader.lookup(10) == ("Country1", "City1")
+        assert reader.lookup(40) == ("Country2", "City2")
+        assert reader.lookup(55) == ("Unknown", "Unknown")
+        assert reader.lookup(25) == ("Unknown", "Unknown")
+        assert reader.lookup(65) == ("Unknown", "Unknown")
+        assert reader.lookup_id(55) == 3
+
+
+def test_reader_unsorted_file(cdb_file):
+    networks = [(50, 60, 3), (10, 20, 1), (30, 40, 2)]
+    mapping = {1: ("A", "B"), 2: ("C", "D"), 3: ("E", "F")}
+
+    with CdbReader(cdb_file(networks, mapping, LEGACY_VERSION)) as reader:
+        assert list(reader) == sorted(networks)
+        assert reader.lookup(15) == ("A", "B")
+        assert reader.lookup(35) == ("C", "D")
+        assert reader.lookup(45) == ("Unknown", "Unknown")
+
+
+@pytest.mark.parametrize("version", [LEGACY_VERSION, FORMAT_VERSION])
+def test_reader_matches_search_geo(cdb_file, version):
+    networks = [(i * 10, i * 10 + 9, i % 7) for i in range(1000)]
+    mapping = {i: (f"Country{i}", f"City{i}") for i in range(7)}
+
+    with CdbReader(cdb_file(networks, mapping, version)) as reader:
+        assert reader.version == version
+        for value in range(0, 10010, 37):
+            assert reader.lookup(value) == search_geo(networks, value, mapping)
+
+
+def test_reader_string_ip(cdb_file):
+    networks = [(167772160, 184549375, 0)]
+    mapping = {0: ("Country1", "City1")}
+
+    with CdbReader(cdb_file(networks, mapping)) as reader:
+        assert reader.lookup("10.1.2.3") == ("Country1", "City1")
+        assert reader.lookup("11.0.0.0") == ("Unknown", "Unknown")
+
+
+@pytest.mark.parametrize("version", [LEGACY_VERSION, FORMAT_VERSION])
+def test_reader_lazy_mapping(cdb_file, version):
+    with CdbReader(cdb_file([(1, 2, 0)], {0: ("Страна", "Город")}, version)) as reader:
+        assert reader._mapping is None
+        assert reader.mapping == {0: ("Страна", "Город")}
+
+
+def test_reader_mapping_decodes_on_demand(cdb_file):
+    mapping = {i: ("Country", f"City{i}") for i in range(10)}
+    with CdbReader(cdb_file([(1, 2, 3), (5, 6, 7)], mapping)) as reader:
+        assert reader.lookup(1) == ("Country", "City3")
+        table = reader.mapping
+        assert len(table._names) == 2
+        assert reader.lookup(6)[0] is reader.lookup(1)[0]
+        assert len(table._names) == 3
+        assert table.get(42, "x") == "x" and 42 not in table and 3 in table
+        with pytest.raises(KeyError):
+            table[None]
+
+    assert len(table) == 10
+    assert list(table) == list(range(10))
+    assert table == mapping
+
+
+@pytest.mark.parametrize("ids", [[0, 1, 2], [2, 7, 40], [40, 2, 7]])
+def test_geo_table_ids(ids):
+    geos = array("I")
+    strings = bytearray()
+    for geo_id in ids:
+        geos.extend((geo_id, len(strings), len(strings)))
+        strings += struct.pack("<H", 4) + f"G{geo_id:03}".encode()
+    table = GeoTable(memoryview(geos.tobytes()), bytes(strings))
+
+    assert list(table) == ids and len(table) == 3
+    for geo_id in ids:
+        assert table[geo_id] == (f"G{geo_id:03}",) * 2
+        assert table.get(np.uint32(geo_id)) == (f"G{geo_id:03}",) * 2
+    for missing in (-1, 3, 8, 41, None, "2", 2.5):
+        assert missing not in table and table.get(missing, "x") == "x"
+
+
+def test_reader_reads_geo_table_in_place(cdb_file):
+    path = cdb_file([(1, 2, 3)], {i: ("Country", f"City{i}") for i in range(10)})
+    reader = CdbReader(path)
+    table = reader.mapping
+    assert isinstance(table.geos, memoryview)
+    reader.close()
+    assert table[3] == ("Country", "City3")
+
+
+@pytest.mark.parametrize("version", [LEGACY_VERSION, FORMAT_VERSION])
+def test_reader_empty_file(cdb_file, version):
+    with CdbReader(cdb_file([], {}, version)) as reader:
+        assert len(reader) == 0
+        assert list(reader) == []
+        assert reader.lookup(1) == ("Unknown", "Unknown")
@@ -0,0 +1,108 @@
+import pytest
+import os
+import random
+from tempfile import NamedTemporaryFile
+from cdb import CdbReader, CdbWriter, read_cdb
+
+
+@pytest.fixture
+def output_path():
+    with NamedTemporaryFile(delete=False) as tmp_file:
+        path = tmp_file.name
+    yield path
+    os.unlink(path)
+
+
+def test_writer_sorted_input(output_path):
+    networks = [(i * 10, i * 10 + 5, i % 3) for i in range(100)]
+    mapping = {i: (f"Country{i}", f"City{i}") for i in range(3)}
+
+    with CdbWriter(output_path, buffer_size=16) as writer:
+        writer.extend(networks)
+        writer.finish(mapping)
+
+    assert read_cdb(output_path) == (networks, mapping)
+
+
+def test_writer_unsorted_input(output_path):
+    networks = [(i * 10, i * 10 + 5, i % 3) for i in range(1000)]
+    shuffled = networks[:]
+    random.Random(0).shuffle(shuffled)
+
+    with CdbWriter(output_path, buffer_size=64) as writer:
+        writer.extend(shuffled)
+        writer.finish({0: ("A", "B")})
+
+    assert read_cdb(output_path)[0] == networks
+    with CdbReader(output_path) as reader:
+        assert len(reader) == 1000
+        assert reader.lookup_id(55) == 2
+        assert reader.lookup(30) == ("A", "B")
+
+
+def test_writer_empty(output_path):
+    with CdbWriter(output_path) as writer:
+        writer.finish({})
+
+    assert read_cdb(output_path) == ([], {})
+
+
+@pytest.mark.parametrize("triple", [(-1, 2, 0), (1, 2**128, 0), (1, 2, -1)])
+def test_writer_out_of_range(output_path, triple):
+    with CdbWriter(output_path) as writer:
+        with pytest.raises(ValueError):
+            writer.add(*triple)
+
+
+def test_writer_ipv6(output_path):
+    networks = [
+        (2**32 + i * 2**80, 2**32 + i * 2**80 + 2**79, i % 3) for i in range(300)
+    ]
+    networks += [(i * 10, i * 10 + 5, i % 3) for i in range(300)]
+    shuffled = networks[:]
+    random.Random(0).shuffle(shuffled)
+
+    with CdbWriter(output_path, buffer_size=64) as writer:
+        writer.extend(shuffled)
+        writer.add(2**32 - 10, 2**32 + 9, 1)
+        writer.finish({1: ("A", "B")})
+
+    # (2**32, 2**32 + 9) lies inside the first IPv6 network, which sorts
+    # after it and wins the overlap.
+    result, _ = read_cdb(output_path)
+    assert result == sorted(networks + [(2**32 - 10, 2**32 - 1, 1)])
+    with CdbReader(output_path) as reader:
+        assert len(reader) == 601
+        assert reader.lookup_id(2**32 + 5) == 0
+        assert reader.lookup(2**32 + 2**80 + 5) == ("A", "B")
+        assert reader.lookup(2**32 - 5) == ("A", "B")
+        assert reader.lookup_id(2**32 + 3 * 2**80) == 0
+        assert reader.lookup_id(2**127) is None
+
+
+def test_writer_ipv6_compact(output_path):
+    with CdbWriter(output_path, buffer_size=4, compact=True) as writer:
+        writer.extend((2**64 + i * 10, 2**64 + i * 10 + 9, 0) for i in range(20))
+        writer.add(2**32 - 10, 2**32 + 9, 0)
+        writer.finish({0: ("A", "B")})
+
+    assert writer.removed == 19
+    assert read_cdb(output_path)[0] == [
+        (2**32 - 10, 2**32 - 1, 0),
+        (2**32, 2**32 + 9, 0),
+        (2**64, 2**64 + 199, 0),
+    ]
+
+
+def test_writer_removed_counts_compaction_only(output_path):
+    with CdbWriter(output_path, compact=True) as writer:
+        writer.extend([(10, 100, 1), (30, 40, 2), (35, 60, 3), (101, 110, 1)])
+        writer.finish({})
+
+    assert read_cdb(output_path)[0] == [
+        (10, 29, 1),
+        (30, 34, 2),
+        (35, 60, 3),
+        (61, 110, 1),
+    ]
+    assert writer.removed == 1
@@ -1,6 +1,7 @@
 import pytest
-from cdb import cidr_to_int
-from ipaddress import IPv4Address, IPv4Network
+import numpy as np
+from cdb import cidr_to_int, ip_to_int, ips_to_uint32
+from ipaddress import IPv4Address, IPv4Network, IPv6Network
 
 
 @pytest.mark.parametrize(
@@ -57,3 +58,108 @@ def test_network_address_calculation():
 def test_return_types():
     assert isinstance(cidr_to_int("10.0.0.0/8", True), tuple)
     assert isinstance(cidr_to_int("10.0.0.0/8", False), int)
+
+
+@pytest.mark.parametrize(
+    "ip,expected",
+    [
+        ("0.0.0.0", 0),
+        ("10.0.0.1", 167772161),
+        ("192.168.1.255", 3232236031),
+        ("255.255.255.255", 4294967295),
+    ],
+)
+def test_ip_to_int(ip, expected):
+    assert ip_to_int(ip) == expected
+    assert cidr_to_int(ip, with_broadcast=False) == expected
+    assert cidr_to_int(ip, with_broadcast=True) == (expected, expected)
+
+
+@pytest.mark.parametrize(
+    "ip", ["", "1.2.3", "1.2.3.256", "010.0.0.1", " 1.2.3.4", "1.2.3.4/24", "::1::"]
+)
+def test_ip_to_int_invalid(ip):
+    with pytest.raises(ValueError):
+        ip_to_int(ip)
+
+
+@pytest.mark.parametrize(
+    "cidr",
+    [
+        "192.168.1.77/24",
+        "10.1.2.3/8",
+        "1.2.3.4/0",
+        "1.2.3.4/32",
+        "1.2.3.4/024",
+        "10.0.0.0/255.0.0.0",
+    ],
+)
+def test_cidr_to_int_matches_ipv4network(cidr):
+    network = IPv4Network(cidr, strict=False)
+    expected = int(network.network_address), int(network.broadcast_address)
+    assert cidr_to_int(cidr) == expected
+    assert cidr_to_int(network) == expected
+
+
+@pytest.mark.parametrize("cidr", ["1.2.3.4/33", "1.2.3.4/-1", "1.2.3.4/", "1.2.3/8"])
+def test_cidr_to_int_invalid_prefix(cidr):
+    with pytest.raises(ValueError):
+        cidr_to_int(cidr)
+
+
+@pytest.mark.parametrize(
+    "ips",
+    [
+        ["10.0.0.1", "0.0.0.0", "255.255.255.255"],
+        [b"10.0.0.1", b"0.0.0.0", b"255.255.255.255"],
+        b"10.0.0.1\n0.0.0.0\n255.255.255.255\n",
+        np.array(["10.0.0.1", "0.0.0.0", "255.255.255.255"]),
+    ],
+)
+def test_ips_to_uint32(ips):
+    result = ips_to_uint32(ips)
+    assert result.dtype == np.uint32
+    assert result.tolist() == [167772161, 0, 4294967295]
+
+
+def test_ips_to_uint32_cidr_fallback():
+    assert ips_to_uint32(["10.0.0.1", "10.1.0.0/16"]).tolist() == [167772161, 167837696]
+
+
+def test_ips_to_uint32_invalid():
+    with pytest.raises(ValueError):
+        ips_to_uint32(["10.0.0.1", "invalid"])
+
+
+@pytest.mark.parametrize(
+    "ip,expected",
+    [
+        ("::ffff:10.0.0.1", 167772161),
+        ("::10.0.0.1", 167772161),
+        ("2001:db8::1", 0x20010DB8000000000000000000000001),
+        ("ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff", 2**128 - 1),
+    ],
+)
+def test_ip_to_int_ipv6(ip, expected):
+    assert ip_to_int(ip) == expected
+    assert cidr_to_int(ip, with_broadcast=False) == expected
+
+
+@pytest.mark.parametrize(
+    "cidr,expected",
+    [
+        ("2001:db8::/32", (0x20010DB8 << 96, (0x20010DB9 << 96) - 1)),
+        ("2001:db8::1/128", (0x20010DB8 << 96 | 1, 0x20010DB8 << 96 | 1)),
+        ("::/0", (0, 2**128 - 1)),
+        ("::ffff:10.0.0.0/104", (167772160, 184549375)),
+    ],
+)
+def test_cidr_to_int_ipv6(cidr, expected):
+    assert cidr_to_int(cidr) == expected
+    assert cidr_to_int(IPv6Network(cidr, strict=False)) == expected
+
+
+@pytest.mark.parametrize("cidr", ["2001:db8::/129", "2001:db8::/", "2001:db8:::/32"])
+def test_cidr_to_int_ipv6_invalid(cidr):
+    with pytest.raises(ValueError):
+        cidr_to_int(cidr)
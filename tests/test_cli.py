@@ -0,0 +1,208 @@
+import pytest
+import io
+import json
+from cdb import CdbReader, GeoRecords, read_cdb, write_cdb
+from cdb.cli import describe_cdb, lookup_stream, main
+
+NET6 = 0x20010DB8 << 96
+NETWORKS = [(167772160, 184549375, 0), (200, 300, 1), (NET6, NET6 + 2**96 - 1, 2)]
+MAPPING = {0: ("Country1", "City1"), 1: ("Country\t2", "City2"), 2: ("Country3", "")}
+
+
+@pytest.fixture
+def cdb_path(tmp_path):
+    path = str(tmp_path / "data.cdb")
+    write_cdb(NETWORKS, MAPPING, path, jump_table=True)
+    return path
+
+
+def test_inspect(cdb_path, capsys):
+    info = describe_cdb(cdb_path)
+    assert (info["ranges"], info["ranges6"], info["geos"]) == (2, 1, 3)
+    assert {s["tag"] for s in info["sections"]} >= {"STA4", "STA6", "JMP4"}
+
+    assert main(["inspect", cdb_path, "--json"]) == 0
+    assert json.loads(capsys.readouterr().out) == info
+    assert main(["inspect", cdb_path]) == 0
+    assert "ranges: 2 IPv4, 1 IPv6" in capsys.readouterr().out
+
+
+def test_inspect_legacy(tmp_path):
+    path = str(tmp_path / "legacy.cdb")
+    write_cdb(NETWORKS[:2], MAPPING, path, version=1)
+    info = describe_cdb(path)
+    assert (info["version"], info["ranges"], info["geos"]) == (1, 2, 3)
+    assert sum(s["size"] for s in info["sections"]) + 4 == info["size"]
+
+
+def test_lookup_tsv(cdb_path):
+    source = io.StringIO("10.1.2.3\n0.0.0.250\r\nbad\n\n2001:db8::1\n1.2.3.4\n")
+    output = io.StringIO()
+    with CdbReader(cdb_path) as reader:
+        assert lookup_stream(reader, source, output, batch_size=4) == 6
+
+    assert output.getvalue().splitlines() == [
+        "10.1.2.3\tCountry1\tCity1",
+        "0.0.0.250\tCountry 2\tCity2",
+        "bad\tUnknown\tUnknown",
+        "\tUnknown\tUnknown",
+        "2001:db8::1\tCountry3\t",
+        "1.2.3.4\tUnknown\tUnknown",
+    ]
+
+
+def test_lookup_jsonl_field(cdb_path):
+    source = io.StringIO("GET /a 10.0.0.1 200\nGET /b\n")
+    output = io.StringIO()
+    with CdbReader(cdb_path) as reader:
+        lookup_stream(reader, source, output, "jsonl", field=3)
+
+    assert [json.loads(line) for line in output.getvalue().splitlines()] == [
+        {
+            "line": "GET /a 10.0.0.1 200",
+            "ip": "10.0.0.1",
+            "country": "Country1",
+            "city": "City1",
+        },
+        {"line": "GET /b", "ip": "", "country": "Unknown", "city": "Unknown"},
+    ]
+
+
+def test_lookup_command(cdb_path, tmp_path, capsys):
+    input_path = tmp_path / "ips.txt"
+    input_path.write_text("a,10.0.0.1\nb,0.0.2.0\n")
+    argv = ["lookup", cdb_path, str(input_path), "--field", "2", "--delimiter", ","]
+    assert main(argv) == 0
+    assert capsys.readouterr().out == (
+        "a,10.0.0.1\tCountry1\tCity1\nb,0.0.2.0\tUnknown\tUnknown\n"
+    )
+
+
+def test_merge_and_compact_commands(cdb_path, tmp_path):
+    other_path = str(tmp_path / "other.cdb")
+    merged_path = str(tmp_path / "merged.cdb")
+    write_cdb(
+        [(301, 400, 0), (100, 250, 1)], {0: ("A", "B"), 1: ("C", "D")}, other_path
+    )
+
+    assert main(["merge", merged_path, cdb_path, other_path]) == 0
+    triples, mapping = read_cdb(merged_path)
+    assert [(a, b, mapping[c]) for a, b, c in triples[:3]] == [
+        (100, 199, ("C", "D")),
+        (200, 300, ("Country\t2", "City2")),
+        (301, 400, ("A", "B")),
+    ]
+
+    assert main(["compact", merged_path, "--jump-table"]) == 0
+    assert "JMP4" in {s["tag"] for s in describe_cdb(merged_path)["sections"]}
+
+
+def test_overlay_and_fold_commands(cdb_path, tmp_path, capsys):
+    changes_path = tmp_path / "changes.tsv"
+    changes_path.write_text("# overrides\n0.0.0.0/24\tHome\tLab\n\n10.0.0.0/16\n")
+    overlay_path = str(tmp_path / "overlay.cdb")
+    folded_path = str(tmp_path / "folded.cdb")
+
+    assert main(["overlay", overlay_path, str(changes_path)]) == 0
+    source = tmp_path / "ips.txt"
+    source.write_text("0.0.0.250\n10.0.0.1\n10.1.0.1\n")
+    capsys.readouterr()
+    assert main(["lookup", cdb_path, str(source), "--overlay", overlay_path]) == 0
+    assert capsys.readouterr().out.splitlines() == [
+        "0.0.0.250\tHome\tLab",
+        "10.0.0.1\tUnknown\tUnknown",
+        "10.1.0.1\tCountry1\tCity1",
+    ]
+
+    assert main(["fold", folded_path, cdb_path, overlay_path, "--compact"]) == 0
+    assert capsys.readouterr().err.startswith("Removed 0 ranges\n")
+    assert main(["lookup", folded_path, str(source)]) == 0
+    assert capsys.readouterr().out.splitlines()[:2] == [
+        "0.0.0.250\tHome\tLab",
+        "10.0.0.1\tUnknown\tUnknown",
+    ]
+
+    changes_path.write_text("10.0.0.0/16\tonly country\n")
+    assert main(["overlay", overlay_path, str(changes_path)]) == 1
+    assert "Line 1" in capsys.readouterr().err
+
+
+def test_validate_command(cdb_path, capsys):
+    assert main(["validate", cdb_path]) == 0
+    assert "ok (full)" in capsys.readouterr().out
+    assert main(["validate", cdb_path, "--mode", "sampled", "--json"]) == 0
+    assert json.loads(capsys.readouterr().out)["mode"] == "sampled"
+
+    offset = next(
+        s["offset"] for s in describe_cdb(cdb_path)["sections"] if s["tag"] == "STA4"
+    )
+    with open(cdb_path, "r+b") as file:
+        file.seek(offset)
+        file.write(b"\xff")
+    assert main(["validate", cdb_path, "--mode", "header"]) == 0
+    capsys.readouterr()
+    assert main(["validate", cdb_path]) == 1
+    assert "STA4 checksum mismatch" in capsys.readouterr().err
+
+
+def test_errors(tmp_path, capsys):
+    assert main(["inspect", str(tmp_path / "missing.cdb")]) == 1
+    assert capsys.readouterr().err.startswith("cdb: ")
+    with pytest.raises(SystemExit):
+        main(["lookup", "x.cdb", "--field", "0"])
+
+
+def test_damaged_files(tmp_path, capsys):
+    legacy = str(tmp_path / "legacy.cdb")
+    write_cdb(NETWORKS[:2], MAPPING, legacy, version=1)
+    with open(legacy, "rb") as file:
+        data = file.read()
+    garbage = tmp_path / "garbage.cdb"
+    garbage.write_bytes(bytes(range(100)) * 2)
+    ips = tmp_path / "ips.txt"
+    ips.write_text("1.2.3.4\n")
+
+    for content in (data[:40], data[:-3], b"x"):
+        (tmp_path / "truncated.cdb").write_bytes(content)
+        with pytest.raises(ValueError, match="truncated"):
+            describe_cdb(str(tmp_path / "truncated.cdb"))
+
+    (tmp_path / "truncated.cdb").write_bytes(data[:40])
+    for argv in (
+        ["inspect", str(garbage)],
+        ["lookup", str(garbage), str(ips)],
+        ["compact", str(tmp_path / "truncated.cdb")],
+    ):
+        assert main(argv) == 1
+        assert capsys.readouterr().err.startswith("cdb: ")
+
+
+def test_lookup_fields(tmp_path, capsys):
+    path = str(tmp_path / "records.cdb")
+    records = GeoRecords(["country_code", "latitude"], {0: ("C1", 1.5)})
+    write_cdb(NETWORKS[:2], MAPPING, path, records=records)
+    assert describe_cdb(path)["fields"] == ["country_code", "latitude"]
+
+    with CdbReader(path) as reader:
+        output = io.StringIO()
+        lookup_stream(
+            reader, io.StringIO("10.0.0.1\n0.0.1.0\n"), output, fields=["latitude"]
+        )
+        assert output.getvalue() == (
+            "10.0.0.1\tCountry1\tCity1\t1.5\n0.0.1.0\tCountry 2\tCity2\t\n"
+        )
+        output = io.StringIO()
+        lookup_stream(
+            reader, io.StringIO("1.1.1.1\n"), output, "jsonl", fields=["latitude"]
+        )
+        assert json.loads(output.getvalue()) == {
+            "ip": "1.1.1.1",
+            "country": "Unknown",
+            "city": "Unknown",
+            "latitude": None,
+        }
+        with pytest.raises(ValueError):
+            lookup_stream(reader, io.StringIO(""), output, fields=["asn"])
+
+    with pytest.raises(SystemExit):
+        main(["lookup", path, "--fields", "population"])
@@ -0,0 +1,95 @@
+import pytest
+import os
+from tempfile import NamedTemporaryFile
+from cdb import (
+    LEGACY_VERSION,
+    compact,
+    compact_cdb,
+    merge_cdbs,
+    merge_cdbs_and_save,
+    read_cdb,
+    search_geo,
+    write_cdb,
+)
+
+
+@pytest.fixture
+def cdb_file():
+    paths = []
+
+    def _create(networks, mapping, version=None):
+        with NamedTemporaryFile(delete=False) as tmp_file:
+            paths.append(tmp_file.name)
+        if version is None:
+            write_cdb(networks, mapping, tmp_file.name)
+        else:
+            write_cdb(networks, mapping, tmp_file.name, version)
+        return tmp_file.name
+
+    yield _create
+    for path in paths:
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+@pytest.mark.parametrize(
+    "triples,expected",
+    [
+        ([], []),
+        ([(1, 2, 0)], [(1, 2, 0)]),
+        ([(1, 2, 0), (3, 4, 0)], [(1, 4, 0)]),
+        ([(1, 2, 0), (4, 5, 0)], [(1, 2, 0), (4, 5, 0)]),
+        ([(1, 2, 0), (3, 4, 1), (5, 6, 0)], [(1, 2, 0), (3, 4, 1), (5, 6, 0)]),
+        ([(1, 10, 0), (3, 4, 0), (8, 12, 0)], [(1, 12, 0)]),
+        ([(5, 6, 0), (1, 2, 0), (3, 4, 0)], [(1, 6, 0)]),
+    ],
+)
+def test_compact(triples, expected):
+    compacted, removed = compact(triples)
+    assert compacted == expected
+    assert removed == len(triples) - len(expected)
+
+
+def test_compact_preserves_lookups():
+    triples = [(i * 10, i * 10 + 9, i // 5) for i in range(100)]
+    mapping = {i: (f"Country{i}", f"City{i}") for i in range(20)}
+    compacted, removed = compact(triples)
+    assert len(compacted) == 20
+    assert removed == 80
+    for value in range(0, 1010, 3):
+        assert search_geo(compacted, value, mapping) == search_geo(
+            triples, value, mapping
+        )
+
+
+@pytest.mark.parametrize("version", [None, LEGACY_VERSION])
+def test_compact_cdb_in_place(cdb_file, version):
+    path = cdb_file(
+        [(1, 2, 0), (3, 4, 0), (5, 6, 1)], {0: ("A", "B"), 1: ("C", "D")}, version
+    )
+    assert compact_cdb(path) == 1
+    assert read_cdb(path) == ([(1, 4, 0), (5, 6, 1)], {0: ("A", "B"), 1: ("C", "D")})
+
+
+def test_compact_cdb_to_output(cdb_file):
+    path = cdb_file([(1, 2, 0), (3, 4, 0)], {0: ("A", "B")})
+    output_path = path + ".compact"
+    try:
+        assert compact_cdb(path, output_path) == 1
+        assert read_cdb(output_path)[0] == [(1, 4, 0)]
+        assert read_cdb(path)[0] == [(1, 2, 0), (3, 4, 0)]
+    finally:
+        os.unlink(output_path)
+
+
+def test_merge_compact(cdb_file):
+    file1 = cdb_file([(1, 2, 0)], {0: ("A", "B")})
+    file2 = cdb_file([(3, 4, 0)], {0: ("A", "B")})
+    networks, _ = merge_cdbs(file1, file2, compact=True)
+    assert networks == [(1, 4, 0)]
+
+    output_path = cdb_file([], {})
+    assert merge_cdbs_and_save(output_path, file1, file2, compact=True) == 1
+    assert read_cdb(output_path)[0] == [(1, 4, 0)]
+    assert merge_cdbs_and_save(output_path, file1, file2) == 0
+    assert read_cdb(output_path)[0] == [(1, 2, 0), (3, 4, 0)]
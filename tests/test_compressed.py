@@ -0,0 +1,179 @@
+import pytest
+import random
+import struct
+import numpy as np
+from cdb import (
+    FLAG_COMPRESSED,
+    VALIDATE_FULL,
+    VALIDATE_HEADER,
+    VALIDATE_SAMPLED,
+    CdbReader,
+    CdbWriter,
+    GeoRecords,
+    LayeredCdb,
+    deserialize,
+    deserialize_arrays,
+    read_cdb,
+    serialize,
+    validate_cdb,
+    write_cdb,
+    write_overlay,
+)
+from cdb.cdb import _decode_blocks, _encode_blocks, _read_header
+from cdb.cli import describe_cdb, main
+
+NET6 = 0x20010DB8 << 96
+MAPPING = {i: (f"Country{i}", f"City{i}") for i in range(300)}
+
+
+def networks(count: int, seed: int = 0) -> list[tuple[int, int, int]]:
+    rng = random.Random(seed)
+    start = 0
+    triples = []
+    for _ in range(count):
+        start += rng.choice((1, 1, 1, 256))
+        end = start + rng.choice((0, 15, 255, 4095))
+        triples.append((start, end, rng.randrange(300)))
+        start = end
+    return triples + [(NET6, NET6 + 255, 1), (NET6 + 256, NET6 + 511, 2)]
+
+
+@pytest.fixture
+def paths(tmp_path):
+    compressed = str(tmp_path / "compressed.cdb")
+    plain = str(tmp_path / "plain.cdb")
+    write_cdb(networks(5000), MAPPING, compressed, compress=True)
+    write_cdb(networks(5000), MAPPING, plain)
+    return compressed, plain
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 3, 32, 256])
+def test_blocks_roundtrip(block_size):
+    ranges = np.array(networks(1000)[:-2], dtype=np.int64)
+    block_starts, offsets, data = _encode_blocks(ranges, block_size)
+    assert len(block_starts) == -(-len(ranges) // block_size)
+    columns = _decode_blocks(
+        block_starts, offsets, np.frombuffer(data, dtype=np.uint8), len(ranges)
+    )
+    assert np.array_equal(np.stack(columns, 1), ranges)
+
+
+def range_sections_size(data: bytes) -> int:
+    _, _, _, sections = _read_header(data)
+    return sum(
+        size
+        for tag, (_, size) in sections.items()
+        if tag in (b"STA4", b"END4", b"GID4", b"BST4", b"BOF4", b"BLKS")
+    )
+
+
+def test_serialize_compressed():
+    triples = networks(3000)
+    data = serialize(triples, MAPPING, compress=True)
+    plain = serialize(triples, MAPPING)
+    assert range_sections_size(data) < range_sections_size(plain) * 0.6
+    assert len(data) < len(plain)
+    assert deserialize(data) == (triples, MAPPING)
+
+    ipv4, ipv6, mapping = deserialize_arrays(data)
+    assert ipv4.tolist() == [list(t) for t in triples[:-2]]
+    assert len(ipv6) == 2 and mapping == MAPPING
+    assert deserialize(serialize([], {}, compress=True)) == ([], {})
+
+    with pytest.raises(ValueError, match="no jump table"):
+        serialize(triples, MAPPING, jump_table=True, compress=True)
+    with pytest.raises(ValueError):
+        serialize(triples, MAPPING, version=1, compress=True)
+
+
+def test_reader_lookups(paths):
+    compressed, plain = paths
+    rng = random.Random(1)
+    limit = networks(5000)[-3][1] + 10
+    values = [rng.randrange(limit) for _ in range(3000)]
+    values += [0, 1, NET6 - 1, NET6, NET6 + 300, NET6 + 512]
+
+    with CdbReader(compressed) as reader, CdbReader(plain) as expected:
+        assert reader.flags & FLAG_COMPRESSED
+        assert len(reader) == len(expected)
+        assert list(reader) == list(expected)
+        for value in values:
+            assert reader.lookup(value) == expected.lookup(value)
+        array = np.array(values[:-4], dtype=np.int64)
+        assert np.array_equal(reader.lookup_ids(array), expected.lookup_ids(array))
+
+        for options in ({"jump_table": True}, {"block_cache": 0}, {"block_cache": 2}):
+            with CdbReader(compressed, **options) as cached:
+                for value in values[:500]:
+                    assert cached.lookup_id(value) == expected.lookup_id(value)
+                assert len(cached._blocks) <= options.get("block_cache", 1024)
+
+
+def test_writer_matches_serialize(tmp_path):
+    path = str(tmp_path / "data.cdb")
+    triples = networks(20000)
+    records = GeoRecords(["country_code"], {0: ("C0",), 1: ("C1",)})
+    with CdbWriter(path, buffer_size=1000, compress=True) as writer:
+        writer.extend(triples[::-1])
+        writer.finish(MAPPING, records)
+    with open(path, "rb") as file:
+        assert file.read() == serialize(
+            triples, MAPPING, records=records, compress=True
+        )
+
+    with CdbReader(path) as reader:
+        assert reader.lookup_record(triples[0][0])["country_code"] in ("C0", "C1", "")
+    with pytest.raises(ValueError, match="no jump table"):
+        CdbWriter(path, jump_table=True, compress=True)
+
+
+def test_validate_compressed(paths):
+    compressed, _ = paths
+    assert validate_cdb(compressed)["checked_ranges"] == 5002
+    assert 64 <= validate_cdb(compressed, VALIDATE_SAMPLED, 64)["checked_ranges"] < 5002
+
+    offset, size = next(
+        (s["offset"], s["size"])
+        for s in describe_cdb(compressed)["sections"]
+        if s["tag"] == "BLKS"
+    )
+    with open(compressed, "r+b") as file:
+        file.seek(offset + size // 2)
+        file.write(b"\xff\xff")
+    assert validate_cdb(compressed, VALIDATE_HEADER)
+    with pytest.raises(ValueError, match="BLKS checksum mismatch"):
+        validate_cdb(compressed, VALIDATE_FULL)
+    with pytest.raises(ValueError):
+        CdbReader(compressed, validate=VALIDATE_FULL)
+
+
+def test_invalid_block_index(paths):
+    compressed, _ = paths
+    offset = next(
+        s["offset"] for s in describe_cdb(compressed)["sections"] if s["tag"] == "BOF4"
+    )
+    with open(compressed, "r+b") as file:
+        file.seek(offset)
+        file.write(struct.pack("<I", 1 << 30))
+    with pytest.raises(ValueError):
+        read_cdb(compressed)
+
+
+def test_compress_commands(paths, tmp_path):
+    compressed, plain = paths
+    merged = str(tmp_path / "merged.cdb")
+    overlay = str(tmp_path / "overlay.cdb")
+    write_overlay(overlay, {(10, 19): ("Internal", "HQ")})
+
+    assert main(["merge", merged, plain, "--compress"]) == 0
+    assert main(["compact", plain, "--compress"]) == 0
+    assert main(["fold", merged, merged, overlay, "--compress"]) == 0
+    assert main(["compact", plain, "--compress", "--jump-table"]) == 1
+    for path in (merged, plain):
+        assert describe_cdb(path)["flags"] & FLAG_COMPRESSED
+
+    with LayeredCdb(compressed, overlay) as layered, CdbReader(merged) as reader:
+        assert reader.lookup(15) == ("Internal", "HQ")
+        assert [(a, b, reader.mapping[c]) for a, b, c in reader] == [
+            (a, b, layered.mapping[c]) for a, b, c in layered
+        ]
@@ -0,0 +1,114 @@
+import pytest
+import os
+import time
+from tempfile import NamedTemporaryFile
+from cdb import (
+    CdbDatabase,
+    LookupCache,
+    search_geo,
+    search_geo_batch,
+    write_cdb,
+)
+
+
+@pytest.fixture
+def cdb_path():
+    with NamedTemporaryFile(delete=False) as tmp_file:
+        path = tmp_file.name
+    write_cdb([(10, 20, 0)], {0: ("Country1", "City1")}, path)
+    yield path
+    os.unlink(path)
+
+
+def test_database_lookup(cdb_path):
+    with CdbDatabase(cdb_path, interval=None) as db:
+        assert db.generation == 0
+        assert len(db) == 1
+        assert db.lookup(15) == ("Country1", "City1")
+        assert search_geo(db, 25) == ("Unknown", "Unknown")
+        assert search_geo_batch(db, [15, 25]) == [
+            ("Country1", "City1"),
+            ("Unknown", "Unknown"),
+        ]
+
+
+def test_database_reload(cdb_path):
+    with CdbDatabase(cdb_path, interval=None) as db:
+        assert not db.reload()
+
+        old = db.reader
+        write_cdb([(10, 30, 0)], {0: ("Country2", "City2")}, cdb_path)
+        assert db.reload()
+        assert not db.reload()
+        assert db.generation == 1
+        assert db.lookup(25) == ("Country2", "City2")
+        assert old.lookup(15) == ("Country1", "City1")
+        assert old.lookup(25) == ("Unknown", "Unknown")
+
+
+def test_database_keeps_version_on_broken_file(cdb_path):
+    with CdbDatabase(cdb_path, interval=None) as db:
+        with open(cdb_path + ".new", "wb") as file:
+            file.write(b"\x89CDB\r\n\x1a\ngarbage")
+        os.replace(cdb_path + ".new", cdb_path)
+
+        assert not db.reload()
+        assert db.last_error is not None
+        assert db.generation == 0
+        assert db.lookup(15) == ("Country1", "City1")
+
+        write_cdb([(10, 30, 0)], {0: ("Country2", "City2")}, cdb_path)
+        assert db.reload()
+        assert db.last_error is None
+
+
+def test_database_watches_file(cdb_path):
+    with CdbDatabase(cdb_path, interval=0.01) as db:
+        write_cdb([(10, 30, 0)], {0: ("Country2", "City2")}, cdb_path)
+        deadline = time.monotonic() + 5
+        while db.generation == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert db.generation == 1
+        assert db.lookup(25) == ("Country2", "City2")
+
+
+def test_database_invalidates_cache(cdb_path):
+    with CdbDatabase(cdb_path, interval=None) as db:
+        cache = LookupCache(db)
+        assert cache.lookup(15) == ("Country1", "City1")
+
+        write_cdb([(10, 20, 0)], {0: ("Country2", "City2")}, cdb_path)
+        db.reload()
+        assert cache.lookup(15) == ("Country2", "City2")
+
+
+class ReloadingDatabase(CdbDatabase):
+    # Reloads while a geo id is looked up, as if a reload landed between
+    # reading the mapping and the id.
+    def lookup_id(self, value):
+        self.reload(force=True)
+        return super().lookup_id(value)
+
+    def lookup_ids(self, values):
+        ids = super().lookup_ids(values)
+        self.reload(force=True)
+        return ids
+
+
+@pytest.mark.parametrize(
+    "lookup",
+    [
+        lambda db: search_geo(db, 15),
+        lambda db: search_geo_batch(db, [15, 25])[0],
+        lambda db: LookupCache(db).lookup(15),
+        lambda db: db.lookup(15),
+    ],
+)
+def test_lookups_use_one_version(cdb_path, lookup):
+    # Every build renumbers the geos, so an id from one version names
+    # another geo in the next one.
+    write_cdb([(10, 20, 1)], {0: ("X", "Y"), 1: ("Country1", "City1")}, cdb_path)
+    with ReloadingDatabase(cdb_path, interval=None) as db:
+        write_cdb([(10, 20, 0)], {0: ("Country1", "City1"), 1: ("X", "Y")}, cdb_path)
+        assert lookup(db) == ("Country1", "City1")
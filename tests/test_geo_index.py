@@ -0,0 +1,144 @@
+import pytest
+import os
+from tempfile import NamedTemporaryFile
+from cdb import CdbReader, CdbWriter, GeoIndex, read_cdb, search_geo, write_cdb
+
+
+@pytest.fixture
+def sample_index():
+    data = [(30, 40, 2), (10, 20, 1), (50, 60, 3)]
+    mapping = {1: ("A", "B"), 2: ("C", "D"), 3: ("E", "F")}
+    return GeoIndex(data, mapping)
+
+
+def test_index_lookup(sample_index):
+    assert len(sample_index) == 3
+    assert sample_index.lookup(15) == ("A", "B")
+    assert sample_index.lookup(30) == ("C", "D")
+    assert sample_index.lookup(60) == ("E", "F")
+    assert sample_index.lookup_id(45) is None
+
+
+@pytest.mark.parametrize("value", [0, 9, 21, 45, 61, 2**32])
+def test_index_no_match(sample_index, value):
+    assert sample_index.lookup(value) == ("Unknown", "Unknown")
+
+
+def test_search_geo_accepts_index(sample_index):
+    assert search_geo(sample_index, 35) == ("C", "D")
+    assert search_geo(sample_index, 25) == ("Unknown", "Unknown")
+    assert search_geo(sample_index, 35, {2: ("X", "Y")}) == ("X", "Y")
+
+
+def test_search_geo_accepts_reader():
+    with NamedTemporaryFile(delete=False) as tmp_file:
+        tmp_path = tmp_file.name
+
+    try:
+        write_cdb([(10, 20, 1)], {1: ("A", "B")}, tmp_path)
+        with CdbReader(tmp_path) as reader:
+            assert search_geo(reader, 15) == ("A", "B")
+    finally:
+        os.unlink(tmp_path)
+
+
+def test_index_string_ip():
+    index = GeoIndex([(167772160, 184549375, 0)], {0: ("Country1", "City1")})
+    assert search_geo(index, "10.20.30.40") == ("Country1", "City1")
+
+
+def test_index_matches_search_geo():
+    data = [(i * 10, i * 10 + 9, i) for i in range(1000)]
+    mapping = {i: (f"Country{i}", f"City{i}") for i in range(0, 1000, 2)}
+    index = GeoIndex(data, mapping)
+    for value in range(0, 10010, 13):
+        assert search_geo(index, value) == search_geo(data, value, mapping)
+
+
+def test_index_from_cdb():
+    with NamedTemporaryFile(delete=False) as tmp_file:
+        tmp_path = tmp_file.name
+
+    try:
+        write_cdb([(10, 20, 1), (30, 40, 2)], {1: ("A", "B"), 2: ("C", "D")}, tmp_path)
+        index = GeoIndex.from_cdb(tmp_path)
+        assert index.lookup(35) == ("C", "D")
+    finally:
+        os.unlink(tmp_path)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        [(20, 10, 0)],
+        [(10, 20, 0), (15, 30, 1)],
+        [(10, 20, 0), (20, 30, 1)],
+        [(10, 100, 0), (20, 30, 1), (40, 50, 2)],
+    ],
+)
+def test_index_invalid_ranges(data):
+    with pytest.raises(ValueError):
+        GeoIndex(data, {}, strict=True)
+    if data[0][0] > data[0][1]:
+        with pytest.raises(ValueError):
+            GeoIndex(data, {})
+
+
+def test_index_resolves_overlaps():
+    index = GeoIndex([(10, 20, 0), (15, 30, 1), (10, 100, 2), (40, 50, 3)], {})
+    assert list(zip(index.starts, index.ends, index.geo_ids)) == [
+        (10, 14, 2),
+        (15, 30, 1),
+        (31, 39, 2),
+        (40, 50, 3),
+        (51, 100, 2),
+    ]
+    assert GeoIndex([(10, 20, 0), (10, 20, 1)], {}).lookup_id(15) == 1
+
+
+def write_with_writer(data, mapping, path, **kwargs):
+    with CdbWriter(path, **kwargs) as writer:
+        writer.extend(data)
+        writer.finish(mapping)
+
+
+@pytest.mark.parametrize(
+    "write",
+    [
+        write_cdb,
+        lambda *args: write_cdb(*args, compress=True),
+        write_with_writer,
+        lambda *args: write_with_writer(*args, buffer_size=1),
+        lambda *args: write_with_writer(*args, compact=True),
+    ],
+)
+@pytest.mark.parametrize("offset", [0, 2**64])
+def test_overlaps_resolve_the_same_everywhere(write, offset):
+    data = [
+        (a + offset, b + offset, c)
+        for a, b, c in [(35, 60, 3), (10, 100, 1), (30, 40, 2)]
+    ]
+    mapping = {i: (f"Country{i}", f"City{i}") for i in range(1, 4)}
+    expected = {5: None, 15: 1, 32: 2, 37: 3, 45: 3, 70: 1, 101: None}
+    with NamedTemporaryFile(delete=False) as tmp_file:
+        tmp_path = tmp_file.name
+
+    try:
+        write(data, mapping, tmp_path)
+        with CdbReader(tmp_path) as reader:
+            index = GeoIndex(data, mapping)
+            for value, geo_id in expected.items():
+                value += offset
+                assert reader.lookup_id(value) == geo_id
+                assert index.lookup_id(value) == geo_id
+                geo = mapping.get(geo_id, ("Unknown", "Unknown"))
+                assert search_geo(reader, value) == geo
+                assert search_geo(data, value, mapping) == geo
+            values = [value + offset for value in expected]
+            assert (
+                reader.lookup_ids(values).tolist() == index.lookup_ids(values).tolist()
+            )
+        ranges = [(a - offset, b - offset, c) for a, b, c in read_cdb(tmp_path)[0]]
+        assert ranges == [(10, 29, 1), (30, 34, 2), (35, 60, 3), (61, 100, 1)]
+    finally:
+        os.unlink(tmp_path)
@@ -0,0 +1,142 @@
+import pytest
+import math
+import os
+import struct
+from tempfile import NamedTemporaryFile
+from cdb import (
+    CdbDatabase,
+    CdbReader,
+    CdbWriter,
+    GeoRecords,
+    LEGACY_VERSION,
+    compact_cdb,
+    merge_cdbs_and_save,
+    read_cdb,
+    serialize,
+    write_cdb,
+)
+
+NETWORKS = [(100, 199, 0), (200, 299, 1), (300, 399, 2)]
+MAPPING = {0: ("Germany", "Munich"), 1: ("Germany", "Berlin"), 2: ("France", "")}
+FIELDS = ["country_code", "latitude", "asn"]
+ROWS = {0: ("DE", 48.1, 3320), 1: ("DE", 52.5, 3320), 2: ("FR", math.nan, 0)}
+
+
+@pytest.fixture
+def cdb_path():
+    with NamedTemporaryFile(delete=False) as tmp_file:
+        path = tmp_file.name
+    yield path
+    os.unlink(path)
+
+
+def test_records_roundtrip(cdb_path):
+    write_cdb(NETWORKS, MAPPING, cdb_path, records=GeoRecords(FIELDS, ROWS))
+
+    with CdbReader(cdb_path) as reader:
+        records = reader.records
+        assert records.fields == tuple(FIELDS)
+        assert records.row(0) == ROWS[0]
+        assert records.record(1) == {
+            "country_code": "DE",
+            "latitude": 52.5,
+            "asn": 3320,
+        }
+        assert math.isnan(records.value(2, "latitude"))
+        assert records.value(7, "asn", -1) == -1
+        assert records.row(7) is None
+        assert reader.lookup_record(250) == {
+            "country": "Germany",
+            "city": "Berlin",
+            **records.record(1),
+        }
+        assert records.values("country_code", [2, 0, 2, 9]) == ["FR", "DE", "FR", None]
+
+    assert read_cdb(cdb_path) == (NETWORKS, MAPPING)
+
+
+def test_records_decode_on_demand(cdb_path):
+    write_cdb(NETWORKS, MAPPING, cdb_path, records=GeoRecords(FIELDS, ROWS))
+
+    with CdbReader(cdb_path) as reader:
+        assert reader.records.value(0, "country_code") == "DE"
+        assert list(reader.mapping._names.values()) == ["DE"]
+        assert reader.records._columns.keys() == {"country_code"}
+        assert reader.records.value(1, "country_code") is reader.records.value(
+            0, "country_code"
+        )
+
+
+def test_records_missing_rows(cdb_path):
+    write_cdb(NETWORKS, MAPPING, cdb_path, records=GeoRecords(FIELDS, {1: ROWS[1]}))
+
+    with CdbReader(cdb_path) as reader:
+        assert reader.records.row(1) == ROWS[1]
+        code, latitude, asn = reader.records.row(0)
+        assert (code, asn) == ("", 0) and math.isnan(latitude)
+        assert reader.records.row(0)[1] is reader.records.row(2)[1]
+
+
+def test_records_shared_string_pool():
+    mapping = {0: ("DE", "DE")}
+    plain = serialize(NETWORKS[:1], mapping)
+    buf = serialize(
+        NETWORKS[:1], mapping, records=GeoRecords(["country_code"], {0: ("DE",)})
+    )
+    assert buf.count(b"DE") == plain.count(b"DE") == 1
+
+
+def test_records_invalid():
+    with pytest.raises(ValueError):
+        GeoRecords(["population"])
+    with pytest.raises(ValueError):
+        serialize(NETWORKS, MAPPING, LEGACY_VERSION, records=GeoRecords(FIELDS))
+
+
+def test_records_truncated_section(cdb_path):
+    buf = bytearray(serialize(NETWORKS, MAPPING, records=GeoRecords(FIELDS, ROWS)))
+    offset = buf.index(b"RECS") + 4
+    struct.pack_into("<Q", buf, offset + 8, 8)
+    with open(cdb_path, "wb") as file:
+        file.write(buf)
+
+    with pytest.raises(ValueError):
+        CdbReader(cdb_path)
+
+
+def test_writer_compact_and_database_records(cdb_path):
+    with CdbWriter(cdb_path) as writer:
+        writer.extend(NETWORKS + [(400, 499, 0)])
+        writer.finish(MAPPING, GeoRecords(FIELDS, ROWS))
+
+    compact_cdb(cdb_path)
+    with CdbDatabase(cdb_path, interval=None) as db:
+        assert db.records.fields == tuple(FIELDS)
+        assert db.lookup_record(450)["asn"] == 3320
+
+
+def test_merge_records(cdb_path):
+    with NamedTemporaryFile() as first, NamedTemporaryFile() as second:
+        write_cdb(NETWORKS, MAPPING, first.name, records=GeoRecords(FIELDS, ROWS))
+        write_cdb(
+            [(150, 249, 0), (500, 599, 1)],
+            {0: ("Germany", "Munich"), 1: ("Germany", "Munich")},
+            second.name,
+            records=GeoRecords(["time_zone"], {0: ("Europe/Berlin",)}),
+        )
+        merge_cdbs_and_save(cdb_path, first.name, second.name)
+
+    with CdbReader(cdb_path) as reader:
+        assert reader.records.fields == ("country_code", "latitude", "asn", "time_zone")
+        assert reader.lookup_record(150)["time_zone"] == ""
+        assert reader.lookup_record(250)["latitude"] == 52.5
+        record = reader.lookup_record(550)
+        assert math.isnan(record.pop("latitude"))
+        assert record == {
+            "country": "Germany",
+            "city": "Munich",
+            "country_code": "",
+            "asn": 0,
+            "time_zone": "",
+        }
+        assert len(reader.mapping) == 5
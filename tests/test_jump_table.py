@@ -0,0 +1,109 @@
+import pytest
+import os
+import random
+import struct
+from tempfile import NamedTemporaryFile
+from cdb import (
+    CdbReader,
+    CdbWriter,
+    GeoIndex,
+    LEGACY_VERSION,
+    FORMAT_VERSION,
+    build_jump_table,
+    search_geo,
+    serialize,
+    deserialize,
+    write_cdb,
+)
+
+
+@pytest.fixture
+def networks():
+    rng = random.Random(0)
+    bounds = sorted(rng.sample(range(2**32), 4000))
+    data = [(a, b, i % 5) for i, (a, b) in enumerate(zip(bounds[::2], bounds[1::2]))]
+    data += [(0, 0, 1), (2**32 - 1, 2**32 - 1, 2), (2**40, 2**41, 3)]
+    return data
+
+
+@pytest.fixture
+def values(networks):
+    rng = random.Random(1)
+    result = [rng.randrange(2**32) for _ in range(2000)]
+    result += [a for a, _, _ in networks] + [b for _, b, _ in networks]
+    result += [a - 1 for a, _, _ in networks] + [b + 1 for _, b, _ in networks]
+    result += [p << 16 for p in range(0, 1 << 16, 97)] + [-1, 2**32, 2**40 + 5]
+    return result
+
+
+@pytest.fixture
+def cdb_path():
+    with NamedTemporaryFile(delete=False) as tmp_file:
+        path = tmp_file.name
+    yield path
+    os.unlink(path)
+
+
+def test_build_jump_table():
+    table = build_jump_table([5, 70000, 70001, 2**32 - 1])
+    assert len(table) == 65537
+    assert table[:3].tolist() == [0, 1, 3]
+    assert table[65535] == 3
+    assert table[65536] == 4
+
+
+def test_index_jump_table_matches(networks, values):
+    plain = GeoIndex(networks, {})
+    index = GeoIndex(networks, {}, jump_table=True)
+    assert [index.lookup_id(v) for v in values] == [plain.lookup_id(v) for v in values]
+
+
+def test_serialize_jump_table(networks):
+    buf = serialize(networks, {}, jump_table=True)
+    assert b"JMP4" in buf
+    assert deserialize(buf) == deserialize(serialize(networks, {}))
+
+
+@pytest.mark.parametrize("use_writer", [False, True])
+def test_reader_persisted_jump_table(networks, values, cdb_path, use_writer):
+    mapping = {i: (f"Country{i}", f"City{i}") for i in range(5)}
+    if use_writer:
+        with CdbWriter(cdb_path, buffer_size=128, jump_table=True) as writer:
+            writer.extend(reversed(networks))
+            writer.finish(mapping)
+    else:
+        write_cdb(networks, mapping, cdb_path, jump_table=True)
+
+    index = GeoIndex(networks, mapping)
+    with CdbReader(cdb_path) as reader:
+        assert reader._jump is not None
+        assert (
+            list(reader._jump)
+            == build_jump_table(sorted(a for a, b, _ in networks if b < 2**32)).tolist()
+        )
+        for value in values:
+            assert search_geo(reader, value) == search_geo(index, value)
+
+
+@pytest.mark.parametrize("version", [LEGACY_VERSION, FORMAT_VERSION])
+def test_reader_jump_table_at_load(networks, values, cdb_path, version):
+    shuffled = networks[:]
+    random.Random(2).shuffle(shuffled)
+    write_cdb(shuffled, {}, cdb_path, version)
+
+    with CdbReader(cdb_path) as plain, CdbReader(cdb_path, jump_table=True) as reader:
+        assert plain._jump is None
+        assert [reader.lookup_id(v) for v in values] == [
+            plain.lookup_id(v) for v in values
+        ]
+
+
+def test_reader_invalid_jump_table(cdb_path):
+    buf = bytearray(serialize([(1, 2, 0)], {}, jump_table=True))
+    offset = buf.index(b"JMP4") + 4
+    struct.pack_into("<Q", buf, offset + 8, 12)
+    with open(cdb_path, "wb") as file:
+        file.write(buf)
+
+    with pytest.raises(ValueError):
+        CdbReader(cdb_path)
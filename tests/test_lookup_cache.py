@@ -0,0 +1,110 @@
+import pytest
+import threading
+from cdb import GeoIndex, LookupCache, search_geo
+
+
+@pytest.fixture
+def sample_index():
+    data = [(10, 20, 1), (30, 40, 2), (50, 60, 3)]
+    mapping = {1: ("A", "B"), 2: ("C", "D"), 3: ("E", "F")}
+    return GeoIndex(data, mapping)
+
+
+class CountingSource:
+    def __init__(self, index):
+        self.index = index
+        self.mapping = index.mapping
+        self.calls = 0
+        self.generation = 0
+
+    def lookup_id(self, value):
+        self.calls += 1
+        return self.index.lookup_id(value)
+
+
+def test_cache_hits_and_misses(sample_index):
+    source = CountingSource(sample_index)
+    cache = LookupCache(source, maxsize=10)
+
+    assert cache.lookup(15) == ("A", "B")
+    assert cache.lookup(15) == ("A", "B")
+    assert cache.lookup(25) == ("Unknown", "Unknown")
+    assert cache.lookup(25) == ("Unknown", "Unknown")
+    assert source.calls == 2
+    assert cache.stats() == {
+        "size": 2,
+        "maxsize": 10,
+        "hits": 2,
+        "misses": 2,
+        "evictions": 0,
+        "hit_rate": 0.5,
+    }
+
+
+def test_cache_evicts_least_recently_used(sample_index):
+    source = CountingSource(sample_index)
+    cache = LookupCache(source, maxsize=2)
+
+    cache.lookup_id(15)
+    cache.lookup_id(35)
+    cache.lookup_id(15)
+    cache.lookup_id(55)
+    assert len(cache) == 2
+    assert cache.evictions == 1
+
+    cache.lookup_id(15)
+    assert source.calls == 3
+    cache.lookup_id(35)
+    assert source.calls == 4
+
+
+def test_cache_string_ip():
+    cache = LookupCache(GeoIndex([(167772160, 184549375, 0)], {0: ("C1", "City1")}))
+    assert cache.lookup("10.0.0.1") == ("C1", "City1")
+    assert cache.lookup(167772161) == ("C1", "City1")
+    assert cache.hits == 1
+
+
+def test_cache_invalidated_on_generation_change(sample_index):
+    source = CountingSource(sample_index)
+    cache = LookupCache(source)
+
+    cache.lookup_id(15)
+    source.generation += 1
+    source.index = GeoIndex([(10, 20, 3)], sample_index.mapping)
+    assert cache.lookup(15) == ("E", "F")
+    assert source.calls == 2
+
+
+def test_cache_invalidated_on_source_change(sample_index):
+    cache = LookupCache(sample_index)
+    assert search_geo(cache, 15) == ("A", "B")
+
+    cache.source = GeoIndex([(10, 20, 2)], sample_index.mapping)
+    assert len(cache) == 0
+    assert search_geo(cache, 15) == ("C", "D")
+
+
+def test_cache_invalid_size(sample_index):
+    with pytest.raises(ValueError):
+        LookupCache(sample_index, maxsize=0)
+
+
+def test_cache_thread_safety(sample_index):
+    cache = LookupCache(sample_index, maxsize=16)
+    errors = []
+
+    def worker(offset):
+        for value in range(offset, offset + 2000):
+            if cache.lookup_id(value % 70) != sample_index.lookup_id(value % 70):
+                errors.append(value)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(cache) <= 16
+    assert cache.hits + cache.misses == 16000
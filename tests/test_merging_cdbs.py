@@ -1,7 +1,15 @@
 import pytest
 import os
 from tempfile import NamedTemporaryFile
-from cdb import write_cdb, merge_cdbs, merge_cdbs_and_save
+from cdb import (
+    MERGE_FIRST,
+    MERGE_LAST,
+    MERGE_MOST_SPECIFIC,
+    read_cdb,
+    write_cdb,
+    merge_cdbs,
+    merge_cdbs_and_save,
+)
 
 
 @pytest.fixture
@@ -16,7 +24,7 @@ def create_test_file():
 
 def test_merge_empty():
     result_networks, result_mapping = merge_cdbs()
-    assert result_networks == set()
+    assert result_networks == []
     assert result_mapping == {}
 
 
@@ -95,7 +103,142 @@ def test_merge_large_files(create_test_file):
     file2 = create_test_file(networks2, mapping2)
 
     result_networks, result_mapping = merge_cdbs(file1, file2)
-    assert len(result_networks) == 1000
+    assert len(result_networks) == 501
+    assert result_networks[:-1] == [(i, i + 1, 0) for i in range(0, 1000, 2)]
+    assert result_networks[-1] == (1000, 1000, 1)
     assert len(result_mapping) == 2
     os.unlink(file1)
     os.unlink(file2)
+
+
+@pytest.fixture
+def overlapping_files(create_test_file):
+    file1 = create_test_file([(0, 100, 0)], {0: ("Country1", "City1")})
+    file2 = create_test_file(
+        [(10, 20, 0), (90, 150, 1)],
+        {0: ("Country2", "City2"), 1: ("Country3", "City3")},
+    )
+    yield file1, file2
+    os.unlink(file1)
+    os.unlink(file2)
+
+
+def named(networks, mapping):
+    return [(a, b, mapping[c][0]) for a, b, c in networks]
+
+
+@pytest.mark.parametrize(
+    "policy,expected",
+    [
+        (MERGE_FIRST, [(0, 100, "Country1"), (101, 150, "Country3")]),
+        (
+            MERGE_LAST,
+            [
+                (0, 9, "Country1"),
+                (10, 20, "Country2"),
+                (21, 89, "Country1"),
+                (90, 150, "Country3"),
+            ],
+        ),
+        (
+            MERGE_MOST_SPECIFIC,
+            [
+                (0, 9, "Country1"),
+                (10, 20, "Country2"),
+                (21, 89, "Country1"),
+                (90, 150, "Country3"),
+            ],
+        ),
+    ],
+)
+def test_merge_policies(overlapping_files, policy, expected):
+    result_networks, result_mapping = merge_cdbs(*overlapping_files, policy=policy)
+    assert named(result_networks, result_mapping) == expected
+
+
+def test_merge_most_specific_prefers_smaller_range(create_test_file):
+    file1 = create_test_file([(50, 60, 0)], {0: ("Country1", "City1")})
+    file2 = create_test_file([(0, 100, 0)], {0: ("Country2", "City2")})
+    try:
+        result_networks, result_mapping = merge_cdbs(
+            file1, file2, policy=MERGE_MOST_SPECIFIC
+        )
+        assert named(result_networks, result_mapping) == [
+            (0, 49, "Country2"),
+            (50, 60, "Country1"),
+            (61, 100, "Country2"),
+        ]
+    finally:
+        os.unlink(file1)
+        os.unlink(file2)
+
+
+def test_merge_output_sorted_and_disjoint(create_test_file):
+    file1 = create_test_file(
+        [(i * 7, i * 7 + 10, i % 3) for i in range(200)],
+        {i: (f"Country{i}", "City") for i in range(3)},
+    )
+    file2 = create_test_file(
+        [(i * 11, i * 11 + 4, i % 2) for i in range(150)],
+        {i: (f"Other{i}", "City") for i in range(2)},
+    )
+    try:
+        for policy in (MERGE_FIRST, MERGE_LAST, MERGE_MOST_SPECIFIC):
+            result_networks, _ = merge_cdbs(file1, file2, policy=policy)
+            for (a1, b1, _), (a2, b2, _) in zip(result_networks, result_networks[1:]):
+                assert a1 <= b1 < a2 <= b2
+    finally:
+        os.unlink(file1)
+        os.unlink(file2)
+
+
+def test_merge_unknown_policy(create_test_file):
+    file1 = create_test_file([(10, 20, 0)], {0: ("Country1", "City1")})
+    try:
+        with pytest.raises(ValueError):
+            merge_cdbs(file1, policy="random")
+    finally:
+        os.unlink(file1)
+
+
+def test_merge_and_save_matches_merge(overlapping_files):
+    with NamedTemporaryFile(delete=False) as output_file:
+        output_path = output_file.name
+
+    try:
+        merge_cdbs_and_save(output_path, *overlapping_files, policy=MERGE_LAST)
+        assert read_cdb(output_path) == merge_cdbs(
+            *overlapping_files, policy=MERGE_LAST
+        )
+    finally:
+        os.unlink(output_path)
+
+
+def test_merge_ipv6(create_test_file):
+    net1, net2 = 0x20010DB8 << 96, 0x2A00 << 112
+    file1 = create_test_file(
+        [(10, 20, 0), (net1, net1 + 2**96 - 1, 0)], {0: ("Country1", "City1")}
+    )
+    file2 = create_test_file(
+        [(net1 + 2**64, net1 + 2**65 - 1, 0), (net2, net2 + 99, 1)],
+        {0: ("Country2", "City2"), 1: ("Country3", "City3")},
+    )
+    with NamedTemporaryFile(delete=False) as output_file:
+        output_path = output_file.name
+
+    try:
+        result_networks, result_mapping = merge_cdbs(file1, file2, policy=MERGE_LAST)
+        assert named(result_networks, result_mapping) == [
+            (10, 20, "Country1"),
+            (net1, net1 + 2**64 - 1, "Country1"),
+            (net1 + 2**64, net1 + 2**65 - 1, "Country2"),
+            (net1 + 2**65, net1 + 2**96 - 1, "Country1"),
+            (net2, net2 + 99, "Country3"),
+        ]
+
+        merge_cdbs_and_save(output_path, file1, file2, policy=MERGE_LAST)
+        assert read_cdb(output_path) == (result_networks, result_mapping)
+    finally:
+        os.unlink(file1)
+        os.unlink(file2)
+        os.unlink(output_path)
@@ -0,0 +1,160 @@
+import pytest
+import os
+import struct
+from tempfile import NamedTemporaryFile
+from cdb import (
+    CdbDatabase,
+    CdbReader,
+    GeoIndex,
+    LookupCache,
+    Metrics,
+    disable_metrics,
+    enable_metrics,
+    get_metrics,
+    merge_cdbs,
+    merge_cdbs_and_save,
+    read_cdb,
+    search_geo,
+    search_geo_batch,
+    write_cdb,
+)
+
+NETWORKS = [(10, 20, 0), (30, 40, 1)]
+MAPPING = {0: ("Country1", "City1"), 1: ("Country2", "City2")}
+
+
+@pytest.fixture
+def cdb_path():
+    with NamedTemporaryFile(delete=False) as tmp_file:
+        path = tmp_file.name
+    write_cdb(NETWORKS, MAPPING, path)
+    yield path
+    os.unlink(path)
+
+
+@pytest.fixture
+def metrics():
+    yield enable_metrics()
+    disable_metrics()
+
+
+def test_disabled_by_default(cdb_path):
+    assert get_metrics() is None
+    with CdbReader(cdb_path) as reader:
+        assert reader.lookup(15) == ("Country1", "City1")
+        assert search_geo_batch(reader, [15, 25]) == [
+            ("Country1", "City1"),
+            ("Unknown", "Unknown"),
+        ]
+
+
+def test_load_metrics(cdb_path, metrics):
+    size = os.path.getsize(cdb_path)
+    reader = CdbReader(cdb_path)
+    assert metrics.gauges["bytes_mapped"] == size
+    disable_metrics()
+    reader.close()
+    reader.close()
+    assert metrics.gauges["bytes_mapped"] == 0
+
+    enable_metrics(metrics)
+    assert read_cdb(cdb_path) == (NETWORKS, MAPPING)
+    with pytest.raises(FileNotFoundError):
+        CdbReader(cdb_path + ".missing")
+    with open(cdb_path, "r+b") as file:
+        file.truncate(20)
+    with pytest.raises(struct.error):
+        CdbReader(cdb_path)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["loads_total"] == 2
+    assert snapshot["load_errors_total"] == 1
+    assert snapshot["bytes_read_total"] == size
+    assert snapshot["histograms"]["load_seconds"]["count"] == 2
+
+
+def test_lookup_metrics(cdb_path, metrics):
+    index = GeoIndex(NETWORKS, MAPPING)
+    with CdbDatabase(cdb_path, interval=None) as db:
+        assert db.lookup(15) == ("Country1", "City1")
+        assert db.reader.lookup("0.0.0.35") == ("Country2", "City2")
+        assert index.lookup(25) == ("Unknown", "Unknown")
+        assert search_geo(NETWORKS, 50, MAPPING) == ("Unknown", "Unknown")
+        assert search_geo(index, 15) == ("Country1", "City1")
+        search_geo_batch(db, [15, 25, 35, 45])
+
+    snapshot = metrics.snapshot()
+    assert snapshot["lookups_total"] == 9
+    assert snapshot["lookup_misses_total"] == 4
+    assert snapshot["batches_total"] == 1
+    assert snapshot["miss_rate"] == 4 / 9
+    assert snapshot["lookups_per_second"] > 0
+    assert snapshot["histograms"]["lookup_seconds"]["count"] == 5
+    assert snapshot["histograms"]["batch_seconds"]["count"] == 1
+
+
+def test_cache_and_reload_metrics(cdb_path, metrics):
+    with CdbDatabase(cdb_path, interval=None) as db:
+        cache = LookupCache(db)
+        for value in (15, 15, 15, 35):
+            cache.lookup(value)
+        assert db.reload(force=True)
+        os.unlink(cdb_path)
+        assert not db.reload(force=True)
+        write_cdb(NETWORKS, MAPPING, cdb_path)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["cache_hits_total"] == 2
+    assert snapshot["cache_misses_total"] == 2
+    assert snapshot["cache_hit_rate"] == 0.5
+    assert snapshot["reloads_total"] == 1
+    assert snapshot["reload_errors_total"] == 1
+
+
+def test_reload_releases_mapped_bytes(cdb_path, metrics):
+    size = os.path.getsize(cdb_path)
+    with CdbDatabase(cdb_path, interval=None) as db:
+        old = db.reader
+        assert db.reload(force=True)
+        assert db.reload(force=True)
+        # A snapshot taken before the reloads stays counted while it is held.
+        assert metrics.gauges["bytes_mapped"] == 2 * size
+        del old
+        assert metrics.gauges["bytes_mapped"] == size
+    assert metrics.gauges["bytes_mapped"] == 0
+
+
+def test_merge_metrics(cdb_path, metrics):
+    with NamedTemporaryFile() as output:
+        merge_cdbs_and_save(output.name, cdb_path, cdb_path, compact=True)
+    networks, _ = merge_cdbs(cdb_path)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["merges_total"] == 2
+    assert snapshot["merged_ranges_total"] == 2 + len(networks)
+    assert snapshot["histograms"]["merge_seconds"]["count"] == 2
+
+
+def test_prometheus_format():
+    metrics = Metrics(buckets=(0.001, 0.01))
+    metrics.record_lookup(0.0005, miss=False)
+    metrics.record_lookup(0.005, miss=True)
+    metrics.record_lookup(1.0, miss=False)
+    metrics.add("bytes_mapped", 100)
+
+    text = metrics.prometheus(prefix="geo")
+    lines = text.splitlines()
+    assert "# TYPE geo_lookups_total counter" in lines
+    assert "geo_lookups_total 3" in lines
+    assert "geo_lookup_misses_total 1" in lines
+    assert "# TYPE geo_bytes_mapped gauge" in lines
+    assert "geo_bytes_mapped 100" in lines
+    assert "# TYPE geo_lookup_seconds histogram" in lines
+    assert 'geo_lookup_seconds_bucket{le="0.001"} 1' in lines
+    assert 'geo_lookup_seconds_bucket{le="0.01"} 2' in lines
+    assert 'geo_lookup_seconds_bucket{le="+Inf"} 3' in lines
+    assert "geo_lookup_seconds_count 3" in lines
+    assert text.endswith("\n")
+
+    metrics.reset()
+    assert metrics.snapshot()["lookups_total"] == 0
@@ -0,0 +1,368 @@
+import pytest
+import os
+import struct
+from ipaddress import IPv4Network, IPv6Network
+from tempfile import NamedTemporaryFile
+import cdb
+from cdb import (
+    CdbReader,
+    extract_fields,
+    extract_geo,
+    iter_mmdb,
+    mmdb_file_to_cdb,
+    read_cdb,
+    search_geo,
+)
+
+
+class FakeReader:
+    def __init__(self, networks):
+        self.networks = networks
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.networks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.closed = True
+
+
+def record(country, city=None):
+    data = {"country": {"names": {"en": country}}}
+    if city is not None:
+        data["city"] = {"names": {"en": city}}
+    return data
+
+
+@pytest.fixture
+def fake_mmdb(monkeypatch):
+    readers = []
+
+    def _install(networks):
+        def open_database(path, *args):
+            readers.append(FakeReader(networks))
+            return readers[-1]
+
+        monkeypatch.setattr(cdb.cdb.maxminddb, "open_database", open_database)
+        return readers
+
+    return _install
+
+
+@pytest.fixture
+def output_path():
+    with NamedTemporaryFile(delete=False) as tmp_file:
+        path = tmp_file.name
+    yield path
+    os.unlink(path)
+
+
+def test_iter_mmdb_is_lazy(fake_mmdb):
+    readers = fake_mmdb([(IPv4Network("10.0.0.0/8"), record("Country1", "City1"))])
+    networks = iter_mmdb("test.mmdb")
+    assert readers == []
+    assert next(networks)[0] == IPv4Network("10.0.0.0/8")
+    assert list(networks) == []
+    assert readers[0].closed
+
+
+def test_mmdb_file_to_cdb(fake_mmdb, output_path):
+    fake_mmdb(
+        [
+            (IPv4Network("1.0.0.0/24"), record("Country1", "City1")),
+            (IPv4Network("1.0.1.0/24"), record("Country1", "City2")),
+            (IPv4Network("10.0.0.0/8"), record("Country1", "City1")),
+        ]
+    )
+    mmdb_file_to_cdb("test.mmdb", output_path)
+
+    networks, mapping = read_cdb(output_path)
+    assert len(networks) == 3
+    assert sorted(mapping.values()) == [("Country1", "City1"), ("Country1", "City2")]
+    assert search_geo(networks, "1.0.1.7", mapping) == ("Country1", "City2")
+    assert search_geo(networks, "10.9.9.9", mapping) == ("Country1", "City1")
+    assert search_geo(networks, "9.9.9.9", mapping) == ("Unknown", "Unknown")
+
+
+def test_extract_geo_missing_city():
+    assert extract_geo(record("Country1")) == ("Country1", "")
+    assert extract_geo({}) == ("", "")
+
+
+def test_extract_geo_language():
+    data = {
+        "country": {"names": {"de": "Deutschland", "en": "Germany"}},
+        "city": {"names": {"de": "München"}},
+    }
+    assert extract_geo(data) == ("Germany", "München")
+    assert extract_geo(data, "de") == ("Deutschland", "München")
+    assert extract_geo(data, "ru") == ("Deutschland", "München")
+
+
+def test_extract_fields():
+    data = rich_record("DE", "Bayern", 48.1, 11.5)
+    data["location"]["accuracy_radius"] = 20
+    fields = ["country_code", "subdivision", "latitude", "accuracy_radius", "asn"]
+    assert extract_fields(data, fields, "de") == ("DE", "Bayern", 48.1, 20, 0)
+    values = extract_fields({}, ["country_code", "latitude", "asn"])
+    assert values[0] == "" and values[1] != values[1] and values[2] == 0
+
+
+def encode_mmdb_value(value):
+    if isinstance(value, dict):
+        return bytes([0xE0 | len(value)]) + b"".join(
+            encode_mmdb_value(k) + encode_mmdb_value(v) for k, v in value.items()
+        )
+    if isinstance(value, list):
+        return bytes([len(value), 4]) + b"".join(map(encode_mmdb_value, value))
+    if isinstance(value, str):
+        data = value.encode()
+        return bytes([0x40 | len(data)]) + data
+    if isinstance(value, float):
+        return bytes([0x60 | 8]) + struct.pack(">d", value)
+    kind, number = value
+    if kind == "uint16":
+        return bytes([0xA0 | 2]) + number.to_bytes(2, "big")
+    if kind == "uint32":
+        return bytes([0xC0 | 4]) + number.to_bytes(4, "big")
+    return bytes([0x00 | 8, 2]) + number.to_bytes(8, "big")
+
+
+def write_mmdb(path, networks, ip_version=4):
+    bit_count = 128 if ip_version == 6 else 32
+    nodes = [[None, None]]
+    data = bytearray()
+
+    def insert(network, leaf):
+        bits = int(network.network_address)
+        prefixlen = network.prefixlen + bit_count - network.max_prefixlen
+        node = 0
+        for depth in range(prefixlen):
+            bit = (bits >> (bit_count - 1 - depth)) & 1
+            if depth == prefixlen - 1:
+                nodes[node][bit] = leaf
+            else:
+                if nodes[node][bit] is None:
+                    nodes.append([None, None])
+                    nodes[node][bit] = len(nodes) - 1
+                node = nodes[node][bit]
+
+    for network, record in networks:
+        insert(network, ("data", len(data)))
+        data += encode_mmdb_value(record)
+
+    if ip_version == 6:
+        ipv4_start = 0
+        for _ in range(96):
+            ipv4_start = nodes[ipv4_start][0]
+        insert(IPv6Network("::ffff:0:0/96"), ipv4_start)
+
+    node_count = len(nodes)
+    tree = bytearray()
+    for children in nodes:
+        for child in children:
+            if child is None:
+                child = node_count
+            elif isinstance(child, tuple):
+                child = node_count + 16 + child[1]
+            tree += struct.pack(">I", child)
+
+    metadata = {
+        "node_count": ("uint32", node_count),
+        "record_size": ("uint16", 32),
+        "ip_version": ("uint16", ip_version),
+        "database_type": "Test",
+        "languages": ["en"],
+        "binary_format_major_version": ("uint16", 2),
+        "binary_format_minor_version": ("uint16", 0),
+        "build_epoch": ("uint64", 1),
+        "description": {"en": "Test"},
+    }
+    with open(path, "wb") as file:
+        file.write(tree + b"\0" * 16 + data)
+        file.write(b"\xab\xcd\xefMaxMind.com" + encode_mmdb_value(metadata))
+
+
+@pytest.fixture
+def mmdb_path():
+    networks = [
+        (IPv4Network("0.0.0.0/7"), record("Country0", "City0")),
+        (IPv4Network("3.0.0.0/8"), record("Country1")),
+        (IPv4Network("10.0.0.0/9"), record("Country1", "City1")),
+        (IPv4Network("10.128.0.0/24"), record("Country2", "City2")),
+        (IPv4Network("10.128.1.0/24"), record("Country1", "City1")),
+        (IPv4Network("10.128.2.0/23"), record("Country1", "City1")),
+        (IPv4Network("128.0.0.0/2"), record("Country3", "City3")),
+        (IPv4Network("255.255.255.255/32"), record("Country2", "City2")),
+    ]
+    with NamedTemporaryFile(delete=False, suffix=".mmdb") as tmp_file:
+        path = tmp_file.name
+    write_mmdb(path, networks)
+    yield path
+    os.unlink(path)
+
+
+def rich_record(code, subdivision, latitude, longitude):
+    return {
+        "country": {
+            "iso_code": code,
+            "names": {"de": f"{code}-de", "en": f"{code}-en"},
+        },
+        "city": {"names": {"de": "Stadt", "en": "City"}},
+        "subdivisions": [{"iso_code": "BY", "names": {"de": subdivision}}],
+        "location": {
+            "latitude": latitude,
+            "longitude": longitude,
+            "accuracy_radius": ("uint16", 20),
+        },
+    }
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_mmdb_file_to_cdb_fields(output_path, workers):
+    networks = [
+        (IPv4Network("10.0.0.0/8"), rich_record("DE", "Bayern", 48.1, 11.5)),
+        (IPv4Network("11.0.0.0/8"), rich_record("DE", "Bayern", 48.1, 11.5)),
+        (IPv4Network("12.0.0.0/8"), rich_record("DE", "Bayern", 50.0, 11.5)),
+        (IPv4Network("13.0.0.0/8"), record("Country1", "City1")),
+    ]
+    with NamedTemporaryFile(suffix=".mmdb") as mmdb_file:
+        write_mmdb(mmdb_file.name, networks)
+        fields = ["country_code", "subdivision", "latitude", "accuracy_radius"]
+        mmdb_file_to_cdb(
+            mmdb_file.name, output_path, workers, fields=fields, language="de"
+        )
+
+    with CdbReader(output_path) as reader:
+        assert len(reader.mapping) == 3
+        assert reader.records.fields == tuple(fields)
+        assert reader.lookup_record("10.1.2.3") == {
+            "country": "DE-de",
+            "city": "Stadt",
+            "country_code": "DE",
+            "subdivision": "Bayern",
+            "latitude": 48.1,
+            "accuracy_radius": 20,
+        }
+        assert reader.lookup_record("11.0.0.1") == reader.lookup_record("10.0.0.1")
+        assert reader.lookup_record("12.0.0.1")["latitude"] == 50.0
+        record13 = reader.lookup_record("13.0.0.1")
+        assert record13["country_code"] == "" and record13["accuracy_radius"] == 0
+        assert reader.lookup_record("14.0.0.1") == {
+            "country": "Unknown",
+            "city": "Unknown",
+        }
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_mmdb_file_to_cdb_fields_without_location(output_path, workers):
+    # Every /8 is converted by its own partition.
+    networks = [
+        (IPv4Network(f"{i}.0.0.0/8"), record("Country1", "City1"))
+        for i in range(10, 49)
+    ]
+    with NamedTemporaryFile(suffix=".mmdb") as mmdb_file:
+        write_mmdb(mmdb_file.name, networks)
+        assert (
+            mmdb_file_to_cdb(
+                mmdb_file.name,
+                output_path,
+                workers,
+                compact=True,
+                fields=["latitude"],
+            )
+            == 38
+        )
+
+    networks, mapping = read_cdb(output_path)
+    assert networks == [(10 << 24, (49 << 24) - 1, 0)]
+    assert mapping == {0: ("Country1", "City1")}
+
+
+def test_mmdb_file_to_cdb_unknown_field(fake_mmdb, output_path):
+    fake_mmdb([])
+    with pytest.raises(ValueError):
+        mmdb_file_to_cdb("test.mmdb", output_path, fields=["population"])
+
+
+def test_mmdb_file_to_cdb_real_file(mmdb_path, output_path):
+    mmdb_file_to_cdb(mmdb_path, output_path)
+    networks, mapping = read_cdb(output_path)
+
+    assert len(networks) == 8
+    assert search_geo(networks, "1.2.3.4", mapping) == ("Country0", "City0")
+    assert search_geo(networks, "3.2.3.4", mapping) == ("Country1", "")
+    assert search_geo(networks, "10.128.0.9", mapping) == ("Country2", "City2")
+    assert search_geo(networks, "10.128.4.0", mapping) == ("Unknown", "Unknown")
+    assert search_geo(networks, "191.0.0.1", mapping) == ("Country3", "City3")
+
+
+def test_mmdb_file_to_cdb_parallel(mmdb_path, output_path):
+    mmdb_file_to_cdb(mmdb_path, output_path)
+    expected_networks, expected_mapping = read_cdb(output_path)
+
+    mmdb_file_to_cdb(mmdb_path, output_path, workers=2)
+    networks, mapping = read_cdb(output_path)
+
+    assert [(a, b, mapping[c]) for a, b, c in networks] == [
+        (a, b, expected_mapping[c]) for a, b, c in expected_networks
+    ]
+
+
+def test_mmdb_file_to_cdb_compact(mmdb_path, output_path):
+    assert mmdb_file_to_cdb(mmdb_path, output_path) == 0
+    expected_networks, expected_mapping = read_cdb(output_path)
+
+    assert mmdb_file_to_cdb(mmdb_path, output_path, compact=True) == 1
+    networks, mapping = read_cdb(output_path)
+
+    assert len(networks) == 7
+    for ip in ["10.0.0.1", "10.128.0.1", "10.128.1.1", "10.128.3.255", "10.128.4.0"]:
+        assert search_geo(networks, ip, mapping) == search_geo(
+            expected_networks, ip, expected_mapping
+        )
+
+
+@pytest.fixture
+def mmdb_ipv6_path():
+    networks = [
+        (IPv4Network("10.0.0.0/8"), record("Country1", "City1")),
+        (IPv4Network("128.0.0.0/1"), record("Country3", "City3")),
+        (IPv6Network("2001:db8::/32"), record("Country4", "City4")),
+        (IPv6Network("2001:db9::/32"), record("Country4", "City4")),
+        (IPv6Network("2a00::/12"), record("Country1", "City1")),
+        (IPv6Network("ff00::/8"), record("Country5", "City5")),
+    ]
+    with NamedTemporaryFile(delete=False, suffix=".mmdb") as tmp_file:
+        path = tmp_file.name
+    write_mmdb(path, networks, ip_version=6)
+    yield path
+    os.unlink(path)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_mmdb_file_to_cdb_ipv6(mmdb_ipv6_path, output_path, workers):
+    assert mmdb_file_to_cdb(mmdb_ipv6_path, output_path, workers=workers) == 0
+    networks, mapping = read_cdb(output_path)
+
+    assert len(networks) == 6
+    assert search_geo(networks, "10.1.2.3", mapping) == ("Country1", "City1")
+    assert search_geo(networks, "::ffff:10.1.2.3", mapping) == ("Country1", "City1")
+    assert search_geo(networks, "200.1.2.3", mapping) == ("Country3", "City3")
+    assert search_geo(networks, "2001:db8::1", mapping) == ("Country4", "City4")
+    assert search_geo(networks, "2a0f:ffff::", mapping) == ("Country1", "City1")
+    assert search_geo(networks, "ffff::1", mapping) == ("Country5", "City5")
+    assert search_geo(networks, "2001:dba::", mapping) == ("Unknown", "Unknown")
+
+
+def test_mmdb_file_to_cdb_ipv6_compact(mmdb_ipv6_path, output_path):
+    assert mmdb_file_to_cdb(mmdb_ipv6_path, output_path, compact=True) == 1
+    networks, mapping = read_cdb(output_path)
+
+    assert (
+        cdb.cidr_to_int("2001:db8::/31"),
+        ("Country4", "City4"),
+    ) in [((a, b), mapping[c]) for a, b, c in networks]
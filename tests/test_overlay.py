@@ -0,0 +1,171 @@
+import pytest
+import os
+import time
+import numpy as np
+from cdb import (
+    DELETED_GEO_ID,
+    FLAG_OVERLAY,
+    CdbDatabase,
+    CdbReader,
+    GeoRecords,
+    LayeredCdb,
+    fold_overlays,
+    read_cdb,
+    search_geo,
+    search_geo_batch,
+    write_cdb,
+    write_overlay,
+)
+
+NET6 = 0x20010DB8 << 96
+NETWORKS = [(0, 99, 0), (100, 199, 1), (300, 399, 0), (NET6, NET6 + 255, 1)]
+MAPPING = {0: ("Germany", "Berlin"), 1: ("France", "Paris")}
+
+
+@pytest.fixture
+def base_path(tmp_path):
+    path = str(tmp_path / "base.cdb")
+    write_cdb(NETWORKS, MAPPING, path)
+    return path
+
+
+def test_write_overlay(tmp_path):
+    path = str(tmp_path / "overlay.cdb")
+    count = write_overlay(
+        path,
+        [
+            ((50, 149), ("Internal", "HQ")),
+            ((60, 69), None),
+            ((140, 160), ("Internal", "HQ")),
+            ("2001:db8::/120", ("Internal", "Lab")),
+        ],
+    )
+    assert count == 4
+
+    with CdbReader(path) as reader:
+        assert reader.flags & FLAG_OVERLAY
+        assert list(reader) == [
+            (50, 59, 0),
+            (60, 69, DELETED_GEO_ID),
+            (70, 160, 0),
+            (NET6, NET6 + 255, 1),
+        ]
+        assert dict(reader.mapping) == {0: ("Internal", "HQ"), 1: ("Internal", "Lab")}
+
+
+def test_layered_lookup(base_path, tmp_path):
+    first = str(tmp_path / "first.cdb")
+    second = str(tmp_path / "second.cdb")
+    write_overlay(first, {(50, 149): ("Internal", "HQ"), (300, 399): None})
+    write_overlay(
+        second,
+        {(60, 69): None, (310, 319): ("Internal", "Lab"), "2001:db8::/126": None},
+    )
+
+    with LayeredCdb(base_path, first, second) as layered:
+        expected = {
+            10: ("Germany", "Berlin"),
+            55: ("Internal", "HQ"),
+            65: ("Unknown", "Unknown"),
+            150: ("France", "Paris"),
+            305: ("Unknown", "Unknown"),
+            315: ("Internal", "Lab"),
+            NET6 + 2: ("Unknown", "Unknown"),
+            NET6 + 9: ("France", "Paris"),
+        }
+        for value, geo in expected.items():
+            assert layered.lookup(value) == geo
+            assert search_geo(layered, value) == geo
+        assert search_geo_batch(layered, list(expected)) == list(expected.values())
+        assert layered.lookup_record(55) == {"country": "Internal", "city": "HQ"}
+        assert len(layered.mapping) == 4
+
+        ids = layered.lookup_ids(np.array([55, 65, 150], dtype=np.int64))
+        assert [layered.mapping.get(i) for i in ids.tolist()] == [
+            ("Internal", "HQ"),
+            None,
+            ("France", "Paris"),
+        ]
+
+
+def test_plain_file_as_overlay(base_path, tmp_path):
+    path = str(tmp_path / "plain.cdb")
+    write_cdb([(10, 19, DELETED_GEO_ID)], {DELETED_GEO_ID: ("Max", "Id")}, path)
+    with LayeredCdb(base_path, path) as layered:
+        assert layered.lookup(15) == ("Max", "Id")
+        assert list(layered)[1] == (10, 19, 2 + DELETED_GEO_ID)
+
+
+def test_fold_overlays(base_path, tmp_path):
+    overlay = str(tmp_path / "overlay.cdb")
+    output = str(tmp_path / "folded.cdb")
+    write_overlay(overlay, {(50, 149): ("Internal", "HQ"), (300, 399): None})
+
+    assert fold_overlays(output, base_path, overlay, compact=True) == 0
+    networks, mapping = read_cdb(output)
+    assert [(a, b, mapping[c]) for a, b, c in networks] == [
+        (0, 49, ("Germany", "Berlin")),
+        (50, 149, ("Internal", "HQ")),
+        (150, 199, ("France", "Paris")),
+        (NET6, NET6 + 255, ("France", "Paris")),
+    ]
+
+    with LayeredCdb(base_path, overlay) as layered, CdbReader(output) as folded:
+        for value in (0, 49, 50, 149, 150, 199, 250, 300, 399, NET6 + 5):
+            assert folded.lookup(value) == layered.lookup(value)
+
+    # Like compact_cdb, the result is the number of ranges compaction removed.
+    write_cdb([(0, 49, 0), (150, 179, 1), (180, 199, 1)], MAPPING, base_path)
+    assert fold_overlays(output, base_path, overlay, compact=True) == 1
+    assert fold_overlays(output, base_path, overlay) == 0
+    assert len(read_cdb(output)[0]) == 4
+
+
+def test_fold_keeps_records(tmp_path):
+    base = str(tmp_path / "base.cdb")
+    overlay = str(tmp_path / "overlay.cdb")
+    write_cdb(
+        NETWORKS,
+        MAPPING,
+        base,
+        records=GeoRecords(["country_code"], {0: ("DE",), 1: ("FR",)}),
+    )
+    write_overlay(overlay, {(50, 59): ("Internal", "HQ")})
+    fold_overlays(base, base, overlay)
+
+    with CdbReader(base) as reader:
+        assert reader.lookup_record(10)["country_code"] == "DE"
+        assert reader.lookup_record(55) == {
+            "country": "Internal",
+            "city": "HQ",
+            "country_code": "",
+        }
+
+
+def test_write_overlay_invalid(tmp_path):
+    path = str(tmp_path / "overlay.cdb")
+    with pytest.raises(ValueError):
+        write_overlay(path, {(10, 5): None})
+    with pytest.raises(ValueError):
+        write_overlay(path, {"not a network": None})
+    assert not os.path.exists(path)
+
+
+def test_database_reloads_overlays(base_path, tmp_path):
+    overlay = str(tmp_path / "overlay.cdb")
+    write_overlay(overlay, {(50, 59): ("Internal", "HQ")})
+
+    with CdbDatabase(base_path, interval=None, overlays=[overlay]) as db:
+        assert db.lookup(55) == ("Internal", "HQ")
+        assert not db.reload()
+
+        time.sleep(0.01)
+        write_overlay(overlay, {(50, 59): None})
+        assert db.reload()
+        assert db.generation == 1
+        assert db.lookup(55) == ("Unknown", "Unknown")
+
+        os.unlink(overlay)
+        assert not db.reload()
+        assert isinstance(db.last_error, FileNotFoundError)
+        assert db.lookup(55) == ("Unknown", "Unknown")
@@ -1,7 +1,7 @@
 import pytest
 import os
 from tempfile import NamedTemporaryFile
-from cdb import read_cdb, write_cdb
+from cdb import CdbReader, read_cdb, write_cdb
 import struct
 
 
@@ -86,3 +86,23 @@ def test_write_cdb_special_characters():
         assert result_mapping[0] == ("Страна", "Город")
     finally:
         os.unlink(tmp_path)
+
+
+def test_write_cdb_keeps_open_readers_valid():
+    with NamedTemporaryFile(delete=False) as tmp_file:
+        tmp_path = tmp_file.name
+
+    try:
+        write_cdb([(1, 2, 0)], {0: ("Country1", "City1")}, tmp_path)
+        with CdbReader(tmp_path) as reader:
+            write_cdb([(1, 2, 0)] * 2, {0: ("Country2", "City2")}, tmp_path)
+            assert list(reader) == [(1, 2, 0)]
+            assert reader.lookup(1) == ("Country1", "City1")
+        name = os.path.basename(tmp_path)
+        assert not [
+            other
+            for other in os.listdir(os.path.dirname(tmp_path))
+            if other.startswith(name + ".") and other.endswith(".tmp")
+        ]
+    finally:
+        os.unlink(tmp_path)
@@ -0,0 +1,133 @@
+import pytest
+import os
+import numpy as np
+from tempfile import NamedTemporaryFile
+from cdb import (
+    CdbReader,
+    GeoIndex,
+    LEGACY_VERSION,
+    FORMAT_VERSION,
+    UNKNOWN_GEO_ID,
+    search_geo,
+    search_geo_batch,
+    write_cdb,
+)
+
+
+@pytest.fixture
+def sample_data():
+    return [(30, 40, 2), (10, 20, 1), (50, 60, 3)]
+
+
+@pytest.fixture
+def sample_mapping():
+    return {1: ("A", "B"), 2: ("C", "D"), 3: ("E", "F")}
+
+
+def test_batch_on_triples(sample_data, sample_mapping):
+    result = search_geo_batch(sample_data, [5, 10, 20, 25, 35, 60, 61], sample_mapping)
+    assert result == [
+        ("Unknown", "Unknown"),
+        ("A", "B"),
+        ("A", "B"),
+        ("Unknown", "Unknown"),
+        ("C", "D"),
+        ("E", "F"),
+        ("Unknown", "Unknown"),
+    ]
+
+
+def test_batch_geo_ids(sample_data, sample_mapping):
+    index = GeoIndex(sample_data, sample_mapping)
+    ids = search_geo_batch(index, np.array([15, 45, 55], dtype=np.uint32), geo_ids=True)
+    assert ids.tolist() == [1, UNKNOWN_GEO_ID, 3]
+
+
+def test_batch_strings():
+    index = GeoIndex([(167772160, 184549375, 0)], {0: ("Country1", "City1")})
+    result = search_geo_batch(index, ["10.1.2.3", "11.0.0.1"])
+    assert result == [("Country1", "City1"), ("Unknown", "Unknown")]
+
+
+def test_batch_missing_mapping(sample_data):
+    assert search_geo_batch(sample_data, [15, 35], {2: ("X", "Y")}) == [
+        ("Unknown", "Unknown"),
+        ("X", "Y"),
+    ]
+
+
+def test_batch_overlapping_triples(sample_mapping):
+    data = [(10, 100, 1), (30, 40, 2), (35, 60, 3)]
+    assert search_geo_batch(data, [20, 32, 37, 70, 101], sample_mapping) == [
+        ("A", "B"),
+        ("C", "D"),
+        ("E", "F"),
+        ("A", "B"),
+        ("Unknown", "Unknown"),
+    ]
+    with pytest.raises(ValueError, match="overlaps"):
+        search_geo_batch(data, [20], sample_mapping, strict=True)
+
+
+def test_batch_empty():
+    assert search_geo_batch([], [1, 2], {}) == [("Unknown", "Unknown")] * 2
+    assert search_geo_batch([(1, 2, 0)], [], {0: ("A", "B")}) == []
+
+
+def test_batch_matches_search_geo():
+    data = [(i * 10, i * 10 + 7, i) for i in range(1000)]
+    mapping = {i: (f"Country{i}", f"City{i}") for i in range(0, 1000, 3)}
+    values = list(range(0, 10020, 7))
+    expected = [search_geo(data, value, mapping) for value in values]
+    assert search_geo_batch(data, values, mapping) == expected
+
+
+@pytest.mark.parametrize("version", [LEGACY_VERSION, FORMAT_VERSION])
+def test_batch_on_reader(sample_data, sample_mapping, version):
+    with NamedTemporaryFile(delete=False) as tmp_file:
+        tmp_path = tmp_file.name
+
+    try:
+        write_cdb(sample_data, sample_mapping, tmp_path, version)
+        with CdbReader(tmp_path) as reader:
+            assert search_geo_batch(reader, [15, 25, 35, 55]) == [
+                ("A", "B"),
+                ("Unknown", "Unknown"),
+                ("C", "D"),
+                ("E", "F"),
+            ]
+            ids = search_geo_batch(reader, [15, 25], geo_ids=True)
+            assert ids.tolist() == [1, UNKNOWN_GEO_ID]
+    finally:
+        os.unlink(tmp_path)
+
+
+@pytest.mark.parametrize("version", [None, FORMAT_VERSION])
+def test_batch_mixed_families(version):
+    net = 0x20010DB8 << 96
+    data = [(167772160, 184549375, 0), (net, net + 2**96 - 1, 1)]
+    mapping = {0: ("Country1", "City1"), 1: ("Country2", "City2")}
+    ips = ["10.1.2.3", "2001:db8::1", "::ffff:10.0.0.1", "2001:db9::", "11.0.0.0"]
+    expected = [
+        ("Country1", "City1"),
+        ("Country2", "City2"),
+        ("Country1", "City1"),
+        ("Unknown", "Unknown"),
+        ("Unknown", "Unknown"),
+    ]
+
+    if version is None:
+        assert search_geo_batch(data, ips, mapping) == expected
+        return
+
+    with NamedTemporaryFile(delete=False) as tmp_file:
+        tmp_path = tmp_file.name
+    try:
+        write_cdb(data, mapping, tmp_path, version)
+        with CdbReader(tmp_path) as reader:
+            assert search_geo_batch(reader, ips) == expected
+            assert search_geo_batch(
+                reader, [net + 5, 167772161], geo_ids=True
+            ).tolist() == [1, 0]
+    finally:
+        os.unlink(tmp_path)
@@ -1,6 +1,15 @@
 import struct
+import numpy as np
 import pytest
-from cdb import serialize, deserialize
+from cdb import (
+    FLAG_SORTED,
+    FORMAT_VERSION,
+    LEGACY_VERSION,
+    MAGIC,
+    serialize,
+    deserialize,
+    deserialize_arrays,
+)
 
 
 @pytest.mark.parametrize(
@@ -9,21 +18,97 @@ from cdb import serialize, deserialize
         ([], {}),
         ([(1, 2, 3)], {1: ("a", "b")}),
         ([(1, 2, 3), (4, 5, 6)], {1: ("a", "b"), 2: ("c", "d")}),
-        ([(2**63 - 1, -(2**63), 0)], {0: ("", ""), -1: ("long string", "x" * 1000)}),
+        ([(0, 2**32 - 1, 2**32 - 1)], {2**32 - 1: ("long string", "x" * 1000)}),
     ],
 )
-def test_serialize_deserialize_roundtrip(triples, mapping):
-    serialized = serialize(triples, mapping)
+@pytest.mark.parametrize("version", [LEGACY_VERSION, FORMAT_VERSION])
+def test_serialize_deserialize_roundtrip(triples, mapping, version):
+    serialized = serialize(triples, mapping, version)
     deserialized_triples, deserialized_mapping = deserialize(serialized)
 
     assert deserialized_triples == triples
     assert deserialized_mapping == mapping
 
 
+def test_string_pool_deduplicated():
+    mapping = {i: ("United States", f"City{i % 3}") for i in range(100)}
+    serialized = serialize([], mapping)
+    assert serialized.count(b"United States") == 1
+    assert serialized.count(b"City1") == 1
+
+    _, deserialized_mapping = deserialize(serialized)
+    assert deserialized_mapping == mapping
+    assert deserialized_mapping[0][0] is deserialized_mapping[99][0]
+
+
+def test_legacy_roundtrip_signed_values():
+    triples = [(2**63 - 1, -(2**63), 0)]
+    mapping = {0: ("", ""), -1: ("long string", "x" * 1000)}
+    serialized = serialize(triples, mapping, version=LEGACY_VERSION)
+    deserialized_triples, deserialized_mapping = deserialize(serialized)
+
+    assert deserialized_triples == triples
+    assert deserialized_mapping == mapping
+
+
+@pytest.mark.parametrize(
+    "triples,mapping",
+    [
+        ([(-1, 2, 3)], {}),
+        ([(1, 2**128, 3)], {}),
+        ([(1, 2, 3)], {-1: ("a", "b")}),
+        ([(5, 10, 2**33 + 1), (2**100, 2**100 + 1, 1)], {}),
+        ([(-5, 10, 0), (2**100, 2**100 + 1, 1)], {}),
+        ([(5, 10, 0), (2**100, 2**100 + 1, 2**33)], {}),
+    ],
+)
+def test_serialize_out_of_range(triples, mapping):
+    with pytest.raises(ValueError):
+        serialize(triples, mapping)
+
+
+def test_serialize_unsupported_version():
+    with pytest.raises(ValueError):
+        serialize([], {}, version=3)
+
+
+def test_serialize_sorts_ranges():
+    triples = [(30, 40, 1), (10, 20, 0)]
+    deserialized_triples, _ = deserialize(serialize(triples, {}))
+    assert deserialized_triples == [(10, 20, 0), (30, 40, 1)]
+
+
+def test_serialize_v2_format():
+    triples = [(1, 2, 3), (4, 5, 6)]
+    buf = serialize(triples, {3: ("test", "data")})
+
+    assert buf.startswith(MAGIC)
+    magic, version, flags, section_count, n, m = struct.unpack_from("<8sHHIQQ", buf)
+    assert (version, flags, n, m) == (FORMAT_VERSION, FLAG_SORTED, 2, 1)
+
+    sections = {}
+    for i in range(section_count):
+        tag, offset, length = struct.unpack_from("<4sQQ", buf, 32 + i * 20)
+        assert offset % 8 == 0
+        sections[tag] = (offset, length)
+
+    offset, length = sections[b"STA4"]
+    assert length == 8
+    assert struct.unpack_from("<II", buf, offset) == (1, 4)
+    offset, _ = sections[b"GID4"]
+    assert struct.unpack_from("<II", buf, offset) == (3, 6)
+
+
+def test_deserialize_v2_truncated():
+    buf = serialize([(1, 2, 3)], {3: ("test", "data")})
+    with pytest.raises(ValueError):
+        deserialize(buf[:-4])
+
+
 def test_serialize_format():
     triples = [(1, 2, 3)]
     mapping = {4: ("test", "data")}
-    buf = serialize(triples, mapping)
+    buf = serialize(triples, mapping, version=LEGACY_VERSION)
 
     assert len(buf) > 4
     (n,) = struct.unpack_from("<I", buf, 0)
@@ -62,3 +147,82 @@ def test_large_data():
     deserialized_triples, deserialized_mapping = deserialize(buf)
     assert len(deserialized_triples) == 1000
     assert len(deserialized_mapping) == 100
+
+
+def test_serialize_ipv6_sections():
+    net = 0x20010DB8 << 96
+    triples = [(1, 2, 0), (2**32 - 5, 2**32 + 5, 1), (net, net + 2**96 - 1, 2)]
+    buf = serialize(triples, {})
+
+    magic, version, flags, section_count, n, m = struct.unpack_from("<8sHHIQQ", buf)
+    tags = [
+        struct.unpack_from("<4sQQ", buf, 32 + i * 20)[0] for i in range(section_count)
+    ]
+    assert n == 2
+    assert {b"STA6", b"END6", b"GID6"} <= set(tags)
+    assert deserialize(buf)[0] == [
+        (1, 2, 0),
+        (2**32 - 5, 2**32 - 1, 1),
+        (2**32, 2**32 + 5, 1),
+        (net, net + 2**96 - 1, 2),
+    ]
+
+
+def test_serialize_ipv4_only_has_no_ipv6_sections():
+    buf = serialize([(1, 2, 0)], {})
+    assert b"STA6" not in buf
+
+
+@pytest.mark.parametrize("version", [LEGACY_VERSION, FORMAT_VERSION])
+def test_serialize_array_matches_triples(version):
+    triples = [(50, 60, 2), (10, 20, 0), (10, 15, 1), (30, 40, 1)]
+    mapping = {0: ("a", "b"), 1: ("c", "d"), 2: ("e", "f")}
+    for dtype in (np.uint32, np.int64, np.uint64):
+        ranges = np.array(triples, dtype=dtype)
+        assert serialize(ranges, mapping, version) == serialize(
+            triples, mapping, version
+        )
+    assert serialize(iter(triples), mapping, version) == serialize(
+        triples, mapping, version
+    )
+
+
+def test_deserialize_arrays():
+    net = 0x20010DB8 << 96
+    triples = [(30, 40, 1), (10, 20, 0), (2**32 - 5, 2**32 + 5, 1)]
+    triples.append((net, net + 2**96 - 1, 2))
+    mapping = {0: ("a", "b"), 1: ("c", "d"), 2: ("e", "f")}
+
+    ipv4, ipv6, deserialized_mapping = deserialize_arrays(serialize(triples, mapping))
+    assert ipv4.dtype == np.uint32 and ipv6.dtype == np.uint64
+    assert ipv4.tolist() == [[10, 20, 0], [30, 40, 1], [2**32 - 5, 2**32 - 1, 1]]
+    assert ipv6.tolist() == [
+        [0, 2**32, 0, 2**32 + 5, 1],
+        [*divmod(net, 2**64), *divmod(net + 2**96 - 1, 2**64), 2],
+    ]
+    assert deserialized_mapping == mapping
+
+    ipv4, ipv6, _ = deserialize_arrays(serialize(triples[:2], mapping, LEGACY_VERSION))
+    assert ipv4.tolist() == [[30, 40, 1], [10, 20, 0]]
+    assert ipv6.shape == (0, 5)
+
+    ipv4, ipv6, _ = deserialize_arrays(serialize([], {}))
+    assert ipv4.shape == (0, 3) and ipv6.shape == (0, 5)
+
+
+def test_deserialize_arrays_legacy_out_of_range():
+    with pytest.raises(ValueError):
+        deserialize_arrays(serialize([(-1, 2, 0)], {}, LEGACY_VERSION))
+
+
+@pytest.mark.parametrize(
+    "ranges",
+    [
+        np.array([[1, 2]]),
+        np.array([[1.0, 2.0, 3.0]]),
+        [(1, 2), (3, 4)],
+    ],
+)
+def test_serialize_invalid_ranges(ranges):
+    with pytest.raises(ValueError):
+        serialize(ranges, {})
@@ -0,0 +1,113 @@
+import pytest
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+from cdb import CdbClient, search_geo_batch, GeoIndex, write_cdb
+from cdb.server import _listen
+
+NET6 = 0x20010DB8 << 96
+NETWORKS = [(167772160, 184549375, 0), (200, 300, 1), (NET6, NET6 + 2**96 - 1, 2)]
+MAPPING = {0: ("Country1", "City1"), 1: ("Country2", "City2"), 2: ("Country3", "")}
+
+
+@pytest.fixture
+def server(tmp_path):
+    processes = []
+
+    def _start(workers=1):
+        cdb_path = str(tmp_path / "data.cdb")
+        socket_path = str(tmp_path / f"cdb{len(processes)}.sock")
+        write_cdb(NETWORKS, MAPPING, cdb_path)
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(__file__)))
+        processes.append(
+            subprocess.Popen(
+                [sys.executable, "-m", "cdb", "serve", cdb_path]
+                + ["--unix", socket_path, "--workers", str(workers)]
+                + ["--interval", "0.05"],
+                env=env,
+                stderr=subprocess.DEVNULL,
+            )
+        )
+
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                CdbClient(socket_path).close()
+                return cdb_path, socket_path
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.02)
+
+    yield _start
+    for process in processes:
+        process.terminate()
+        process.wait(10)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_server_lookup(server, workers):
+    _, socket_path = server(workers)
+    ips = ["10.1.2.3", "0.0.0.250", "11.0.0.0", "2001:db8::1", "::ffff:10.0.0.1"]
+
+    with CdbClient(socket_path) as client:
+        assert client.lookup_many(ips) == search_geo_batch(NETWORKS, ips, MAPPING)
+        assert client.lookup("10.0.0.1") == ("Country1", "City1")
+        assert client.lookup_many([]) == []
+        assert client.lookup_many([250, NET6 + 1], geo_ids=True).tolist() == [1, 2]
+        assert client.stats()["workers"] == workers
+
+
+def test_server_pipelining(server):
+    _, socket_path = server()
+    index = GeoIndex(NETWORKS, MAPPING)
+    rng = np.random.default_rng(0)
+    batches = [rng.integers(0, 2**32, 500, dtype=np.uint32) for _ in range(50)]
+    batches[10] = np.arange(150, 350, dtype=np.uint32)
+
+    with CdbClient(socket_path) as client:
+        results = list(client.lookup_batches(batches, depth=8))
+        stats = client.stats()
+
+    assert results == [search_geo_batch(index, batch) for batch in batches]
+    assert stats["requests"] >= 50
+    assert stats["addresses"] == sum(map(len, batches))
+    assert stats["latency_ms"]["p99"] > 0
+
+
+def test_server_reload(server):
+    cdb_path, socket_path = server()
+
+    with CdbClient(socket_path) as client:
+        assert client.lookup("0.0.1.0") == ("Country2", "City2")
+        write_cdb([(256, 511, 0)], {0: ("Country4", "City4")}, cdb_path)
+        client.reload()
+        assert client.lookup("0.0.1.0") == ("Country4", "City4")
+        assert client.stats()["generation"] >= 1
+
+
+def test_server_error(server):
+    _, socket_path = server()
+
+    with CdbClient(socket_path) as client:
+        with pytest.raises(RuntimeError):
+            client._receive(client._send(99))
+        assert client.lookup("10.0.0.1") == ("Country1", "City1")
+        with pytest.raises(ValueError):
+            client.lookup_many([-1])
+
+
+def test_listen_replaces_only_sockets(tmp_path):
+    path = str(tmp_path / "cdb.sock")
+    _listen(path).close()
+    _listen(path).close()
+
+    os.unlink(path)
+    with open(path, "w") as file:
+        file.write("data")
+    with pytest.raises(FileExistsError):
+        _listen(path)
+    with open(path) as file:
+        assert file.read() == "data"
@@ -0,0 +1,146 @@
+import pytest
+import multiprocessing
+import os
+import time
+import numpy as np
+from cdb import (
+    GeoRecords,
+    LookupCache,
+    SharedCdb,
+    SharedCdbReader,
+    disable_metrics,
+    enable_metrics,
+    search_geo,
+    write_cdb,
+    write_overlay,
+)
+
+NET6 = 0x20010DB8 << 96
+NETWORKS = [(0, 99, 0), (100, 199, 1), (NET6, NET6 + 255, 1)]
+MAPPING = {0: ("Germany", "Berlin"), 1: ("France", "Paris")}
+
+
+@pytest.fixture
+def cdb_path(tmp_path):
+    path = str(tmp_path / "data.cdb")
+    write_cdb(
+        NETWORKS,
+        MAPPING,
+        path,
+        records=GeoRecords(["country_code"], {0: ("DE",), 1: ("FR",)}),
+    )
+    return path
+
+
+def replace(path: str, networks: list, mapping: dict):
+    # Makes sure the new version has another mtime.
+    time.sleep(0.01)
+    write_cdb(networks, mapping, path)
+
+
+def test_publish_and_attach(cdb_path, tmp_path):
+    directory = str(tmp_path / "shm")
+    os.mkdir(directory)
+    with SharedCdb(cdb_path, "geo", directory) as table:
+        assert sorted(os.listdir(directory)) == ["cdb-geo", "cdb-geo.0"]
+        with table.attach() as reader:
+            assert reader.reader._mapping is None
+            assert reader.generation == 0
+            assert len(reader) == 3
+            assert reader.lookup("0.0.0.150") == ("France", "Paris")
+            assert reader.lookup(NET6 + 1) == ("France", "Paris")
+            assert reader.lookup(500) == ("Unknown", "Unknown")
+            assert reader.lookup_record(50)["country_code"] == "DE"
+            assert search_geo(LookupCache(reader), 50) == ("Germany", "Berlin")
+            ids = reader.lookup_ids(np.array([50, 150, 500], dtype=np.int64))
+            assert ids.tolist()[:2] == [0, 1]
+    assert os.listdir(directory) == []
+
+
+def test_jump_table_and_overlays(cdb_path, tmp_path):
+    overlay = str(tmp_path / "overlay.cdb")
+    write_overlay(overlay, {(50, 59): ("Internal", "HQ"), (150, 199): None})
+    with SharedCdb(
+        cdb_path, "geo", str(tmp_path), jump_table=True, overlays=[overlay]
+    ) as table, SharedCdbReader("geo", str(tmp_path)) as reader:
+        assert reader.reader._jump is not None
+        assert reader.lookup(55) == ("Internal", "HQ")
+        assert reader.lookup(160) == ("Unknown", "Unknown")
+        assert reader.lookup(120) == ("France", "Paris")
+
+        time.sleep(0.01)
+        write_overlay(overlay, {(50, 59): None})
+        assert table.reload()
+        assert reader.lookup(55) == ("Unknown", "Unknown")
+        assert reader.lookup(160) == ("France", "Paris")
+
+
+def _worker(name: str, directory: str, queue):
+    with SharedCdbReader(name, directory) as reader:
+        queue.put((reader.generation, reader.lookup(150)))
+        while reader.generation == 0:
+            time.sleep(0.005)
+        queue.put((reader.generation, reader.lookup(150)))
+
+
+def test_reload_reaches_workers(cdb_path, tmp_path):
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    with SharedCdb(cdb_path, "geo", str(tmp_path)) as table:
+        workers = [
+            context.Process(target=_worker, args=("geo", str(tmp_path), queue))
+            for _ in range(2)
+        ]
+        for worker in workers:
+            worker.start()
+        assert [queue.get(timeout=10) for _ in workers] == [
+            (0, ("France", "Paris"))
+        ] * 2
+
+        replace(cdb_path, [(100, 199, 0)], MAPPING)
+        assert table.reload()
+        assert not table.reload()
+        assert table.generation == 1
+        assert [queue.get(timeout=10) for _ in workers] == [
+            (1, ("Germany", "Berlin"))
+        ] * 2
+        for worker in workers:
+            worker.join(10)
+            assert worker.exitcode == 0
+        assert not os.path.exists(str(tmp_path / "cdb-geo.0"))
+
+
+def test_failed_reload_keeps_version(cdb_path, tmp_path):
+    metrics = enable_metrics()
+    with SharedCdb(cdb_path, "geo", str(tmp_path), validate="full") as table:
+        reader = table.attach()
+        time.sleep(0.01)
+        with open(cdb_path, "r+b") as file:
+            file.seek(-8, os.SEEK_END)
+            file.write(b"\xff" * 8)
+
+        assert not table.reload()
+        assert not table.reload()
+        disable_metrics()
+        assert table.last_error is not None
+        assert metrics.counters["reload_errors_total"] == 1
+        assert table.generation == reader.generation == 0
+        assert not os.path.exists(str(tmp_path / "cdb-geo.1"))
+        assert reader.lookup(150) == ("France", "Paris")
+    # The attached version outlives the publisher.
+    assert reader.lookup(150) == ("France", "Paris")
+    reader.close()
+
+
+def test_attach_errors(cdb_path, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        SharedCdbReader("missing", str(tmp_path))
+    with pytest.raises(ValueError, match="Invalid shared table name"):
+        SharedCdb(cdb_path, "a/b", str(tmp_path))
+    with open(str(tmp_path / "cdb-other"), "wb") as file:
+        file.write(b"\0" * 16)
+    with pytest.raises(ValueError, match="Not a shared cdb table"):
+        SharedCdbReader("other", str(tmp_path))
+    with pytest.raises(FileNotFoundError):
+        SharedCdb(str(tmp_path / "missing.cdb"), "geo", str(tmp_path))
+    assert not os.path.exists(str(tmp_path / "cdb-geo"))
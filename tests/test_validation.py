@@ -0,0 +1,185 @@
+import pytest
+import struct
+import time
+from cdb import (
+    VALIDATE_FULL,
+    VALIDATE_HEADER,
+    VALIDATE_SAMPLED,
+    CdbDatabase,
+    CdbReader,
+    CdbWriter,
+    GeoRecords,
+    serialize,
+    validate_buffer,
+    validate_cdb,
+    write_cdb,
+    write_overlay,
+)
+from cdb.cli import describe_cdb
+
+NET6 = 0x20010DB8 << 96
+NETWORKS = [(i * 10, i * 10 + 5, i % 3) for i in range(3000)] + [
+    (NET6, NET6 + 255, 1),
+    (NET6 + 256, NET6 + 511, 2),
+]
+MAPPING = {0: ("Country1", "City1"), 1: ("Country2", "City2"), 2: ("Country3", "")}
+RECORDS = GeoRecords(["country_code"], {0: ("C1",), 1: ("C2",)})
+
+
+@pytest.fixture
+def cdb_path(tmp_path):
+    path = str(tmp_path / "data.cdb")
+    write_cdb(NETWORKS, MAPPING, path, jump_table=True, records=RECORDS)
+    return path
+
+
+def section(path: str, tag: str) -> tuple[int, int]:
+    for entry in describe_cdb(path)["sections"]:
+        if entry["tag"] == tag:
+            return entry["offset"], entry["size"]
+    raise KeyError(tag)
+
+
+def patch(path: str, offset: int, data: bytes):
+    with open(path, "r+b") as file:
+        file.seek(offset)
+        file.write(data)
+
+
+def drop_checksums(path: str):
+    # Renames the checksum section, as in files written before checksums.
+    with open(path, "rb") as file:
+        data = file.read()
+    patch(path, data.index(b"SUMS", 0, 32 + 20 * 20), b"XXXX")
+
+
+def test_validate_modes(cdb_path):
+    for mode in (VALIDATE_HEADER, VALIDATE_SAMPLED, VALIDATE_FULL):
+        report = validate_cdb(cdb_path, mode, samples=100)
+        assert report["mode"] == mode
+        assert report["ranges"] == len(NETWORKS)
+        assert report["geos"] == 3
+        assert report["checksums"]
+
+    assert validate_cdb(cdb_path, VALIDATE_HEADER)["checked_ranges"] == 0
+    assert validate_cdb(cdb_path, VALIDATE_SAMPLED, 100)["checked_ranges"] == 102
+    assert validate_cdb(cdb_path)["checked_ranges"] == len(NETWORKS)
+    assert "SUMS" in {entry["tag"] for entry in describe_cdb(cdb_path)["sections"]}
+
+    with pytest.raises(ValueError, match="Unknown validation mode"):
+        validate_cdb(cdb_path, "quick")
+
+
+def test_writer_and_serialize_checksums(tmp_path):
+    path = str(tmp_path / "data.cdb")
+    write_cdb(NETWORKS, MAPPING, path)
+    with open(path, "rb") as file:
+        assert file.read() == serialize(NETWORKS, MAPPING)
+    assert validate_buffer(serialize(NETWORKS, MAPPING))["checksums"]
+
+    with CdbWriter(path, jump_table=True) as writer:
+        writer.extend(NETWORKS)
+        writer.finish(MAPPING, RECORDS)
+    assert validate_cdb(path)["checksums"]
+
+
+def test_corrupted_range_section(cdb_path):
+    offset, size = section(cdb_path, "GID4")
+    patch(cdb_path, offset + size // 2, b"\x01")
+
+    assert validate_cdb(cdb_path, VALIDATE_HEADER)
+    with pytest.raises(ValueError, match="GID4 checksum mismatch"):
+        validate_cdb(cdb_path, VALIDATE_FULL)
+    with CdbReader(cdb_path) as reader:
+        assert len(reader) == len(NETWORKS)
+    with pytest.raises(ValueError):
+        CdbReader(cdb_path, validate=VALIDATE_FULL)
+
+
+def test_corrupted_geo_section(cdb_path):
+    offset, _ = section(cdb_path, "STRS")
+    patch(cdb_path, offset + 3, b"X")
+
+    assert validate_cdb(cdb_path, VALIDATE_HEADER)
+    with pytest.raises(ValueError, match="STRS checksum mismatch"):
+        validate_cdb(cdb_path, VALIDATE_SAMPLED)
+
+
+def test_corrupted_header(cdb_path):
+    patch(cdb_path, 10, struct.pack("<H", 0))
+    with pytest.raises(ValueError, match="Header checksum mismatch"):
+        validate_cdb(cdb_path, VALIDATE_HEADER)
+    with pytest.raises(ValueError, match="Header checksum mismatch"):
+        CdbReader(cdb_path)
+
+
+def test_content_checks_without_checksums(tmp_path):
+    path = str(tmp_path / "data.cdb")
+    cases = [
+        ("STA4", 4 * 1500, struct.pack("<I", 1), "IPv4 ranges are not sorted"),
+        ("END4", 0, struct.pack("<I", 0) * 2, "start is greater than its end"),
+        ("GID4", 4 * 2999, struct.pack("<I", 7), "unknown geo id"),
+        ("STA6", 8, struct.pack("<Q", 1 << 63), "IPv6 range start is greater"),
+        ("STA6", 0, bytes(16), "starts within the IPv4 space"),
+        ("GEOS", 8, struct.pack("<I", 1000), "shorter than its references"),
+        ("JMP4", 4, struct.pack("<I", 5), "JMP4 does not match ranges"),
+    ]
+    for tag, position, data, message in cases:
+        write_cdb(NETWORKS, MAPPING, path, jump_table=True)
+        drop_checksums(path)
+        assert not validate_cdb(path)["checksums"]
+
+        offset, _ = section(path, tag)
+        patch(path, offset + position, data)
+        assert validate_cdb(path, VALIDATE_HEADER)
+        with pytest.raises(ValueError, match=message):
+            validate_cdb(path, VALIDATE_FULL)
+
+
+def test_sampled_range_checks(tmp_path):
+    path = str(tmp_path / "data.cdb")
+    write_cdb(NETWORKS, MAPPING, path)
+    drop_checksums(path)
+    offset, _ = section(path, "GID4")
+    patch(path, offset, struct.pack("<I", 7))
+    patch(path, offset + 4 * 1501, struct.pack("<I", 7))
+
+    with pytest.raises(ValueError, match="unknown geo id"):
+        validate_cdb(path, VALIDATE_SAMPLED, samples=10)
+
+
+def test_validate_legacy(tmp_path):
+    path = str(tmp_path / "legacy.cdb")
+    write_cdb(NETWORKS[:10], MAPPING, path, version=1)
+    report = validate_cdb(path)
+    assert (report["version"], report["checksums"]) == (1, False)
+    assert report["checked_ranges"] == 10
+
+    patch(path, 4 + 24 * 3 + 16, struct.pack("<q", 9))
+    assert validate_cdb(path, VALIDATE_HEADER)
+    with pytest.raises(ValueError, match="unknown geo id"):
+        validate_cdb(path)
+
+    with open(path, "r+b") as file:
+        file.truncate(100)
+    with pytest.raises(ValueError, match="truncated"):
+        validate_cdb(path, VALIDATE_HEADER)
+
+
+def test_database_rejects_invalid_file(cdb_path):
+    with CdbDatabase(cdb_path, interval=None, validate=VALIDATE_FULL) as db:
+        time.sleep(0.01)
+        write_cdb(NETWORKS, MAPPING, cdb_path, jump_table=True)
+        offset, _ = section(cdb_path, "END4")
+        patch(cdb_path, offset, b"\xff")
+
+        assert not db.reload()
+        assert "END4 checksum mismatch" in str(db.last_error)
+        assert db.generation == 0
+        assert db.lookup(12) == ("Country2", "City2")
+
+
+def test_validate_overlay(tmp_path):
+    path = str(tmp_path / "overlay.cdb")
+    write_overlay(path, {(10, 19): None, (20, 29): ("Internal", "HQ")})
+    assert validate_cdb(path)["checked_ranges"] == 2